@@ -8,6 +8,7 @@ import httpx
 
 from app.db.session import get_db
 from app.models.user import User as UserModel
+from app.services.user_cache import invalidate_user
 from app.core.security import create_access_token
 from app.core.config import settings
 
@@ -113,6 +114,7 @@ async def google_callback(
         if name and not user.full_name:
             user.full_name = name
         await db.commit()
+        await invalidate_user(user.id)
         await db.refresh(user)
     else:
         # Create new user from Google data
@@ -2,7 +2,7 @@
 API v1 router
 """
 from fastapi import APIRouter
-from app.api.v1.endpoints import auth, users, websocket, wishlists, friendships, items
+from app.api.v1.endpoints import auth, users, websocket, wishlists, friendships, items, admin
 
 api_router = APIRouter()
 
@@ -12,4 +12,5 @@ api_router.include_router(wishlists.router, prefix="/wishlists", tags=["wishlist
 api_router.include_router(friendships.router, prefix="/friendships", tags=["friendships"])
 api_router.include_router(items.router, prefix="/items", tags=["items"])
 api_router.include_router(websocket.router, prefix="/ws", tags=["websocket"])
+api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
 
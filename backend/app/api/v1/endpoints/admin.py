@@ -0,0 +1,32 @@
+"""
+Admin endpoints (superusers only)
+"""
+from fastapi import APIRouter, Depends, status
+from typing import List
+
+from app.api.dependencies import get_current_superuser
+from app.db import slow_queries
+from app.models.user import User as UserModel
+
+router = APIRouter()
+
+
+@router.get("/slow-queries", response_model=List[dict])
+async def get_slow_queries(
+    current_user: UserModel = Depends(get_current_superuser),
+) -> List[dict]:
+    """
+    Slowest recorded SQL statements of this worker, with EXPLAIN plans
+    """
+    return slow_queries.worst_queries()
+
+
+@router.delete("/slow-queries", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_slow_queries(
+    current_user: UserModel = Depends(get_current_superuser),
+):
+    """
+    Clear the slow query log
+    """
+    slow_queries.reset()
+    return None
@@ -19,23 +19,45 @@ from app.schemas.user import (
     RegisterResponse, VerifyEmailRequest, ResendCodeRequest,
 )
 from app.models.user import User as UserModel
-from app.core.security import create_access_token, get_password_hash, verify_password
+from app.core.security import (
+    create_access_token, get_password_hash_async, verify_password_async,
+    password_needs_rehash, PasswordHasherBusy,
+)
 from app.core.config import settings
 from app.api.dependencies import get_current_user
-from app.services.email import send_verification_email
+from app.services.email import enqueue_verification_email
 from app.services.verification import generate_verification_code, verify_code, get_resend_attempts
+from app.services.user_cache import invalidate_user, load_uncached
+from app.services.rate_limit import (
+    rate_limit, check_login_rate, reset_login_rate, check_register_rate,
+)
 
 router = APIRouter()
 
+TOO_MANY_ATTEMPTS = HTTPException(
+    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+    detail="Слишком много попыток. Попробуйте позже.",
+)
+
+HASHER_BUSY = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Сервер перегружен, попробуйте ещё раз",
+    headers={"Retry-After": "1"},
+)
+
 
 @router.post("/register", response_model=RegisterResponse, status_code=status.HTTP_201_CREATED)
 async def register(
     user_in: UserCreate,
+    request: Request,
     db: AsyncSession = Depends(get_db),
 ) -> RegisterResponse:
     """
     Register new user. Sends verification code to email.
     """
+    if not await check_register_rate(request.client.host if request.client else "unknown"):
+        raise TOO_MANY_ATTEMPTS
+
     # Check if user exists
     result = await db.execute(
         select(UserModel).where(
@@ -49,7 +71,7 @@ async def register(
             # If user exists but not verified, resend code
             if not existing_user.email_verified:
                 code = await generate_verification_code(user_in.email)
-                await send_verification_email(user_in.email, code)
+                await enqueue_verification_email(user_in.email, code)
                 return RegisterResponse(
                     message="Код подтверждения повторно отправлен на вашу почту",
                     email=user_in.email,
@@ -64,11 +86,16 @@ async def register(
                 detail="Username already taken"
             )
 
+    try:
+        hashed_password = await get_password_hash_async(user_in.password)
+    except PasswordHasherBusy:
+        raise HASHER_BUSY
+
     # Create new user (unverified)
     user = UserModel(
         email=user_in.email,
         username=user_in.username,
-        hashed_password=get_password_hash(user_in.password),
+        hashed_password=hashed_password,
         full_name=user_in.full_name,
         email_verified=False,
         onboarding_completed=False,
@@ -80,7 +107,7 @@ async def register(
 
     # Generate and send verification code
     code = await generate_verification_code(user_in.email)
-    await send_verification_email(user_in.email, code)
+    await enqueue_verification_email(user_in.email, code)
 
     return RegisterResponse(
         message="Код подтверждения отправлен на вашу почту",
@@ -118,6 +145,7 @@ async def verify_email(
 
     user.email_verified = True
     await db.commit()
+    await invalidate_user(user.id)
     await db.refresh(user)
 
     # Create access token
@@ -161,7 +189,7 @@ async def resend_code(
 
     # Generate and send new code
     code = await generate_verification_code(data.email)
-    await send_verification_email(data.email, code)
+    await enqueue_verification_email(data.email, code)
 
     return RegisterResponse(
         message="Код подтверждения повторно отправлен",
@@ -181,12 +209,19 @@ async def forgot_password(email: str = Body(..., embed=True)):
 
 @router.post("/login", response_model=TokenWithUser)
 async def login(
+    request: Request,
     db: AsyncSession = Depends(get_db),
     form_data: OAuth2PasswordRequestForm = Depends()
 ) -> TokenWithUser:
     """
     OAuth2 compatible token login
     """
+    # Per IP + login, so a stranger can't lock someone else out
+    client_ip = request.client.host if request.client else "unknown"
+    rate_identifier = f"{client_ip}:{form_data.username.strip().lower()}"
+    if not await check_login_rate(rate_identifier):
+        raise TOO_MANY_ATTEMPTS
+
     # Find user by username or email
     result = await db.execute(
         select(UserModel).where(
@@ -209,7 +244,11 @@ async def login(
             detail="Этот аккаунт использует вход через Google"
         )
 
-    if not verify_password(form_data.password, user.hashed_password):
+    try:
+        password_ok = await verify_password_async(form_data.password, user.hashed_password)
+    except PasswordHasherBusy:
+        raise HASHER_BUSY
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный логин или пароль",
@@ -226,12 +265,24 @@ async def login(
     if not user.email_verified:
         # Resend code automatically
         code = await generate_verification_code(user.email)
-        await send_verification_email(user.email, code)
+        await enqueue_verification_email(user.email, code)
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Email не подтверждён. Код отправлен повторно.",
         )
 
+    # Work factor changed since this hash was made — upgrade it transparently
+    # (only for accounts that may log in)
+    if password_needs_rehash(user.hashed_password):
+        try:
+            user.hashed_password = await get_password_hash_async(form_data.password)
+            await db.commit()
+            await invalidate_user(user.id)
+        except PasswordHasherBusy:
+            pass  # try again on next login
+
+    await reset_login_rate(rate_identifier)
+
     # Create access token
     access_token = create_access_token(subject=user.id)
 
@@ -240,14 +291,15 @@ async def login(
 
 @router.get("/me", response_model=User)
 async def get_me(
+    db: AsyncSession = Depends(get_db),
     current_user: UserModel = Depends(get_current_user),
 ) -> User:
     """Get current authenticated user"""
-    return current_user
+    return await load_uncached(db, current_user)
 
 
 
-@router.post("/guest-session")
+@router.post("/guest-session", dependencies=[Depends(rate_limit("guest-session", 10, 3600))])
 async def create_guest_session(
     request: Request,
     body: dict = Body(...),
@@ -303,5 +355,6 @@ async def complete_onboarding(
 
     current_user.onboarding_completed = True
     await db.commit()
+    await invalidate_user(current_user.id)
     await db.refresh(current_user)
     return current_user
@@ -2,23 +2,29 @@
 Friendship endpoints
 """
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, or_, and_
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 import json
 
 from app.db.session import get_db
+from app.db.routing import get_read_db
 from app.api.dependencies import get_current_user
 from app.models.user import User as UserModel
 from app.models.friendship import Friendship as FriendshipModel, FriendshipStatusEnum
 from app.schemas.friendship import FriendshipCreate, FriendshipWithUser, FriendshipUpdate
 from app.schemas.user import UserPublic
-from app.api.v1.endpoints.websocket import manager
+from app.services.realtime import manager
+from app.services.friend_graph import invalidate_friends
+from app.utils.pagination import Keyset, MAX_PAGE_SIZE, fetch_limit, paginate
 
 router = APIRouter()
 
+# Индексы ix_friendships_user_requested / ix_friendships_friend_requested
+FRIENDSHIP_KEYSET = Keyset(FriendshipModel.requested_at.desc(), FriendshipModel.id.desc())
+
 
 def _normalize_friendship_ids(user_id: int, friend_id: int):
     """Ensure user_id < friend_id for database constraint"""
@@ -28,6 +34,16 @@ def _normalize_friendship_ids(user_id: int, friend_id: int):
         return friend_id, user_id, False  # current user is friend_id
 
 
+async def _load_users(db: AsyncSession, user_ids) -> dict:
+    """Load users by id in one query (avoids a query per friendship row)"""
+    if not user_ids:
+        return {}
+    result = await db.execute(
+        select(UserModel).where(UserModel.id.in_(set(user_ids)))
+    )
+    return {user.id: user for user in result.scalars().all()}
+
+
 @router.post("/", response_model=FriendshipWithUser, status_code=status.HTTP_201_CREATED)
 async def send_friend_request(
     friendship_data: FriendshipCreate,
@@ -77,6 +93,7 @@ async def send_friend_request(
             existing.status = FriendshipStatusEnum.ACCEPTED
             existing.accepted_at = datetime.now()
             await db.commit()
+            await invalidate_friends((existing.user_id, existing.friend_id))
             await db.refresh(existing)
             websocket_message = json.dumps({
                 "type": "friend_request",
@@ -132,7 +149,7 @@ async def send_friend_request(
 
 @router.get("/requests", response_model=List[FriendshipWithUser])
 async def get_friend_requests(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserModel = Depends(get_current_user),
 ):
     """Get incoming friend requests (where someone else requested friendship with current user)"""
@@ -150,13 +167,11 @@ async def get_friend_requests(
     )
     friendships = result.scalars().all()
     
-    # Fetch requester info for each request
+    # Fetch requester info for all requests at once
+    users = await _load_users(db, [f.requester_id for f in friendships])
     friend_requests = []
     for friendship in friendships:
-        result = await db.execute(
-            select(UserModel).where(UserModel.id == friendship.requester_id)
-        )
-        requester = result.scalar_one()
+        requester = users[friendship.requester_id]
         
         friend_requests.append(FriendshipWithUser(
             id=friendship.id,
@@ -171,10 +186,13 @@ async def get_friend_requests(
 
 @router.get("/", response_model=List[FriendshipWithUser])
 async def get_friends(
-    db: AsyncSession = Depends(get_db),
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserModel = Depends(get_current_user),
 ):
-    """Get all accepted friends"""
+    """Get accepted friends, newest first (paged with ?limit=&cursor=)"""
     result = await db.execute(
         select(FriendshipModel).where(
             and_(
@@ -183,21 +201,25 @@ async def get_friends(
                     FriendshipModel.friend_id == current_user.id
                 ),
                 FriendshipModel.status == FriendshipStatusEnum.ACCEPTED
-            )
+            ),
+            *FRIENDSHIP_KEYSET.after(cursor),
         )
+        .order_by(*FRIENDSHIP_KEYSET.order_by())
+        .limit(fetch_limit(limit))
+    )
+    friendships = paginate(
+        list(result.scalars().all()), limit, FRIENDSHIP_KEYSET, lambda f: (f.requested_at, f.id), response
     )
-    friendships = result.scalars().all()
     
-    # Fetch friend info for each friendship
+    # Fetch friend info for all friendships at once
+    def _other(friendship):
+        # Determine who is the friend
+        return friendship.friend_id if friendship.user_id == current_user.id else friendship.user_id
+
+    users = await _load_users(db, [_other(f) for f in friendships])
     friends_list = []
     for friendship in friendships:
-        # Determine who is the friend
-        friend_id = friendship.friend_id if friendship.user_id == current_user.id else friendship.user_id
-        
-        result = await db.execute(
-            select(UserModel).where(UserModel.id == friend_id)
-        )
-        friend = result.scalar_one()
+        friend = users[_other(friendship)]
         
         friends_list.append(FriendshipWithUser(
             id=friendship.id,
@@ -242,6 +264,7 @@ async def update_friendship(
         friendship.accepted_at = datetime.now()
     
     await db.commit()
+    await invalidate_friends((friendship.user_id, friendship.friend_id))
     await db.refresh(friendship)
     
     # Get friend info
@@ -260,9 +283,8 @@ async def update_friendship(
         "from_username": current_user.username,
         "friendship_id": friendship.id
     })
-    await manager.send_personal_message(websocket_message, str(friend_id))
     # Also notify current user (for other tabs/devices)
-    await manager.send_personal_message(websocket_message, str(current_user.id))
+    await manager.broadcast(websocket_message, [str(friend_id), str(current_user.id)])
     
     return FriendshipWithUser(
         id=friendship.id,
@@ -303,6 +325,7 @@ async def delete_friendship(
     
     await db.delete(friendship)
     await db.commit()
+    await invalidate_friends((current_user.id, other_user_id))
     
     # Send WebSocket notification to both users
     websocket_message = json.dumps({
@@ -311,8 +334,7 @@ async def delete_friendship(
         "from_user_id": current_user.id,
         "friendship_id": friendship_id
     })
-    await manager.send_personal_message(websocket_message, str(other_user_id))
-    await manager.send_personal_message(websocket_message, str(current_user.id))
+    await manager.broadcast(websocket_message, [str(other_user_id), str(current_user.id)])
     
     return None
 
@@ -320,7 +342,7 @@ async def delete_friendship(
 @router.get("/status/{user_id}")
 async def get_friendship_status(
     user_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserModel = Depends(get_current_user),
 ):
     """Get friendship status with specific user"""
@@ -351,7 +373,7 @@ async def get_friendship_status(
 
 @router.get("/stats/counts")
 async def get_friendship_counts(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserModel = Depends(get_current_user),
 ):
     """Get counts of friends and followers"""
@@ -393,7 +415,10 @@ async def get_friendship_counts(
 
 @router.get("/lists/followers", response_model=List[FriendshipWithUser])
 async def get_followers(
-    db: AsyncSession = Depends(get_db),
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserModel = Depends(get_current_user),
 ):
     """Get list of followers (users who sent pending friend requests to current user)"""
@@ -406,19 +431,21 @@ async def get_followers(
                 ),
                 FriendshipModel.requester_id != current_user.id,  # Request sent BY someone else
                 FriendshipModel.status == FriendshipStatusEnum.PENDING
-            )
+            ),
+            *FRIENDSHIP_KEYSET.after(cursor),
         )
+        .order_by(*FRIENDSHIP_KEYSET.order_by())
+        .limit(fetch_limit(limit))
+    )
+    friendships = paginate(
+        list(result.scalars().all()), limit, FRIENDSHIP_KEYSET, lambda f: (f.requested_at, f.id), response
     )
-    friendships = result.scalars().all()
     
-    # Fetch follower info for each request
+    # Fetch follower info (the requester) for all requests at once
+    users = await _load_users(db, [f.requester_id for f in friendships])
     followers_list = []
     for friendship in friendships:
-        # The follower is the requester
-        result = await db.execute(
-            select(UserModel).where(UserModel.id == friendship.requester_id)
-        )
-        follower = result.scalar_one()
+        follower = users[friendship.requester_id]
         
         followers_list.append(FriendshipWithUser(
             id=friendship.id,
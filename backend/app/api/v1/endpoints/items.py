@@ -7,10 +7,12 @@ from typing import List, Optional
 from decimal import Decimal
 from datetime import datetime, timedelta
 import json
+import logging
 import uuid
 import secrets
 from pathlib import Path
 from app.db.session import get_db
+from app.db.routing import get_read_db
 from app.models.user import User
 from app.models.item import Item as ItemModel
 from app.models.wishlist import Wishlist as WishlistModel
@@ -21,12 +23,24 @@ from app.schemas.item import Item, ItemCreate, ItemUpdate, ReserveRequest, Reser
 from app.schemas.parser import ParseProductRequest, ParsedProductData
 from app.api.dependencies import get_current_user, get_current_active_user, get_current_user_optional
 from app.services.parsers import parse_product_from_url, ProductParserError
-from app.api.v1.endpoints.websocket import manager
-
+from app.services.rate_limit import rate_limit
+from app.services.realtime import manager
+from app.services.realtime.metrics import sampled_debug
+from app.services.friend_graph import fan_out_recipients
+from app.services.wishlist_version import bump_version
+from app.services.wishlist_cache import invalidate_wishlist_cache
+from app.services.wishlist_views import item_view, items_view, view_response
+from app.utils.pagination import NEXT_CURSOR_HEADER, Keyset, MAX_PAGE_SIZE, fetch_limit, paginate
+
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
 UPLOAD_DIR = Path("uploads/items")
 
+# Курсоры списков; индексы: ix_items_wishlist_position, ix_items_reserved_by_created
+ITEM_KEYSET = Keyset(ItemModel.position_order, ItemModel.id.desc())
+RESERVATION_KEYSET = Keyset(ItemModel.created_at.desc(), ItemModel.id.desc())
+
 
 # ── Upload ─────────────────────────────────────────────────────────────────────
 
@@ -80,15 +94,26 @@ async def delete_items_batch(
     items = result.unique().scalars().all()
     
     deleted = []
+    wishlists = {}
     async with db.begin_nested():
         for item in items:
             # Verify ownership
             if not item.wishlist or item.wishlist.owner_id != current_user.id:
                 continue
+            wishlists.setdefault(item.wishlist.id, (item.wishlist, []))[1].append((item.id, item.title))
             await db.delete(item)
             deleted.append(item.id)
         
+    await bump_version(db, *wishlists)
     await db.commit()
+
+    for wishlist, removed in wishlists.values():
+        await invalidate_wishlist_cache(wishlist.owner_id, wishlist.share_token)
+        await _notify_wishlist_viewers(db, wishlist, current_user, "item_deleted", {
+            "item_ids": [item_id for item_id, _ in removed],
+        })
+        for item_id, title in removed:
+            await _notify_share_token_viewers(wishlist, "item_deleted", {"item_id": item_id, "title": title})
     return {"deleted": deleted, "count": len(deleted)}
 
 
@@ -110,8 +135,10 @@ async def create_item(
         **item_data.model_dump()
     )
     db.add(item)
+    await bump_version(db, wishlist.id)
     await db.commit()
     await db.refresh(item)
+    await invalidate_wishlist_cache(wishlist.owner_id, wishlist.share_token)
 
     await _notify_wishlist_viewers(db, wishlist, current_user, "item_created", {
         "item_id": item.id,
@@ -125,11 +152,14 @@ async def create_item(
 @router.get("", response_model=List[Item])
 @router.get("/", response_model=List[Item])
 async def get_items(
+    response: Response,
     wishlist_id: int = Query(..., description="ID вишлиста"),
-    db: AsyncSession = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user),
 ):
-    """Get all items in a wishlist"""
+    """Get items in a wishlist (all of them, or a page with ?limit=&cursor=)"""
     # Verify access to wishlist
     wishlist_result = await db.execute(
         select(WishlistModel).where(WishlistModel.id == wishlist_id)
@@ -157,18 +187,31 @@ async def get_items(
     
     result = await db.execute(
         select(ItemModel)
-        .where(ItemModel.wishlist_id == wishlist_id)
-        .order_by(ItemModel.position_order, ItemModel.created_at.desc())
+        .where(ItemModel.wishlist_id == wishlist_id, *ITEM_KEYSET.after(cursor))
+        .order_by(*ITEM_KEYSET.order_by())
+        .limit(fetch_limit(limit))
     )
-    return result.scalars().all()
+    items = paginate(list(result.scalars().all()), limit, ITEM_KEYSET, lambda i: (i.position_order, i.id), response)
+    # The owner gets the surprise-safe view, like everywhere else
+    page = view_response(items_view(items, owner_view=wishlist.owner_id == current_user.id))
+    if NEXT_CURSOR_HEADER in response.headers:
+        page.headers[NEXT_CURSOR_HEADER] = response.headers[NEXT_CURSOR_HEADER]
+    return page
 
 
 @router.get("/my-reservations", response_model=List[ReservedItemDetail])
 async def get_my_reservations(
-    db: AsyncSession = Depends(get_db),
+    http_response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user),
 ):
-    """Get all items the current user has reserved with full details"""
+    """Get items the current user has reserved with full details.
+
+    With ?limit= the list is paged by X-Next-Cursor. Partial contributions are
+    matched by name after the query, so a page may be shorter than limit.
+    """
     # МАКСИМАЛЬНО ПРОСТОЕ РЕШЕНИЕ: берём все items где reserved_by_id = current_user.id
     # ИЛИ где collected_amount > 0 (частичные резервы)
     
@@ -187,9 +230,15 @@ async def get_my_reservations(
                 )
             )
         )
-        .order_by(ItemModel.created_at.desc())
+        .where(*RESERVATION_KEYSET.after(cursor))
+        .order_by(*RESERVATION_KEYSET.order_by())
+        .limit(fetch_limit(limit))
+    )
+    # Курсор считается по просканированным строкам, а не по отфильтрованным
+    all_items = paginate(
+        list(result.scalars().all()), limit, RESERVATION_KEYSET,
+        lambda i: (i.created_at, i.id), http_response,
     )
-    all_items = result.scalars().all()
     
     # Фильтруем: оставляем только те где пользователь действительно вложился
     items = []
@@ -279,7 +328,7 @@ async def get_my_reservations(
 @router.get("/my-reservations-guest", response_model=List[ReservedItemDetail])
 async def get_my_reservations_guest(
     request: Request,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """Get reservations for guest session (X-Guest-Session-Token header)"""
     session_token = request.headers.get("X-Guest-Session-Token")
@@ -400,8 +449,10 @@ async def copy_item_to_wishlist(
     )
 
     db.add(new_item)
+    await bump_version(db, target_wishlist.id)
     await db.commit()
     await db.refresh(new_item)
+    await invalidate_wishlist_cache(target_wishlist.owner_id, target_wishlist.share_token)
 
     await _notify_wishlist_viewers(db, target_wishlist, current_user, "item_created", {
         "item_id": new_item.id,
@@ -414,7 +465,11 @@ async def copy_item_to_wishlist(
 
 # ── Reserve / Unreserve (supports anonymous users) ─────────────────────────────
 
-@router.post("/{item_id}/reserve", response_model=Item)
+@router.post(
+    "/{item_id}/reserve",
+    response_model=Item,
+    dependencies=[Depends(rate_limit("reserve", 30, 60))],
+)
 async def reserve_item(
     item_id: int,
     request: Request,
@@ -593,8 +648,10 @@ async def reserve_item(
             )
             db.add(reservation)
 
+    await bump_version(db, wishlist.id)
     await db.commit()
     await db.refresh(item)
+    await invalidate_wishlist_cache(wishlist.owner_id, wishlist.share_token)
 
     extra = {"item_id": item.id, "title": item.title}
     await _notify_share_token_viewers(wishlist, "item_reserved", extra)
@@ -723,8 +780,10 @@ async def unreserve_item(
             reservation.status = ReservationStatusEnum.CANCELLED
             reservation.cancelled_at = func.now()
 
+    await bump_version(db, wishlist.id)
     await db.commit()
     await db.refresh(item)
+    await invalidate_wishlist_cache(wishlist.owner_id, wishlist.share_token)
 
     extra = {"item_id": item.id, "title": item.title}
     await _notify_share_token_viewers(wishlist, "item_unreserved", extra)
@@ -737,7 +796,7 @@ async def unreserve_item(
 @router.get("/{item_id}", response_model=Item)
 async def get_item(
     item_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """Get a specific item. Requires access to the wishlist (owner or friend)."""
@@ -766,13 +825,7 @@ async def get_item(
         )
         if not friendship_result.scalar_one_or_none():
             raise HTTPException(status_code=403, detail="Access denied")
-    response_item = Item.model_validate(item)
-    if wishlist.owner_id == current_user.id:
-        response_item.is_reserved = False
-        response_item.reserved_by_name = None
-        response_item.collected_amount = 0
-        response_item.contributors = []
-    return response_item
+    return view_response(item_view(item, owner_view=wishlist.owner_id == current_user.id))
 
 
 @router.patch("/{item_id}", response_model=Item)
@@ -796,8 +849,10 @@ async def update_item(
     for field, value in update_data.items():
         setattr(item, field, value)
 
+    await bump_version(db, wishlist.id)
     await db.commit()
     await db.refresh(item)
+    await invalidate_wishlist_cache(wishlist.owner_id, wishlist.share_token)
 
     await _notify_wishlist_viewers(db, wishlist, current_user, "item_updated", {
         "item_id": item.id,
@@ -827,7 +882,9 @@ async def delete_item(
     item_title = item.title
     item_item_id = item.id
     await db.delete(item)
+    await bump_version(db, wishlist.id)
     await db.commit()
+    await invalidate_wishlist_cache(wishlist.owner_id, wishlist.share_token)
 
     await _notify_wishlist_viewers(db, wishlist, current_user, "item_deleted", {
         "item_id": item_item_id,
@@ -852,17 +909,19 @@ async def _get_owned_wishlist(db: AsyncSession, wishlist_id: int, user_id: int)
 
 
 async def _notify_share_token_viewers(wishlist: WishlistModel, action: str, extra: dict = None):
-    """Send WS notification to anonymous viewers connected via share_token"""
+    """Send WS notification to anonymous viewers connected via share_token.
+
+    Events are coalesced per channel, so bursts of changes reach viewers as
+    one batched frame.
+    """
     if not wishlist.share_token:
         return
-    channel = f"share_{wishlist.share_token}"
-    message = json.dumps({
+    manager.publish_event(f"share_{wishlist.share_token}", {
         "type": "wishlist_item",
         "action": action,
         "wishlist_id": wishlist.id,
         **(extra or {}),
     })
-    await manager.send_personal_message(message, channel)
 
 
 async def _notify_wishlist_viewers(
@@ -873,21 +932,7 @@ async def _notify_wishlist_viewers(
     extra: dict = None,
 ):
     """Send WebSocket notification to friends (excluding owner for reservation actions)"""
-    import logging
-    logging.getLogger(__name__).info("WS notify: action=%s wishlist_id=%s owner=%s", action, wishlist.id, wishlist.owner_id)
-    result = await db.execute(
-        select(FriendshipModel).where(
-            and_(
-                or_(
-                    FriendshipModel.user_id == wishlist.owner_id,
-                    FriendshipModel.friend_id == wishlist.owner_id,
-                ),
-                FriendshipModel.status == FriendshipStatusEnum.ACCEPTED,
-            )
-        )
-    )
-    friendships = result.scalars().all()
-
+    sampled_debug(logger, "WS notify: action=%s wishlist_id=%s owner=%s", action, wishlist.id, wishlist.owner_id)
     message_data = {
         "type": "wishlist_item",
         "action": action,
@@ -899,23 +944,19 @@ async def _notify_wishlist_viewers(
     }
     message = json.dumps(message_data)
 
-    notified = set()
-    for friendship in friendships:
-        friend_id = friendship.friend_id if friendship.user_id == wishlist.owner_id else friendship.user_id
-        if friend_id not in notified:
-            await manager.send_personal_message(message, str(friend_id))
-            notified.add(friend_id)
-
-    if wishlist.owner_id not in notified:
-        await manager.send_personal_message(message, str(wishlist.owner_id))
-
-    if current_user.id not in notified and current_user.id != wishlist.owner_id:
-        await manager.send_personal_message(message, str(current_user.id))
+    # Friend sets are cached: no database query for the fan-out
+    recipients = await fan_out_recipients(db, wishlist.owner_id, current_user.id)
+    await manager.broadcast(message, recipients)
 
 
 # ── Parser ─────────────────────────────────────────────────────────────────────
 
-@router.post("/parse-url", response_model=ParsedProductData)
+@router.post(
+    "/parse-url",
+    response_model=ParsedProductData,
+    # Parsing can start a headless browser: small bursts, slow refill
+    dependencies=[Depends(rate_limit("parse-url", 20, 60, algorithm="bucket", burst=5))],
+)
 async def parse_product_url(
     request: ParseProductRequest,
     current_user: User = Depends(get_current_active_user),
@@ -3,9 +3,9 @@ Users endpoints
 """
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException, status, Form, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, status, Form, File, UploadFile, Query, Response
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 from sqlalchemy import select, and_, or_
 from typing import List, Optional
 from pathlib import Path
@@ -13,25 +13,36 @@ import shutil
 import uuid
 
 from app.db.session import get_db
+from app.db.routing import get_read_db, primary_session
 from app.schemas.user import User, UserCreate, UserUpdate
 from app.schemas.wishlist import WishlistSummary
+from app.services.wishlist_summary import WISHLIST_KEYSET, get_wishlist_summaries
+from app.utils.pagination import MAX_PAGE_SIZE, fetch_limit, paginate
 from app.models.user import User as UserModel
 from app.models.wishlist import Wishlist as WishlistModel, VisibilityEnum
 from app.models.friendship import Friendship as FriendshipModel, FriendshipStatusEnum
 from app.api.dependencies import get_current_active_user, get_current_user_optional
+from app.services.user_cache import invalidate_user, load_uncached
+from app.services.wishlist_cache import (
+    Rendered, get_or_render, invalidate_wishlist_cache, lists_keys, wishlist_cache_enabled,
+)
+from app.services.rate_limit import rate_limit
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+_SUMMARIES = TypeAdapter(List[WishlistSummary])
+
 
 @router.get("/me", response_model=User)
 async def read_current_user(
+    db: AsyncSession = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user),
 ) -> User:
     """
     Get current user
     """
-    return current_user
+    return await load_uncached(db, current_user)
 
 
 @router.patch("/me", response_model=User)
@@ -95,6 +106,7 @@ async def update_current_user(
         logger.info("[PATCH /users/me] avatar updated: %r -> %r | file_size=%d bytes", old_avatar, current_user.avatar_url, len(contents))
 
     await db.commit()
+    await invalidate_user(current_user.id)
     result = await db.execute(select(UserModel).where(UserModel.id == current_user.id))
     updated_user = result.scalar_one()
     logger.info("[PATCH /users/me] OK user_id=%d full_name=%r avatar_url=%r", updated_user.id, updated_user.full_name, updated_user.avatar_url)
@@ -117,6 +129,7 @@ async def update_current_user_json(
         logger.info("[PATCH /users/me/json] full_name updated: %r -> %r", old_name, user_update.full_name)
 
     await db.commit()
+    await invalidate_user(current_user.id)
     result = await db.execute(select(UserModel).where(UserModel.id == current_user.id))
     updated_user = result.scalar_one()
     logger.info("[PATCH /users/me/json] OK user_id=%d full_name=%r", updated_user.id, updated_user.full_name)
@@ -131,15 +144,25 @@ async def delete_current_user(
     """
     Delete current user account
     """
+    result = await db.execute(
+        select(WishlistModel.share_token).where(WishlistModel.owner_id == current_user.id)
+    )
+    share_tokens = result.scalars().all()
     await db.delete(current_user)
     await db.commit()
+    await invalidate_user(current_user.id)
+    await invalidate_wishlist_cache(current_user.id, *share_tokens)
     return None
 
 
-@router.get("/search", response_model=List[User])
+@router.get(
+    "/search",
+    response_model=List[User],
+    dependencies=[Depends(rate_limit("search", 60, 60, algorithm="bucket", burst=20))],
+)
 async def search_users(
     query: str,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     limit: int = 10,
 ) -> List[User]:
     """
@@ -161,7 +184,7 @@ async def search_users(
 @router.get("/{username}", response_model=User)
 async def get_user_by_username(
     username: str,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ) -> User:
     """
     Get user by username
@@ -183,13 +206,17 @@ async def get_user_by_username(
 @router.get("/{username}/wishlists", response_model=List[WishlistSummary])
 async def get_user_wishlists(
     username: str,
-    db: AsyncSession = Depends(get_db),
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
     current_user: Optional[UserModel] = Depends(get_current_user_optional),
 ) -> List[WishlistSummary]:
     """
     Get wishlists for a user by username.
     Shows by_link wishlists for everyone.
     Shows friends_only wishlists if requester is a friend.
+    With ?limit= the list is paged: X-Next-Cursor -> ?cursor=
     """
     # Get user
     result = await db.execute(
@@ -204,22 +231,13 @@ async def get_user_wishlists(
         )
     # If user is viewing their own profile, show all wishlists
     if current_user and current_user.id == user.id:
-        result = await db.execute(
-            select(WishlistModel)
-            .options(selectinload(WishlistModel.items))
-            .where(
-                WishlistModel.owner_id == user.id,
-                WishlistModel.is_archived == False
-            )
-            .order_by(WishlistModel.created_at.desc())
+        summaries = await get_wishlist_summaries(
+            db,
+            WishlistModel.owner_id == user.id,
+            WishlistModel.is_archived == False,
+            owner_view=True, limit=fetch_limit(limit), cursor=cursor,
         )
-        wishlists = result.scalars().all()
-        summaries = []
-        for wl in wishlists:
-            s = WishlistSummary.model_validate(wl)
-            s.items_count = len(wl.items) if wl.items else 0
-            summaries.append(s)
-        return summaries
+        return paginate(summaries, limit, WISHLIST_KEYSET, lambda s: (s.created_at, s.id), response)
 
     # Check if current user is friends with this user
     is_friend = False
@@ -247,23 +265,28 @@ async def get_user_wishlists(
     if is_friend:
         visibility_conditions.append(WishlistModel.visibility == VisibilityEnum.FRIENDS_ONLY)
 
-    result = await db.execute(
-        select(WishlistModel)
-        .options(selectinload(WishlistModel.items))
-        .where(
-            WishlistModel.owner_id == user.id,
-            WishlistModel.is_archived == False,
-            or_(*visibility_conditions),
-        )
-        .order_by(WishlistModel.created_at.desc())
+    where = (
+        WishlistModel.owner_id == user.id,
+        WishlistModel.is_archived == False,
+        or_(*visibility_conditions),
+    )
+
+    # Whole lists are the same for every friend / every guest: serve them rendered
+    if limit is None and not cursor and wishlist_cache_enabled():
+        async def render() -> Rendered:
+            # From the primary: a lagging replica's lists would be cached as current
+            async with primary_session() as primary:
+                summaries = await get_wishlist_summaries(primary, *where, owner_view=False)
+            return Rendered(user.id, _SUMMARIES.dump_json(summaries).decode())
+
+        view = "friend" if is_friend else "guest"
+        rendered = await get_or_render(lists_keys(user.id, view), render)
+        return rendered.response()
+
+    summaries = await get_wishlist_summaries(
+        db, *where, owner_view=False, limit=fetch_limit(limit), cursor=cursor,
     )
-    wishlists = result.scalars().all()
-    summaries = []
-    for wl in wishlists:
-        s = WishlistSummary.model_validate(wl)
-        s.items_count = len(wl.items) if wl.items else 0
-        summaries.append(s)
-    return summaries
+    return paginate(summaries, limit, WISHLIST_KEYSET, lambda s: (s.created_at, s.id), response)
 
 
 @router.get("/", response_model=List[User])
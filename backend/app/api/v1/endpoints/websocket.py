@@ -3,71 +3,107 @@ WebSocket endpoints - supports both user IDs and share_token channels
 """
 import logging
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, status
-from typing import Dict, List, Optional
-from jose import JWTError, jwt
+from typing import Optional
 from app.core.config import settings
+from app.core.security import decode_access_token
+from app.services.realtime import manager
+from app.services.realtime.encoding import negotiate
 import json
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-class ConnectionManager:
-    """WebSocket connection manager with dead connection cleanup"""
+def _can_subscribe(channel: str, user_id: Optional[str]) -> bool:
+    """Share channels are open to anyone, a user channel only to its owner"""
+    if channel.startswith("share_"):
+        return len(channel) > len("share_")
+    return channel.isdigit() and user_id is not None and channel == str(user_id)
 
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
 
-    async def connect(self, websocket: WebSocket, client_id: str):
-        await websocket.accept()
-        if client_id not in self.active_connections:
-            self.active_connections[client_id] = []
-        self.active_connections[client_id].append(websocket)
-
-    def disconnect(self, websocket: WebSocket, client_id: str):
-        if client_id in self.active_connections:
-            try:
-                self.active_connections[client_id].remove(websocket)
-            except ValueError:
-                pass
-            if not self.active_connections[client_id]:
-                del self.active_connections[client_id]
+@router.websocket("/mux")
+async def websocket_mux_endpoint(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None),
+    since: Optional[int] = Query(None, ge=0),
+):
+    """
+    One WebSocket for many channels (authenticated users only).
+    - ?token=xxx is required; the user's own channel is subscribed right
+      away (?since= applies to it)
+    - {"type": "subscribe", "channel": "share_<token>", "since": N} and
+      {"type": "unsubscribe", "channel": ...} manage the other channels;
+      the server answers with "subscribed"/"unsubscribed" or "error"
+    - Channel frames arrive as {"channel": ..., "data": <frame>}; control
+      frames (ping, pong, subscribed, error) are sent unwrapped
+    - Supports the "msgpack" subprotocol like /ws/{client_id}
+    """
+    claims = decode_access_token(token) if token else None
+    if claims is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Authentication required")
+        return
+    user_id = str(claims.subject)
 
-    async def send_personal_message(self, message: str, client_id: str):
-        """Send message to specific client, cleaning up dead connections"""
-        if client_id not in self.active_connections:
-            logger.info("WS: no connection for client_id=%s (active: %s)", client_id, list(self.active_connections.keys()))
-            return
-        dead = []
-        for conn in self.active_connections[client_id]:
-            try:
-                await conn.send_text(message)
-                logger.info("WS: sent to client_id=%s", client_id)
-            except Exception:
-                dead.append(conn)
-        for conn in dead:
+    connection = await manager.accept(
+        websocket, f"mux:{user_id}", mux=True, user_id=user_id,
+        subprotocol=negotiate(websocket.scope.get("subprotocols", [])),
+    )
+    try:
+        await manager.subscribe(connection, user_id, since=since)
+        while True:
+            data = await websocket.receive_text()
+            connection.touch()
             try:
-                self.active_connections[client_id].remove(conn)
-            except ValueError:
-                pass
-        if client_id in self.active_connections and not self.active_connections[client_id]:
-            del self.active_connections[client_id]
-
-
-manager = ConnectionManager()
+                parsed = json.loads(data)
+                kind = parsed.get("type")
+            except (json.JSONDecodeError, AttributeError):
+                continue
+            if kind == "ping":
+                connection.enqueue(json.dumps({"type": "pong"}))
+                continue
+            if kind not in ("subscribe", "unsubscribe"):
+                continue
+            channel = parsed.get("channel")
+            if not isinstance(channel, str) or not _can_subscribe(channel, user_id):
+                connection.enqueue(json.dumps({"type": "error", "channel": channel, "detail": "Unauthorized"}))
+                continue
+            if kind == "unsubscribe":
+                await manager.unsubscribe(connection, channel)
+                connection.enqueue(json.dumps({"type": "unsubscribed", "channel": channel}))
+                continue
+            if channel not in connection.channels and len(connection.channels) >= settings.WS_MUX_MAX_CHANNELS:
+                connection.enqueue(json.dumps({"type": "error", "channel": channel, "detail": "Too many channels"}))
+                continue
+            channel_since = parsed.get("since")
+            if not isinstance(channel_since, int) or isinstance(channel_since, bool) or channel_since < 0:
+                channel_since = None
+            # Acknowledge first so the reply precedes any replayed frames
+            connection.enqueue(json.dumps({"type": "subscribed", "channel": channel}))
+            await manager.subscribe(connection, channel, since=channel_since)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await manager.remove(connection)
 
 
 @router.websocket("/{client_id}")
 async def websocket_endpoint(
     websocket: WebSocket,
     client_id: str,
-    token: Optional[str] = Query(None)
+    token: Optional[str] = Query(None),
+    since: Optional[int] = Query(None, ge=0),
 ):
     """
     WebSocket endpoint with JWT authentication.
     - For user_id channels (numeric client_id): JWT token required
     - For share_token channels (client_id starting with 'share_'): token optional
     - Token passed as query parameter: ?token=xxx
+    - Frames carry a per-channel "seq"; reconnect with ?since=<last seq> to
+      get missed frames, or a {"type": "resync"} frame if they're gone
+    - The server sends {"type": "ping"} to quiet sockets; any frame from the
+      client (e.g. {"type": "pong"}) keeps the connection open
+    - Offering the "msgpack" subprotocol switches server frames to binary
+      msgpack (client frames stay JSON text)
     """
     # Check if this is a user channel (numeric ID) or share token channel
     is_user_channel = client_id.isdigit()
@@ -75,12 +111,11 @@ async def websocket_endpoint(
     # Verify JWT token if provided or required
     authenticated_user_id = None
     if token:
-        try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-            authenticated_user_id = payload.get("sub")
-        except JWTError:
+        claims = decode_access_token(token)
+        if claims is None:
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid token")
             return
+        authenticated_user_id = claims.subject
     
     # For user channels, require authentication and verify user owns the channel
     if is_user_channel:
@@ -91,17 +126,25 @@ async def websocket_endpoint(
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Unauthorized")
             return
     
-    await manager.connect(websocket, client_id)
+    user_id = str(authenticated_user_id) if authenticated_user_id else None
+    connection = await manager.connect(
+        websocket, client_id, since=since, user_id=user_id,
+        subprotocol=negotiate(websocket.scope.get("subprotocols", [])),
+    )
     try:
         while True:
             data = await websocket.receive_text()
+            connection.touch()
             # Echo/ping support
             try:
                 parsed = json.loads(data)
                 if parsed.get("type") == "ping":
-                    await websocket.send_text(json.dumps({"type": "pong"}))
+                    # Through the queue: only the writer task may send
+                    connection.enqueue(json.dumps({"type": "pong"}))
                     continue
             except (json.JSONDecodeError, AttributeError):
                 pass
     except WebSocketDisconnect:
-        manager.disconnect(websocket, client_id)
+        pass
+    finally:
+        await manager.disconnect(websocket, client_id)
@@ -1,9 +1,9 @@
 """
 Wishlist endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Form, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, status, Form, File, UploadFile, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, or_
+from sqlalchemy import select, func, and_
 from sqlalchemy.orm import selectinload
 from typing import List, Optional
 from datetime import date
@@ -14,12 +14,21 @@ import uuid
 import json
 
 from app.db.session import get_db
+from app.db.routing import get_read_db, primary_session
 from app.schemas.wishlist import WishlistCreate, Wishlist, WishlistUpdate, WishlistSummary
+from app.services.wishlist_summary import WISHLIST_KEYSET, get_wishlist_summaries
+from app.utils.pagination import MAX_PAGE_SIZE, fetch_limit, paginate
 from app.models.wishlist import Wishlist as WishlistModel, WishlistTypeEnum, VisibilityEnum
 from app.models.user import User as UserModel
 from app.models.friendship import Friendship as FriendshipModel, FriendshipStatusEnum
 from app.api.dependencies import get_current_active_user, get_current_user_optional
-from app.api.v1.endpoints.websocket import manager
+from app.services.realtime import manager
+from app.services.friend_graph import fan_out_recipients
+from app.services.wishlist_version import bump_version, etag_matches, make_etag, set_etag
+from app.services.wishlist_views import render, view_response, wishlist_view
+from app.services.wishlist_cache import (
+    Rendered, get_or_render, invalidate_wishlist_cache, share_keys, wishlist_cache_enabled,
+)
 
 router = APIRouter()
 
@@ -105,6 +114,7 @@ async def create_wishlist(
     db.add(wishlist)
     await db.commit()
     await db.refresh(wishlist)
+    await invalidate_wishlist_cache(wishlist.owner_id)
     
     # Build WS message
     websocket_message = json.dumps({
@@ -117,25 +127,9 @@ async def create_wishlist(
         "visibility": wishlist.visibility.value
     })
 
-    # Notify the owner (for other tabs/devices)
-    await manager.send_personal_message(websocket_message, str(current_user.id))
-
-    # Notify friends if visibility allows
-    result = await db.execute(
-        select(FriendshipModel).where(
-            and_(
-                or_(
-                    FriendshipModel.user_id == current_user.id,
-                    FriendshipModel.friend_id == current_user.id
-                ),
-                FriendshipModel.status == FriendshipStatusEnum.ACCEPTED
-            )
-        )
-    )
-    friendships = result.scalars().all()
-    for friendship in friendships:
-        friend_id = friendship.friend_id if friendship.user_id == current_user.id else friendship.user_id
-        await manager.send_personal_message(websocket_message, str(friend_id))
+    # Notify the owner (for other tabs/devices) and friends
+    recipients = await fan_out_recipients(db, current_user.id)
+    await manager.broadcast(websocket_message, recipients)
 
     s = WishlistSummary.model_validate(wishlist)
     s.items_count = 0
@@ -144,43 +138,31 @@ async def create_wishlist(
 
 @router.get("/", response_model=List[WishlistSummary])
 async def get_my_wishlists(
-    skip: int = 0,
-    limit: int = 100,
+    response: Response,
+    skip: int = Query(0, ge=0, description="Deprecated: use cursor"),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     include_archived: bool = False,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserModel = Depends(get_current_active_user),
 ) -> List[WishlistSummary]:
     """
-    Get current user's wishlists
+    Get current user's wishlists (next page: X-Next-Cursor -> ?cursor=)
     """
-    query = (
-        select(WishlistModel)
-        .options(selectinload(WishlistModel.items))
-        .where(WishlistModel.owner_id == current_user.id)
-    )
-    
+    where = [WishlistModel.owner_id == current_user.id]
     if not include_archived:
-        query = query.where(WishlistModel.is_archived == False)
-    
-    query = query.offset(skip).limit(limit).order_by(WishlistModel.created_at.desc())
-    
-    result = await db.execute(query)
-    wishlists = result.scalars().all()
-    
-    # Build summaries with items_count
-    summaries = []
-    for wl in wishlists:
-        s = WishlistSummary.model_validate(wl)
-        s.items_count = len(wl.items) if wl.items else 0
-        summaries.append(s)
-    
-    return summaries
+        where.append(WishlistModel.is_archived == False)
+    summaries = await get_wishlist_summaries(
+        db, *where, owner_view=True,
+        offset=None if cursor else skip, limit=fetch_limit(limit), cursor=cursor,
+    )
+    return paginate(summaries, limit, WISHLIST_KEYSET, lambda s: (s.created_at, s.id), response)
 
 
 @router.get("/{wishlist_id}", response_model=Wishlist)
 async def get_wishlist(
     wishlist_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserModel = Depends(get_current_active_user),
 ):
     """
@@ -223,26 +205,10 @@ async def get_wishlist(
                 detail="Not enough permissions"
             )
     
-    response = Wishlist.model_validate(wishlist)
-    if wishlist.owner_id == current_user.id and response.items:
-        for item in response.items:
-            item.is_reserved = False
-            item.reserved_by_name = None
-            item.collected_amount = 0
-            item.contributors = []
-    
-    return response
+    return view_response(wishlist_view(wishlist, owner_view=wishlist.owner_id == current_user.id))
 
 
-@router.get("/share/{share_token}", response_model=Wishlist)
-async def get_wishlist_by_token(
-    share_token: str,
-    db: AsyncSession = Depends(get_db),
-    current_user: Optional[UserModel] = Depends(get_current_user_optional),
-) -> Wishlist:
-    """
-    Get wishlist by share token. If requester is owner — hides who reserved/contributed.
-    """
+async def _load_shared_wishlist(db: AsyncSession, share_token: str) -> WishlistModel:
     result = await db.execute(
         select(WishlistModel)
         .options(selectinload(WishlistModel.items))
@@ -261,15 +227,68 @@ async def get_wishlist_by_token(
             status_code=status.HTTP_410_GONE,
             detail="This wishlist is archived"
         )
-    
-    response = Wishlist.model_validate(wishlist)
-    if current_user and wishlist.owner_id == current_user.id:
-        for item in (response.items or []):
-            item.is_reserved = False
-            item.reserved_by_name = None
-            item.collected_amount = 0
-            item.contributors = []
-    return response
+    return wishlist
+
+
+async def _render_shared_wishlist(share_token: str) -> Rendered:
+    """Guest view of a shared wishlist as JSON (what the cache stores).
+
+    Read from the primary: a replica may not have the change whose
+    invalidation this render follows, and would be cached as current.
+    """
+    async with primary_session() as db:
+        wishlist = await _load_shared_wishlist(db, share_token)
+        return Rendered(
+            owner_id=wishlist.owner_id,
+            body=render(wishlist_view(wishlist, owner_view=False)),
+            etag=make_etag(wishlist.id, wishlist.version, owner_view=False),
+        )
+
+
+@router.get("/share/{share_token}", response_model=Wishlist)
+async def get_wishlist_by_token(
+    share_token: str,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Optional[UserModel] = Depends(get_current_user_optional),
+) -> Wishlist:
+    """
+    Get wishlist by share token. If requester is owner — hides who reserved/contributed.
+    Supports If-None-Match: an unchanged wishlist is a 304 without loading items.
+    Guests are served from the rendered-response cache.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    cache = wishlist_cache_enabled()
+    head = None
+    owner_view = False
+    # With the cache on, a signed-in user may be the owner: find out cheaply
+    # before touching the guest cache. Without it, only a 304 needs the head.
+    if (current_user is not None) if cache else if_none_match:
+        head = (await db.execute(
+            select(WishlistModel.id, WishlistModel.owner_id, WishlistModel.version, WishlistModel.is_archived)
+            .where(WishlistModel.share_token == share_token)
+        )).one_or_none()
+        owner_view = bool(current_user and head and head.owner_id == current_user.id)
+
+    if cache and not owner_view:
+        rendered = await get_or_render(
+            share_keys(share_token), lambda: _render_shared_wishlist(share_token)
+        )
+        return rendered.response(if_none_match)
+
+    if if_none_match and head and not head.is_archived:
+        etag = make_etag(head.id, head.version, owner_view)
+        if etag_matches(if_none_match, etag):
+            not_modified = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+            set_etag(not_modified, etag)
+            return not_modified
+
+    wishlist = await _load_shared_wishlist(db, share_token)
+    owner_view = bool(current_user and wishlist.owner_id == current_user.id)
+    full = view_response(wishlist_view(wishlist, owner_view))
+    set_etag(full, make_etag(wishlist.id, wishlist.version, owner_view))
+    return full
 
 
 @router.delete("/{wishlist_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -302,6 +321,7 @@ async def delete_wishlist(
     wishlist_title = wishlist.title
     await db.delete(wishlist)
     await db.commit()
+    await invalidate_wishlist_cache(current_user.id, wishlist.share_token)
 
     # Notify owner + friends
     ws_msg = json.dumps({
@@ -311,21 +331,8 @@ async def delete_wishlist(
         "owner_id": current_user.id,
         "title": wishlist_title,
     })
-    await manager.send_personal_message(ws_msg, str(current_user.id))
-    result = await db.execute(
-        select(FriendshipModel).where(
-            and_(
-                or_(
-                    FriendshipModel.user_id == current_user.id,
-                    FriendshipModel.friend_id == current_user.id
-                ),
-                FriendshipModel.status == FriendshipStatusEnum.ACCEPTED
-            )
-        )
-    )
-    for f in result.scalars().all():
-        fid = f.friend_id if f.user_id == current_user.id else f.user_id
-        await manager.send_personal_message(ws_msg, str(fid))
+    recipients = await fan_out_recipients(db, current_user.id)
+    await manager.broadcast(ws_msg, recipients)
 
     return None
 
@@ -362,8 +369,10 @@ async def update_wishlist(
     for field, value in update_data.items():
         setattr(wishlist, field, value)
     
+    await bump_version(db, wishlist.id)
     await db.commit()
     await db.refresh(wishlist)
+    await invalidate_wishlist_cache(wishlist.owner_id, wishlist.share_token)
 
     # Notify owner + friends
     ws_msg = json.dumps({
@@ -373,21 +382,8 @@ async def update_wishlist(
         "owner_id": current_user.id,
         "title": wishlist.title,
     })
-    await manager.send_personal_message(ws_msg, str(current_user.id))
-    result = await db.execute(
-        select(FriendshipModel).where(
-            and_(
-                or_(
-                    FriendshipModel.user_id == current_user.id,
-                    FriendshipModel.friend_id == current_user.id
-                ),
-                FriendshipModel.status == FriendshipStatusEnum.ACCEPTED
-            )
-        )
-    )
-    for f in result.scalars().all():
-        fid = f.friend_id if f.user_id == current_user.id else f.user_id
-        await manager.send_personal_message(ws_msg, str(fid))
+    recipients = await fan_out_recipients(db, current_user.id)
+    await manager.broadcast(ws_msg, recipients)
 
     return wishlist
 
@@ -439,8 +435,10 @@ async def update_wishlist_cover(
     wishlist.cover_image_url = f"/uploads/wishlists/{filename}"
     wishlist.cover_emoji = None  # Clear emoji when setting image
     
+    await bump_version(db, wishlist.id)
     await db.commit()
     await db.refresh(wishlist)
+    await invalidate_wishlist_cache(wishlist.owner_id, wishlist.share_token)
     
     # Notify owner + friends
     ws_msg = json.dumps({
@@ -450,20 +448,7 @@ async def update_wishlist_cover(
         "owner_id": current_user.id,
         "title": wishlist.title,
     })
-    await manager.send_personal_message(ws_msg, str(current_user.id))
-    result = await db.execute(
-        select(FriendshipModel).where(
-            and_(
-                or_(
-                    FriendshipModel.user_id == current_user.id,
-                    FriendshipModel.friend_id == current_user.id
-                ),
-                FriendshipModel.status == FriendshipStatusEnum.ACCEPTED
-            )
-        )
-    )
-    for f in result.scalars().all():
-        fid = f.friend_id if f.user_id == current_user.id else f.user_id
-        await manager.send_personal_message(ws_msg, str(fid))
+    recipients = await fan_out_recipients(db, current_user.id)
+    await manager.broadcast(ws_msg, recipients)
     
     return wishlist
@@ -27,11 +27,125 @@ class Settings(BaseSettings):
             f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}"
             f"@{self.POSTGRES_SERVER}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
         )
-    
+
+    # Read replicas: comma-separated host or host:port list (same credentials
+    # and database as the primary). Empty = all reads go to the primary.
+    POSTGRES_REPLICA_SERVERS: str = ""
+    # After a client writes, its reads stay on the primary for this long
+    DB_REPLICA_STICKY_SECONDS: int = 5
+
+    @property
+    def DATABASE_REPLICA_URLS(self) -> List[str]:
+        urls = []
+        for server in self.POSTGRES_REPLICA_SERVERS.split(","):
+            server = server.strip()
+            if not server:
+                continue
+            if ":" not in server:
+                server = f"{server}:{self.POSTGRES_PORT}"
+            urls.append(
+                f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}"
+                f"@{server}/{self.POSTGRES_DB}"
+            )
+        return urls
+
+    # Connection pool: "queue" (pooled), "pgbouncer" (pooled, no server-side
+    # prepared statements — for PgBouncer in transaction mode) or "null"
+    # (new connection per checkout, old behaviour)
+    DB_POOL_MODE: str = "queue"
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # seconds, -1 = never
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100  # asyncpg prepared statement cache
+
+    @field_validator("DB_POOL_MODE", mode="after")
+    @classmethod
+    def validate_pool_mode(cls, v: str) -> str:
+        v = v.strip().lower()
+        if v not in ("queue", "pgbouncer", "null"):
+            raise ValueError("DB_POOL_MODE must be one of: queue, pgbouncer, null")
+        return v
+
+    # Per-request query budget: warn when a route runs more than
+    # DB_QUERY_BUDGET statements or repeats one statement
+    # DB_N_PLUS_ONE_THRESHOLD times (0 disables). Strict mode raises instead
+    # of logging — meant for tests.
+    DB_QUERY_BUDGET: int = 30
+    DB_N_PLUS_ONE_THRESHOLD: int = 10
+    DB_QUERY_BUDGET_STRICT: bool = False
+
+    # Slow query log (0 disables); SELECTs get an EXPLAIN (ANALYZE, BUFFERS)
+    SLOW_QUERY_MS: int = 200
+    SLOW_QUERY_EXPLAIN: bool = True
+    SLOW_QUERY_LOG_SIZE: int = 50
+
+    # WebSocket fan-out: "local" (single worker) or "redis" (pub/sub
+    # backplane, needed with several workers or containers)
+    WS_BACKPLANE: str = "local"
+
+    @field_validator("WS_BACKPLANE", mode="after")
+    @classmethod
+    def validate_ws_backplane(cls, v: str) -> str:
+        v = v.strip().lower()
+        if v not in ("local", "redis"):
+            raise ValueError("WS_BACKPLANE must be one of: local, redis")
+        return v
+
+    # Per-connection send queue; when full, WS_OVERFLOW_POLICY applies:
+    # "drop" (oldest), "coalesce" (replace a message about the same thing)
+    # or "disconnect" (close the slow client)
+    WS_SEND_QUEUE_SIZE: int = 100
+    WS_SEND_TIMEOUT: float = 5.0  # seconds; a stuck send drops the connection
+    WS_OVERFLOW_POLICY: str = "coalesce"
+
+    @field_validator("WS_OVERFLOW_POLICY", mode="after")
+    @classmethod
+    def validate_ws_overflow_policy(cls, v: str) -> str:
+        v = v.strip().lower()
+        if v not in ("drop", "coalesce", "disconnect"):
+            raise ValueError("WS_OVERFLOW_POLICY must be one of: drop, coalesce, disconnect")
+        return v
+
+    # Share-page events are buffered this long and sent as one batch frame
+    # (0 = send right away); a full batch is sent immediately
+    WS_COALESCE_WINDOW_MS: int = 150
+    WS_COALESCE_MAX_EVENTS: int = 50
+
+    # Recent frames per channel kept in Redis for ?since= replay (0 disables)
+    WS_HISTORY_SIZE: int = 200
+    WS_HISTORY_TTL_SECONDS: int = 3600
+    # A quiet channel's seq counter is dropped after this (plus the history
+    # TTL); keep it above the longest WebSocket connection
+    WS_SEQ_TTL_SECONDS: int = 30 * 24 * 3600
+
+    # Channels one /ws/mux connection may subscribe to
+    WS_MUX_MAX_CHANNELS: int = 50
+    # Shards of the channel -> connections index (each with its own lock)
+    WS_MANAGER_SHARDS: int = 16
+
+    # Heartbeat: sockets silent this long get a ping (0 disables the heartbeat),
+    # and are closed after WS_IDLE_TIMEOUT of silence (0 = never)
+    WS_HEARTBEAT_INTERVAL: float = 25.0
+    WS_IDLE_TIMEOUT: float = 75.0
+    # Older sockets of a user are closed above this (0 = no limit)
+    WS_MAX_CONNECTIONS_PER_USER: int = 10
+    # Offer the binary "msgpack" subprotocol (needs the msgpack package)
+    WS_MSGPACK_ENABLED: bool = True
+    # Per-message WS debug logs: one line in this many (needs DEBUG level)
+    WS_LOG_SAMPLE_EVERY: int = 100
+
     # Redis
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
+    # Shared connection pool (per worker)
+    REDIS_MAX_CONNECTIONS: int = 50  # over the limit commands fail fast
+    REDIS_SOCKET_TIMEOUT: float = 5.0
+    REDIS_SOCKET_CONNECT_TIMEOUT: float = 2.0
+    REDIS_SOCKET_KEEPALIVE: bool = True
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30  # PING idle connections before reuse
     
     @property
     def REDIS_URL(self) -> str:
@@ -41,6 +155,11 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "your-secret-key-change-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 10080  # 7 days (7 * 24 * 60)
+    JWT_CACHE_SIZE: int = 4096  # verified tokens kept per worker, 0 disables
+    # Password hashing: changing BCRYPT_ROUNDS rehashes passwords on next login
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 32  # waiting jobs before returning 503
     
     @field_validator("SECRET_KEY", mode="after")
     @classmethod
@@ -59,6 +178,22 @@ class Settings(BaseSettings):
             raise ValueError("SECRET_KEY must be at least 32 characters long")
         return v
     
+    # Redis-backed rate limits (login, register, parse-url, reserve, ...)
+    RATE_LIMIT_ENABLED: bool = True
+    
+    # Authenticated user cache (0 disables). The local tier is per worker.
+    USER_CACHE_TTL_SECONDS: int = 30
+    USER_CACHE_LOCAL_TTL_SECONDS: int = 5
+    USER_CACHE_SIZE: int = 1024
+    
+    # Friend lists for WebSocket fan-out (0 disables); local tier is per worker
+    FRIEND_CACHE_TTL_SECONDS: int = 3600
+    FRIEND_CACHE_LOCAL_TTL_SECONDS: int = 5
+    FRIEND_CACHE_SIZE: int = 10000
+    
+    # Rendered JSON of public wishlist views in Redis (0 disables)
+    WISHLIST_CACHE_TTL_SECONDS: int = 60
+    
     # SMTP
     SMTP_HOST: str = "localhost"
     SMTP_PORT: int = 465
@@ -72,6 +207,15 @@ class Settings(BaseSettings):
     SMTP_USER: str = ""
     SMTP_PASSWORD: str = ""
     SMTP_FROM: str = "noreply@x1k.ru"
+    # Email outbox
+    EMAIL_SMTP_POOL_SIZE: int = 2  # persistent SMTP connections (sender tasks)
+    EMAIL_BATCH_SIZE: int = 10  # messages sent per connection turn
+    EMAIL_SMTP_IDLE_SECONDS: int = 60  # reconnect after this much idle time
+    EMAIL_MAX_ATTEMPTS: int = 5
+    EMAIL_RETRY_BASE_SECONDS: float = 2.0
+    # How long a worker owns a queued message without renewing its claim;
+    # keep it above the SMTP timeout
+    EMAIL_LEASE_SECONDS: int = 90
     
     # Google OAuth
     GOOGLE_CLIENT_ID: str = ""
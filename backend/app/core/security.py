@@ -1,9 +1,13 @@
 """
 Security utilities
 """
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Any
-from jose import jwt
+from typing import NamedTuple, Optional, Any
+from jose import jwt, JWTError
 import bcrypt
 
 from app.core.config import settings
@@ -24,6 +28,53 @@ def create_access_token(subject: Any, expires_delta: Optional[timedelta] = None)
     return encoded_jwt
 
 
+class TokenClaims(NamedTuple):
+    """Verified access token contents"""
+    subject: str
+    expires_at: float  # unix timestamp
+
+
+# token -> claims of tokens whose signature was already verified (LRU)
+_verified_tokens: "OrderedDict[str, TokenClaims]" = OrderedDict()
+
+
+def decode_access_token(token: str) -> Optional[TokenClaims]:
+    """Verify a JWT access token, returning its claims or None if invalid.
+
+    Used by both HTTP and WebSocket auth. Verified tokens are remembered
+    until they expire, so repeated requests with the same token skip
+    signature verification. Tokens can't be revoked: HTTP auth looks the
+    user up, and that is what rejects deleted or deactivated accounts.
+    """
+    now = time.time()
+    claims = _verified_tokens.get(token)
+    if claims is not None:
+        if claims.expires_at <= now:
+            del _verified_tokens[token]
+            return None
+        _verified_tokens.move_to_end(token)
+        return claims
+
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    subject = payload.get("sub")
+    exp = payload.get("exp")
+    if subject is None:
+        return None
+    if not isinstance(exp, (int, float)):
+        # No expiry — valid, but never cached
+        return TokenClaims(subject=str(subject), expires_at=float("inf"))
+
+    claims = TokenClaims(subject=str(subject), expires_at=float(exp))
+    if settings.JWT_CACHE_SIZE > 0:
+        _verified_tokens[token] = claims
+        while len(_verified_tokens) > settings.JWT_CACHE_SIZE:
+            _verified_tokens.popitem(last=False)
+    return claims
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify password"""
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
@@ -31,5 +82,47 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     """Hash password"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
     return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True if the hash was made with a different bcrypt work factor"""
+    try:
+        return int(hashed_password.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+# bcrypt takes ~100-300 ms of CPU; run it on dedicated threads so the event
+# loop keeps serving other requests and WebSocket traffic meanwhile
+class PasswordHasherBusy(RuntimeError):
+    """Too many password hashing jobs are already queued"""
+
+
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="bcrypt",
+)
+_hash_jobs = 0
+
+
+async def _run_hasher(fn, *args):
+    global _hash_jobs
+    if _hash_jobs >= settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_MAX_QUEUE:
+        raise PasswordHasherBusy()
+    _hash_jobs += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+    finally:
+        _hash_jobs -= 1
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password() on the hashing thread pool"""
+    return await _run_hasher(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash() on the hashing thread pool"""
+    return await _run_hasher(get_password_hash, password)
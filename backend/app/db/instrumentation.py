@@ -0,0 +1,99 @@
+"""
+Per-request SQL instrumentation
+
+Counts statements and database time for the current request via SQLAlchemy
+engine events, and flags requests that go over the configured query budget
+or run the same statement over and over (a typical N+1 loop).
+"""
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.db import slow_queries
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Raised in strict mode when a request runs too many queries"""
+
+
+class QueryStats:
+    """Statement counters for one request"""
+
+    __slots__ = ("route", "count", "duration", "statements")
+
+    def __init__(self, route: Optional[str] = None):
+        self.route = route
+        self.count = 0
+        self.duration = 0.0  # seconds
+        self.statements: Counter = Counter()
+
+    @property
+    def duration_ms(self) -> float:
+        return self.duration * 1000
+
+    def repeated(self, threshold: int):
+        """Statements executed at least `threshold` times"""
+        return [(stmt, n) for stmt, n in self.statements.most_common() if n >= threshold]
+
+
+query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # One statement at a time per connection; a failed one (no "after" event)
+    # is simply overwritten by the next
+    conn.info["query_start"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop("query_start")
+    if slow_queries.in_explain():
+        return
+    stats = query_stats.get()
+    if settings.SLOW_QUERY_MS and elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        slow_queries.record(
+            conn, statement, parameters, executemany, elapsed,
+            stats.route if stats is not None else None,
+        )
+    if stats is None:
+        return
+    stats.count += 1
+    stats.duration += elapsed
+    stats.statements[statement] += 1
+
+
+def instrument_engine(engine) -> None:
+    """Attach the counters to an (async or sync) engine"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if sync_engine is not engine:
+        slow_queries.register_engine(engine)
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def check_query_budget(route: str, stats: QueryStats) -> None:
+    """Warn (or raise, in strict mode) about expensive request patterns"""
+    problems = []
+    budget = settings.DB_QUERY_BUDGET
+    if budget and stats.count > budget:
+        problems.append(f"{stats.count} queries (budget {budget})")
+    threshold = settings.DB_N_PLUS_ONE_THRESHOLD
+    if threshold:
+        for statement, n in stats.repeated(threshold):
+            problems.append(f"possible N+1: {n}x {' '.join(statement.split())[:200]}")
+
+    if not problems:
+        return
+    message = f"{route}: " + "; ".join(problems)
+    if settings.DB_QUERY_BUDGET_STRICT:
+        raise QueryBudgetExceeded(message)
+    logger.warning("DB query budget: %s", message)
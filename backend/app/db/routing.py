@@ -0,0 +1,107 @@
+"""
+Read/write session routing
+
+Pure-read endpoints depend on `get_read_db` instead of `get_db`. When read
+replicas are configured, those sessions go to a replica — except for clients
+that wrote something in the last DB_REPLICA_STICKY_SECONDS, who keep reading
+from the primary so they always see their own changes (read-your-writes).
+Conditional requests (If-None-Match) also read from the primary: a 304 tells
+the client its copy is current, which a lagging replica can't vouch for.
+"""
+import hashlib
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, AsyncIterator, List, Optional
+
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal, ReplicaSessionLocals, get_db
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+CONDITIONAL_HEADERS = ("if-none-match", "if-modified-since")
+
+_replica_cycle = itertools.cycle(range(len(ReplicaSessionLocals))) if ReplicaSessionLocals else None
+
+
+def _client_keys(request: Request, response: Optional[Response] = None) -> List[str]:
+    """Identify the client: bearer token, guest session or IP address"""
+    keys = []
+    auth = request.headers.get("authorization")
+    if auth:
+        keys.append(auth)
+    guest = request.headers.get("X-Guest-Session-Token") or request.cookies.get("guest_session_token")
+    if guest:
+        keys.append(f"guest:{guest}")
+    # A guest session created by this very request (reserve_item)
+    if response is not None and response.headers.get("X-Guest-Session-Token"):
+        keys.append(f"guest:{response.headers['X-Guest-Session-Token']}")
+    if not keys and request.client:
+        keys.append(f"ip:{request.client.host}")
+    return [
+        "db:sticky:" + hashlib.sha1(k.encode("utf-8")).hexdigest()
+        for k in keys
+    ]
+
+
+async def mark_primary_sticky(request: Request, response: Optional[Response] = None) -> None:
+    """Pin the client's reads to the primary after a successful write"""
+    if not ReplicaSessionLocals:
+        return
+    keys = _client_keys(request, response)
+    if not keys:
+        return
+    try:
+        r = await get_redis()
+        async with r.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.setex(key, settings.DB_REPLICA_STICKY_SECONDS, 1)
+            await pipe.execute()
+    except Exception:
+        logger.warning("Failed to mark client as primary-sticky", exc_info=True)
+
+
+async def _is_primary_sticky(request: Request) -> bool:
+    keys = _client_keys(request)
+    if not keys:
+        return False
+    try:
+        r = await get_redis()
+        return await r.exists(*keys) > 0
+    except Exception:
+        # Can't prove the client hasn't just written — stay safe
+        logger.debug("Sticky check failed, routing read to primary", exc_info=True)
+        return True
+
+
+async def get_read_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """Get a read-only database session (replica when possible).
+
+    Never write through this session: replicas reject writes, and the
+    primary fallback is only there to guarantee read-your-writes.
+    """
+    conditional = any(h in request.headers for h in CONDITIONAL_HEADERS)
+    if _replica_cycle is None or conditional or await _is_primary_sticky(request):
+        async for session in get_db():
+            yield session
+        return
+
+    session_factory = ReplicaSessionLocals[next(_replica_cycle)]
+    async with session_factory() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
+@asynccontextmanager
+async def primary_session() -> AsyncIterator[AsyncSession]:
+    """A primary session for reads that must not lag, e.g. filling a cache
+    that outlives the request"""
+    async with AsyncSessionLocal() as session:
+        yield session
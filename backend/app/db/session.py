@@ -1,22 +1,63 @@
 """
 Database session management
 """
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Dict
+from uuid import uuid4
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.pool import NullPool
 
 from app.core.config import settings
+from app.db.instrumentation import instrument_engine
 
 # Import all models to register them with SQLAlchemy
 import app.models  # noqa
 
+
+def _pgbouncer_statement_name() -> str:
+    # PgBouncer may hand us a different server connection per transaction,
+    # so asyncpg's sequential statement names would collide
+    return f"__asyncpg_{uuid4()}__"
+
+
+def engine_options(pool_mode: str = None) -> Dict[str, Any]:
+    """Build create_async_engine() kwargs for the configured pool mode.
+
+    - queue: SQLAlchemy connection pool, asyncpg statement cache enabled
+    - pgbouncer: pooled, but no server-side prepared statement reuse
+      (safe behind PgBouncer in transaction pooling mode)
+    - null: no pooling, a fresh connection for every checkout
+    """
+    mode = pool_mode or settings.DB_POOL_MODE
+    options: Dict[str, Any] = {"echo": False, "future": True}
+
+    if mode == "null":
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+
+    if mode == "pgbouncer":
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": _pgbouncer_statement_name,
+        }
+    else:
+        options["connect_args"] = {
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        }
+    return options
+
+
 # Create async engine
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=False,
-    future=True,
-    poolclass=NullPool,
-)
+engine = create_async_engine(settings.DATABASE_URL, **engine_options())
+
+instrument_engine(engine)
 
 # Create async session factory
 AsyncSessionLocal = async_sessionmaker(
@@ -27,6 +68,24 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False,
 )
 
+# Read replicas (optional). Used only through app.db.routing.get_read_db
+replica_engines = [
+    create_async_engine(url, **engine_options())
+    for url in settings.DATABASE_REPLICA_URLS
+]
+for replica in replica_engines:
+    instrument_engine(replica)
+ReplicaSessionLocals = [
+    async_sessionmaker(
+        replica,
+        class_=AsyncSession,
+        expire_on_commit=False,
+        autocommit=False,
+        autoflush=False,
+    )
+    for replica in replica_engines
+]
+
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """Get database session.
@@ -52,3 +111,10 @@ async def init_db() -> None:
     async with engine.begin() as conn:
         # Tables will be created via Alembic
         pass
+
+
+async def close_db() -> None:
+    """Close pooled connections on shutdown"""
+    await engine.dispose()
+    for replica in replica_engines:
+        await replica.dispose()
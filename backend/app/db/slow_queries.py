@@ -0,0 +1,140 @@
+"""
+Slow query log
+
+Statements slower than SLOW_QUERY_MS are recorded with the route that ran
+them and the shape (not the values) of their bound parameters. For SELECTs an
+`EXPLAIN (ANALYZE, BUFFERS)` plan is captured in the background on a separate
+connection. The worst SLOW_QUERY_LOG_SIZE statements are kept in memory and
+served by the admin API.
+"""
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# sync Engine -> AsyncEngine, so EXPLAIN can run on the same database
+_async_engines: Dict[Any, Any] = {}
+# Worst statements, keyed by normalized SQL
+_entries: Dict[str, dict] = {}
+# Set inside EXPLAIN tasks so their own statements aren't recorded
+_explaining: ContextVar[bool] = ContextVar("slow_query_explaining", default=False)
+_explain_tasks: set = set()
+_explain_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def register_engine(async_engine) -> None:
+    _async_engines[async_engine.sync_engine] = async_engine
+
+
+def in_explain() -> bool:
+    """True while running our own EXPLAIN statements"""
+    return _explaining.get()
+
+
+def _normalize(statement: str) -> str:
+    return " ".join(statement.split())
+
+
+def parameter_shape(parameters: Any, executemany: bool = False) -> Any:
+    """Describe bound parameters by type only — values may contain PII"""
+    if executemany and isinstance(parameters, (list, tuple)):
+        return {"executemany": len(parameters), "row": parameter_shape(parameters[0]) if parameters else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def record(conn, statement: str, parameters: Any, executemany: bool, duration: float, route: Optional[str]) -> None:
+    """Called from the engine event hook for every statement over the threshold"""
+    key = _normalize(statement)
+    duration_ms = round(duration * 1000, 2)
+    entry = _entries.get(key)
+    if entry is None:
+        entry = {
+            "statement": key,
+            "count": 0,
+            "max_ms": 0.0,
+            "total_ms": 0.0,
+            "route": route,
+            "params": parameter_shape(parameters, executemany),
+            "last_seen": None,
+            "plan": None,
+        }
+        _entries[key] = entry
+    entry["count"] += 1
+    entry["total_ms"] = round(entry["total_ms"] + duration_ms, 2)
+    entry["last_seen"] = time.time()
+    if duration_ms >= entry["max_ms"]:
+        entry["max_ms"] = duration_ms
+        entry["route"] = route
+    _trim()
+
+    logger.warning("Slow query %.1f ms [%s]: %s", duration_ms, route or "-", key[:500])
+
+    if (
+        settings.SLOW_QUERY_EXPLAIN
+        and entry["plan"] is None
+        and not executemany
+        and key[:6].upper() == "SELECT"
+        and "FOR UPDATE" not in key.upper()
+    ):
+        _schedule_explain(conn, statement, parameters, entry)
+
+
+def _trim() -> None:
+    limit = max(settings.SLOW_QUERY_LOG_SIZE, 1)
+    while len(_entries) > limit:
+        fastest = min(_entries, key=lambda k: _entries[k]["max_ms"])
+        del _entries[fastest]
+
+
+def _schedule_explain(conn, statement: str, parameters: Any, entry: dict) -> None:
+    async_engine = _async_engines.get(conn.engine)
+    if async_engine is None or async_engine.dialect.name != "postgresql":
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    entry["plan"] = "pending"
+    task = loop.create_task(_explain(async_engine, statement, parameters, entry))
+    _explain_tasks.add(task)
+    task.add_done_callback(_explain_tasks.discard)
+
+
+async def _explain(async_engine, statement: str, parameters: Any, entry: dict) -> None:
+    global _explain_semaphore
+    if _explain_semaphore is None:
+        _explain_semaphore = asyncio.Semaphore(1)
+    _explaining.set(True)
+    try:
+        async with _explain_semaphore:
+            async with async_engine.connect() as conn:
+                # ANALYZE really executes the query — never let it commit
+                trans = await conn.begin()
+                try:
+                    result = await conn.exec_driver_sql(
+                        "EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters
+                    )
+                    entry["plan"] = "\n".join(row[0] for row in result.fetchall())
+                finally:
+                    await trans.rollback()
+    except Exception as e:
+        entry["plan"] = f"EXPLAIN failed: {e}"
+        logger.debug("EXPLAIN failed for slow query", exc_info=True)
+
+
+def worst_queries() -> List[dict]:
+    """Recorded statements, slowest first"""
+    return sorted(_entries.values(), key=lambda e: e["max_ms"], reverse=True)
+
+
+def reset() -> None:
+    _entries.clear()
@@ -7,16 +7,23 @@ logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
 
 from pathlib import Path
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
 from app.core.config import settings
 from app.api.v1 import api_router
 from app.api.google_auth import router as google_auth_router
-from app.db.session import init_db
+from app.db.session import init_db, close_db
+from app.db.routing import SAFE_METHODS, mark_primary_sticky
+from app.utils.pagination import NEXT_CURSOR_HEADER
+from app.db.instrumentation import QueryStats, query_stats, check_query_budget
 from app.services.parsers import shutdown_browser
-from app.services.verification import close_redis
+from app.services.redis_client import close_redis
+from app.services.email import email_outbox
+from app.services import metrics
+from app.services.realtime import manager as ws_manager
 
 logger = logging.getLogger(__name__)
 
@@ -32,12 +39,18 @@ async def lifespan(app: FastAPI):
     uploads_dir.mkdir(exist_ok=True)
     (uploads_dir / "avatars").mkdir(exist_ok=True)
     (uploads_dir / "items").mkdir(exist_ok=True)
+
+    # Resend emails a crashed worker didn't get to
+    await email_outbox.recover()
     
     logger.info("Application started")
     yield
     # Shutdown
     await shutdown_browser()
+    await email_outbox.stop()
+    await ws_manager.close()
     await close_redis()
+    await close_db()
     logger.info("Application shutdown")
 
 
@@ -55,8 +68,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    """Keep a client's reads on the primary right after it wrote something"""
+    response = await call_next(request)
+    if request.method not in SAFE_METHODS and response.status_code < 400:
+        await mark_primary_sticky(request, response)
+    return response
+
+
+@app.middleware("http")
+async def db_query_metrics(request: Request, call_next):
+    """Expose per-request query count and DB time, enforce the query budget"""
+    stats = QueryStats(route=f"{request.method} {request.url.path}")
+    token = query_stats.set(stats)
+    try:
+        response = await call_next(request)
+    finally:
+        query_stats.reset(token)
+    response.headers["X-DB-Queries"] = str(stats.count)
+    response.headers["Server-Timing"] = f'db;dur={stats.duration_ms:.1f};desc="{stats.count} queries"'
+    route = request.scope.get("route")
+    check_query_budget(f"{request.method} {getattr(route, 'path', request.url.path)}", stats)
+    return response
+
 # Mount static files for uploads (only if directory exists)
 uploads_path = Path("uploads")
 if uploads_path.exists() and uploads_path.is_dir():
@@ -74,7 +113,13 @@ app.include_router(api_router, prefix=settings.API_V1_STR)
 app.include_router(google_auth_router, prefix="/api/auth/google", tags=["google-auth"])
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus metrics of this worker (internal network only)"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "version": settings.VERSION}
+    return {"status": "healthy", "version": settings.VERSION, "websocket": ws_manager.stats()}
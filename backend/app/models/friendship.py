@@ -1,7 +1,7 @@
 """
 Friendship model
 """
-from sqlalchemy import Column, Integer, DateTime, Enum, ForeignKey, CheckConstraint, UniqueConstraint
+from sqlalchemy import Column, Integer, DateTime, Enum, ForeignKey, CheckConstraint, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.base import Base
@@ -35,4 +35,6 @@ class Friendship(Base):
     __table_args__ = (
         CheckConstraint("user_id < friend_id", name="check_user_friend_order"),
         UniqueConstraint("user_id", "friend_id", name="unique_friendship"),
+        Index("ix_friendships_user_requested", "user_id", "requested_at", "id"),
+        Index("ix_friendships_friend_requested", "friend_id", "requested_at", "id"),
     )
@@ -1,7 +1,7 @@
 """
 Item model
 """
-from sqlalchemy import Column, Integer, String, Text, Numeric, Boolean, DateTime, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Numeric, Boolean, DateTime, Enum, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import JSON
@@ -52,3 +52,9 @@ class Item(Base):
     reserved_by = relationship("User", foreign_keys=[reserved_by_id])
     reservations = relationship("Reservation", back_populates="item", cascade="all, delete-orphan")
     contributions = relationship("Contribution", back_populates="item", cascade="all, delete-orphan")
+    
+    # Под курсорную пагинацию: страница = диапазон индекса
+    __table_args__ = (
+        Index("ix_items_wishlist_position", "wishlist_id", "position_order", id.desc()),
+        Index("ix_items_reserved_by_created", "reserved_by_id", "created_at", "id"),
+    )
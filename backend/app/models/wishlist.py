@@ -1,7 +1,7 @@
 """
 Wishlist model
 """
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, Date, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, Date, Enum, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.base import Base
@@ -42,9 +42,16 @@ class Wishlist(Base):
     share_token = Column(String(64), unique=True, nullable=False, index=True)
     
     is_archived = Column(Boolean, default=False)
+    # Растёт при любом изменении вишлиста, его подарков и броней (ETag страницы по ссылке)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
     owner = relationship("User", back_populates="wishlists")
     items = relationship("Item", back_populates="wishlist", cascade="all, delete-orphan")
+    
+    # Списки пользователя: owner_id + курсор (created_at, id)
+    __table_args__ = (
+        Index("ix_wishlists_owner_created", "owner_id", "created_at", "id"),
+    )
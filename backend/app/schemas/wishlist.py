@@ -5,6 +5,7 @@ from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime, date
 from typing import Optional, List
 from app.models.wishlist import WishlistTypeEnum, VisibilityEnum
+from app.schemas.item import DecimalAsNum
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
@@ -56,6 +57,8 @@ class WishlistInDB(WishlistBase):
 class WishlistSummary(WishlistInDB):
     """Wishlist summary for list views (without items)"""
     items_count: int = 0
+    reserved_count: Optional[int] = None  # None for the owner: reservations are a surprise
+    total_price: Optional[DecimalAsNum] = None
 
 
 class Wishlist(WishlistInDB):
@@ -1,16 +1,63 @@
-"""Email sending service"""
+"""Email sending service
+
+Emails go through an outbox: enqueue_*() returns immediately, and a few
+sender tasks deliver the queue over persistent, already authenticated SMTP
+connections (several messages per connection), retrying with exponential
+backoff. Queued messages are journaled in Redis, so ones lost in a crash are
+resent on the next start.
+
+Each journaled message carries a lease: the id of the worker that owns it and
+when the claim runs out. The owner renews it on every send attempt and retry
+(a retry's lease covers its backoff delay), and checks it before sending.
+recover() only claims messages whose lease has run out, so a message is never
+delivered by two workers at once.
+"""
+import asyncio
+import json
 import logging
 import ssl
+import time
+import uuid
+from typing import List, Optional
+
 import aiosmtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from app.core.config import settings
+from app.services.redis_client import get_redis, transaction
 
 logger = logging.getLogger(__name__)
 
+OUTBOX_KEY = "email:outbox"
+LEASES_KEY = "email:outbox:leases"
+
+# Take or renew the lease on a message in one step. Fails if another worker
+# holds a live lease, or if the message left the journal (sent or dropped
+# elsewhere) and may not be created here.
+# KEYS: outbox, leases. ARGV: id, owner, now, lease until, entry ('' keeps the
+# journaled one), may create ('1' / '0')
+_LEASE_LUA = """
+local lease = redis.call('HGET', KEYS[2], ARGV[1])
+if lease then
+  local owner, expires = string.match(lease, '^(%S+) (%S+)$')
+  if owner ~= ARGV[2] and tonumber(expires) > tonumber(ARGV[3]) then
+    return 0
+  end
+end
+if ARGV[6] ~= '1' and redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+  return 0
+end
+if ARGV[5] ~= '' then
+  redis.call('HSET', KEYS[1], ARGV[1], ARGV[5])
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2] .. ' ' .. ARGV[4])
+return 1
+"""
+_lease_script = None
 
-async def send_verification_email(email: str, code: str) -> bool:
-    """Send verification code to user's email"""
+
+def build_verification_message(email: str, code: str) -> MIMEMultipart:
+    """Build the verification code email"""
     msg = MIMEMultipart("alternative")
     msg["From"] = settings.SMTP_FROM
     msg["To"] = email
@@ -40,43 +87,238 @@ async def send_verification_email(email: str, code: str) -> bool:
     msg.attach(MIMEText(text, "plain", "utf-8"))
     msg.attach(MIMEText(html, "html", "utf-8"))
 
+    return msg
+
+
+async def _connect_smtp() -> aiosmtplib.SMTP:
+    """Open an authenticated SMTP connection"""
     host = settings.SMTP_HOST
     port = settings.SMTP_PORT
 
-    try:
-        if port == 465:
-            context = ssl.create_default_context()
-            context.check_hostname = False
-            context.verify_mode = ssl.CERT_NONE
-            smtp_client = aiosmtplib.SMTP(
-                hostname=host,
-                port=port,
-                use_tls=True,
-                tls_context=context,
-            )
-            await smtp_client.connect(server_hostname=host)
-        elif port == 587:
-            smtp_client = aiosmtplib.SMTP()
-            await smtp_client.connect(
-                hostname=host,
-                port=port,
-                start_tls=True,
+    if port == 465:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        smtp_client = aiosmtplib.SMTP(
+            hostname=host,
+            port=port,
+            use_tls=True,
+            tls_context=context,
+        )
+        await smtp_client.connect(server_hostname=host)
+    elif port == 587:
+        smtp_client = aiosmtplib.SMTP()
+        await smtp_client.connect(
+            hostname=host,
+            port=port,
+            start_tls=True,
+        )
+    else:
+        smtp_client = aiosmtplib.SMTP()
+        await smtp_client.connect(
+            hostname=host,
+            port=port,
+        )
+
+    if settings.SMTP_USER:
+        await smtp_client.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+    return smtp_client
+
+
+class EmailOutbox:
+    """In-process email queue with pooled SMTP senders"""
+
+    def __init__(self):
+        self._owner = uuid.uuid4().hex
+        self._queue: Optional[asyncio.Queue] = None
+        self._senders: List[asyncio.Task] = []
+        self._retries: set = set()
+        # Messages the journal write missed (Redis was down)
+        self._unjournaled: set = set()
+
+    def _ensure_started(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._senders = [t for t in self._senders if not t.done()]
+        while len(self._senders) < settings.EMAIL_SMTP_POOL_SIZE:
+            self._senders.append(asyncio.create_task(self._sender()))
+
+    async def enqueue(self, to: str, msg: MIMEMultipart) -> str:
+        """Queue a message for delivery and return its id"""
+        entry = {
+            "id": uuid.uuid4().hex,
+            "from": settings.SMTP_FROM,
+            "to": to,
+            "body": msg.as_string(),
+            "attempts": 0,
+            "queued_at": time.time(),
+        }
+        await self._lease(entry, new=True)
+        self._ensure_started()
+        self._queue.put_nowait(entry)
+        return entry["id"]
+
+    async def recover(self) -> int:
+        """Re-queue journaled messages left behind by a crashed worker"""
+        try:
+            r = await get_redis()
+            pending = await r.hgetall(OUTBOX_KEY)
+            leases = await r.hgetall(LEASES_KEY)
+        except Exception:
+            logger.warning("Email outbox: can't read Redis journal", exc_info=True)
+            return 0
+        recovered = 0
+        now = time.time()
+        for message_id, raw in pending.items():
+            lease = leases.get(message_id)
+            if lease and float(lease.split()[1]) > now:
+                continue  # a live worker still owns it
+            entry = json.loads(raw)
+            # The lease script is atomic: only one worker wins the claim
+            if await self._lease(entry):
+                self._ensure_started()
+                self._queue.put_nowait(entry)
+                recovered += 1
+        if recovered:
+            logger.info("Email outbox: recovered %d message(s)", recovered)
+        return recovered
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Give queued messages a moment to go out, then stop the senders"""
+        if self._queue is not None and not self._queue.empty():
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Email outbox: %d message(s) left for recovery", self._queue.qsize())
+        for task in self._senders + list(self._retries):
+            task.cancel()
+        await asyncio.gather(*self._senders, *self._retries, return_exceptions=True)
+        self._senders = []
+        self._retries = set()
+
+    async def _lease(
+        self, entry: dict, hold: float = 0, journal: bool = False, new: bool = False
+    ) -> Optional[bool]:
+        """Take or renew this worker's lease on a message for `hold` seconds
+        plus EMAIL_LEASE_SECONDS; `journal` also rewrites the entry, `new`
+        allows creating it.
+
+        False: another worker owns the message or has already sent it.
+        None: Redis is unavailable, the journal can't tell.
+        """
+        global _lease_script
+        message_id = entry["id"]
+        new = new or message_id in self._unjournaled
+        journal = journal or new
+        now = time.time()
+        try:
+            r = await get_redis()
+            if _lease_script is None or _lease_script.registered_client is not r:
+                _lease_script = r.register_script(_LEASE_LUA)
+            owned = await _lease_script(
+                keys=[OUTBOX_KEY, LEASES_KEY],
+                args=[
+                    message_id,
+                    self._owner,
+                    f"{now:.3f}",
+                    f"{now + hold + settings.EMAIL_LEASE_SECONDS:.3f}",
+                    json.dumps(entry) if journal else "",
+                    "1" if new else "0",
+                ],
             )
+        except Exception:
+            logger.debug("Email outbox: Redis lease failed", exc_info=True)
+            if journal:
+                self._unjournaled.add(message_id)
+            return None
+        self._unjournaled.discard(message_id)
+        return bool(owned)
+
+    async def _forget(self, entry: dict) -> None:
+        self._unjournaled.discard(entry["id"])
+        try:
+            async with transaction() as tx:
+                tx.hdel(OUTBOX_KEY, entry["id"])
+                tx.hdel(LEASES_KEY, entry["id"])
+                await tx.execute()
+        except Exception:
+            logger.debug("Email outbox: Redis journal delete failed", exc_info=True)
+
+    async def _sender(self) -> None:
+        smtp: Optional[aiosmtplib.SMTP] = None
+        last_used = 0.0
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                while len(batch) < settings.EMAIL_BATCH_SIZE and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+
+                # Servers drop idle sessions; don't bother probing an old one
+                if smtp is not None and time.monotonic() - last_used > settings.EMAIL_SMTP_IDLE_SECONDS:
+                    await self._close(smtp)
+                    smtp = None
+
+                for i, entry in enumerate(batch):
+                    try:
+                        if await self._lease(entry) is False:
+                            # Recovered by another worker while it waited here
+                            logger.info("Email to %s is owned by another worker, skipped", entry["to"])
+                            self._queue.task_done()
+                            continue
+                        if smtp is None or not smtp.is_connected:
+                            smtp = await _connect_smtp()
+                        await smtp.sendmail(entry["from"], [entry["to"]], entry["body"])
+                        await self._forget(entry)
+                        logger.info("Email sent to %s", entry["to"])
+                    except asyncio.CancelledError:
+                        for rest in batch[i:]:
+                            self._queue.task_done()
+                        raise
+                    except Exception as e:
+                        if isinstance(e, (aiosmtplib.SMTPServerDisconnected, OSError, asyncio.TimeoutError)):
+                            await self._close(smtp)
+                            smtp = None
+                        self._retry_later(entry, e)
+                    finally:
+                        last_used = time.monotonic()
+                    self._queue.task_done()
+        finally:
+            await self._close(smtp)
+
+    def _retry_later(self, entry: dict, error: Exception) -> None:
+        entry["attempts"] += 1
+        if entry["attempts"] >= settings.EMAIL_MAX_ATTEMPTS:
+            logger.error("Email to %s dropped after %d attempts: %s", entry["to"], entry["attempts"], error)
+            task = asyncio.create_task(self._forget(entry))
         else:
-            smtp_client = aiosmtplib.SMTP()
-            await smtp_client.connect(
-                hostname=host,
-                port=port,
-            )
+            delay = min(settings.EMAIL_RETRY_BASE_SECONDS * 2 ** (entry["attempts"] - 1), 300)
+            logger.warning("Email to %s failed (%s), retry in %.0fs", entry["to"], error, delay)
+            task = asyncio.create_task(self._requeue(entry, delay))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _requeue(self, entry: dict, delay: float) -> None:
+        # Hold the message through the backoff, or recover() would take it
+        if await self._lease(entry, hold=delay, journal=True) is False:
+            return
+        await asyncio.sleep(delay)
+        self._ensure_started()
+        self._queue.put_nowait(entry)
+
+    @staticmethod
+    async def _close(smtp: Optional[aiosmtplib.SMTP]) -> None:
+        if smtp is None:
+            return
+        try:
+            if smtp.is_connected:
+                await smtp.quit()
+        except Exception:
+            smtp.close()
+
 
-        if settings.SMTP_USER:
-            await smtp_client.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+email_outbox = EmailOutbox()
 
-        await smtp_client.send_message(msg)
-        await smtp_client.quit()
 
-        logger.info("Verification email sent to %s", email)
-        return True
-    except Exception as e:
-        logger.exception("Email send error to %s: %s", email, e)
-        return False
+async def enqueue_verification_email(email: str, code: str) -> None:
+    """Queue the verification code email; returns without waiting for SMTP"""
+    await email_outbox.enqueue(email, build_verification_message(email, code))
@@ -0,0 +1,139 @@
+"""Friend adjacency cache (in-process + Redis)
+
+WebSocket fan-out needs the accepted friends of a user on every wishlist or
+item change. Those sets are cached as Redis sets `friends:{user_id}`, shared
+by all workers, with a short-lived local copy on top. Each set always holds
+the sentinel "0", so an empty friend list is still a cache hit.
+
+Endpoints that accept, remove or block a friendship must call
+invalidate_friends() for both users after commit. That also moves the
+user's generation key, and a set loaded from the database is written back
+only if the generation is still the one read before the load, so a load
+racing with a friendship change can't cache the old set.
+"""
+import logging
+import time
+import uuid
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from redis.exceptions import WatchError
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.friendship import Friendship, FriendshipStatusEnum
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+_SENTINEL = "0"
+
+# user_id -> (expires_at, friend ids)
+_local: Dict[int, Tuple[float, FrozenSet[int]]] = {}
+
+
+def _key(user_id: int) -> str:
+    return f"friends:{user_id}"
+
+
+def _generation_key(user_id: int) -> str:
+    return f"friends:gen:{user_id}"
+
+
+def _local_get(user_id: int) -> Optional[FrozenSet[int]]:
+    entry = _local.get(user_id)
+    if entry is None:
+        return None
+    expires_at, friends = entry
+    if expires_at < time.monotonic():
+        del _local[user_id]
+        return None
+    return friends
+
+
+def _local_put(user_id: int, friends: FrozenSet[int]) -> None:
+    if len(_local) >= settings.FRIEND_CACHE_SIZE:
+        _local.clear()
+    _local[user_id] = (time.monotonic() + settings.FRIEND_CACHE_LOCAL_TTL_SECONDS, friends)
+
+
+async def _load(db: AsyncSession, user_id: int) -> FrozenSet[int]:
+    result = await db.execute(
+        select(Friendship.user_id, Friendship.friend_id).where(
+            and_(
+                or_(Friendship.user_id == user_id, Friendship.friend_id == user_id),
+                Friendship.status == FriendshipStatusEnum.ACCEPTED,
+            )
+        )
+    )
+    return frozenset(
+        friend_id if uid == user_id else uid
+        for uid, friend_id in result.all()
+    )
+
+
+async def get_friend_ids(db: AsyncSession, user_id: int) -> FrozenSet[int]:
+    """Accepted friends of a user: local cache -> Redis -> database"""
+    if settings.FRIEND_CACHE_TTL_SECONDS <= 0:
+        return await _load(db, user_id)
+
+    friends = _local_get(user_id)
+    if friends is not None:
+        return friends
+
+    generation = None
+    try:
+        r = await get_redis()
+        async with r.pipeline(transaction=False) as pipe:
+            pipe.smembers(_key(user_id))
+            pipe.get(_generation_key(user_id))
+            members, generation = await pipe.execute()
+        if members:
+            friends = frozenset(int(m) for m in members if m != _SENTINEL)
+            _local_put(user_id, friends)
+            return friends
+    except Exception:
+        logger.debug("Friend cache: Redis read failed", exc_info=True)
+
+    friends = await _load(db, user_id)
+    try:
+        r = await get_redis()
+        async with r.pipeline(transaction=True) as tx:
+            # Write back only if no invalidation happened since the read above
+            await tx.watch(_generation_key(user_id))
+            if await tx.get(_generation_key(user_id)) != generation:
+                return friends
+            tx.multi()
+            tx.delete(_key(user_id))
+            tx.sadd(_key(user_id), _SENTINEL, *friends)
+            tx.expire(_key(user_id), settings.FRIEND_CACHE_TTL_SECONDS)
+            await tx.execute()
+    except WatchError:
+        return friends
+    except Exception:
+        logger.debug("Friend cache: Redis write failed", exc_info=True)
+    _local_put(user_id, friends)
+    return friends
+
+
+async def fan_out_recipients(db: AsyncSession, user_id: int, *extra: int) -> List[str]:
+    """WS channels for a user, their friends and any extra users"""
+    friends = await get_friend_ids(db, user_id)
+    return [str(uid) for uid in dict.fromkeys((user_id, *friends, *extra))]
+
+
+async def invalidate_friends(user_ids: Iterable[int]) -> None:
+    """Drop cached friend sets (call after committing friendship changes)"""
+    user_ids = list(user_ids)
+    for user_id in user_ids:
+        _local.pop(user_id, None)
+    try:
+        r = await get_redis()
+        async with r.pipeline(transaction=True) as tx:
+            for user_id in user_ids:
+                # A fresh generation makes any load in flight skip its write-back
+                tx.set(_generation_key(user_id), uuid.uuid4().hex, ex=settings.FRIEND_CACHE_TTL_SECONDS * 2)
+                tx.delete(_key(user_id))
+            await tx.execute()
+    except Exception:
+        logger.warning("Friend cache: failed to invalidate users %s", user_ids, exc_info=True)
@@ -0,0 +1,128 @@
+"""
+In-process metrics in the Prometheus text format
+
+Counters, gauges and histograms with optional labels, rendered by
+GET /metrics. Values are per worker process (like everything in memory
+here); scrape each worker or sum them in Prometheus. /metrics is not
+proxied by nginx, so it's reachable from the internal network only.
+"""
+import bisect
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+_registry: List["_Metric"] = []
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), register: bool = True):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        if register:
+            _registry.append(self)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonic counter"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), register: bool = True):
+        super().__init__(name, help, labels, register)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def samples(self) -> Iterable[str]:
+        for values, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, values)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """Value read at scrape time from a callback ({label values: value} with labels)"""
+
+    kind = "gauge"
+
+    def __init__(
+        self, name: str, help: str, collect: Callable[[], object],
+        labels: Sequence[str] = (), register: bool = True,
+    ):
+        super().__init__(name, help, labels, register)
+        self._collect = collect
+
+    def samples(self) -> Iterable[str]:
+        collected = self._collect()
+        items = collected.items() if isinstance(collected, dict) else [((), collected)]
+        for values, value in sorted(items):
+            values = values if isinstance(values, tuple) else (values,)
+            yield f"{self.name}{_format_labels(self.labels, values)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets"""
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help: str, buckets: Sequence[float],
+        labels: Sequence[str] = (), register: bool = True,
+    ):
+        super().__init__(name, help, labels, register)
+        self.buckets = sorted(buckets)
+        # label values -> (per-bucket counts incl. +Inf, sum)
+        self._data: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        data = self._data.get(label_values)
+        if data is None:
+            data = self._data[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+        data[0][bisect.bisect_left(self.buckets, value)] += 1
+        data[1][0] += value
+
+    def count(self, *label_values: str) -> int:
+        data = self._data.get(label_values)
+        return sum(data[0]) if data else 0
+
+    def samples(self) -> Iterable[str]:
+        for values, (counts, total) in sorted(self._data.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + [math.inf], counts):
+                cumulative += n
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, values)} {_format_value(total[0])}"
+            yield f"{self.name}_count{_format_labels(self.labels, values)} {cumulative}"
+
+
+def render(metrics: Optional[Iterable[_Metric]] = None) -> str:
+    """All registered metrics in the Prometheus text exposition format"""
+    return "\n".join(m.render() for m in (metrics if metrics is not None else _registry)) + "\n"
@@ -1,30 +1,234 @@
-"""Rate limiting via Redis"""
-from app.services.verification import get_redis
+"""
+Rate limiting via Redis
+
+Every check is one atomic Lua script (a single EVALSHA round trip) that uses
+the Redis server clock, so counters can't be left without a TTL and workers
+with skewed clocks agree on the windows. Two algorithms:
+
+- "sliding": sliding-window counter (current + weighted previous window)
+- "bucket": token bucket, `limit` tokens per `window`, bursts up to `burst`
+
+Routes declare limits with `Depends(rate_limit(...))`. Clients that are
+already over a limit are rejected from a local cache until their Retry-After
+passes, without asking Redis again.
+"""
+import logging
+import math
+import time
+from typing import Dict, NamedTuple, Optional
+
+from fastapi import HTTPException, Request, Response, status
+
+from app.core.config import settings
+from app.core.security import decode_access_token
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
 
 LOGIN_MAX_ATTEMPTS = 5
 LOGIN_WINDOW_SEC = 900  # 15 min
 REGISTER_MAX_ATTEMPTS = 5
 REGISTER_WINDOW_SEC = 3600  # 1 hour
 
+# KEYS[1] = state hash; ARGV = limit, window_ms, cost
+# Returns {allowed, remaining, retry_after_ms}
+SLIDING_WINDOW_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local id = math.floor(now / window)
+
+local state = redis.call('HMGET', KEYS[1], 'w', 'c', 'p')
+local w = tonumber(state[1]) or id
+local c = tonumber(state[2]) or 0
+local p = tonumber(state[3]) or 0
+if w ~= id then
+  if w == id - 1 then p = c else p = 0 end
+  c = 0
+end
+
+local elapsed = now - id * window
+local weighted = p * (window - elapsed) / window + c
+if weighted + cost > limit then
+  local retry
+  if c + cost <= limit and p > 0 then
+    -- wait until enough of the previous window has slid out
+    retry = (window - elapsed) - (limit - cost - c) * window / p
+  elseif c > 0 then
+    -- not even the current window fits: wait for the next one
+    retry = (window - elapsed) + math.max(0, window * (1 - (limit - cost) / c))
+  else
+    retry = window - elapsed
+  end
+  redis.call('HSET', KEYS[1], 'w', id, 'c', c, 'p', p)
+  redis.call('PEXPIRE', KEYS[1], window * 2)
+  return {0, 0, math.max(1, math.ceil(retry))}
+end
+
+c = c + cost
+redis.call('HSET', KEYS[1], 'w', id, 'c', c, 'p', p)
+redis.call('PEXPIRE', KEYS[1], window * 2)
+return {1, math.floor(limit - weighted - cost), 0}
+"""
+
+# KEYS[1] = state hash; ARGV = limit, window_ms, cost, burst
+TOKEN_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local rate = tonumber(ARGV[1]) / tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local burst = tonumber(ARGV[4])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local retry = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+else
+  retry = math.max(1, math.ceil((cost - tokens) / rate))
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate) + 1000)
+return {allowed, math.floor(tokens), retry}
+"""
+
+ALGORITHMS = ("sliding", "bucket")
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    remaining: int
+    retry_after: float  # seconds, 0 when allowed
+
+
+_scripts: Dict[str, object] = {}
+_scripts_client = None
+# key -> monotonic time until which the key is known to be over its limit
+_blocked: Dict[str, float] = {}
+_BLOCKED_MAX = 10000
+
+
+def _script(r, algorithm: str):
+    """Script objects (EVALSHA with automatic SCRIPT LOAD) for a client"""
+    global _scripts_client
+    if _scripts_client is not r:
+        _scripts.clear()
+        _scripts_client = r
+    script = _scripts.get(algorithm)
+    if script is None:
+        source = SLIDING_WINDOW_LUA if algorithm == "sliding" else TOKEN_BUCKET_LUA
+        script = _scripts[algorithm] = r.register_script(source)
+    return script
+
+
+async def hit(
+    key: str,
+    limit: int,
+    window: float,
+    algorithm: str = "sliding",
+    cost: int = 1,
+    burst: Optional[int] = None,
+) -> RateLimitResult:
+    """Count one request against `key` and tell whether it is allowed.
+
+    Fails open (allows the request) when Redis is unavailable.
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+    if not settings.RATE_LIMIT_ENABLED:
+        return RateLimitResult(True, limit, 0)
+
+    now = time.monotonic()
+    blocked_until = _blocked.get(key)
+    if blocked_until is not None:
+        if blocked_until > now:
+            return RateLimitResult(False, 0, blocked_until - now)
+        del _blocked[key]
+
+    window_ms = max(1, int(window * 1000))
+    args = [limit, window_ms, cost]
+    if algorithm == "bucket":
+        args.append(burst or limit)
+    try:
+        r = await get_redis()
+        allowed, remaining, retry_ms = await _script(r, algorithm)(keys=[f"rate:{key}"], args=args)
+    except Exception:
+        logger.warning("Rate limit check failed for %s, allowing request", key, exc_info=True)
+        return RateLimitResult(True, limit, 0)
+
+    if allowed:
+        return RateLimitResult(True, max(0, int(remaining)), 0)
+    retry_after = int(retry_ms) / 1000
+    if len(_blocked) >= _BLOCKED_MAX:
+        _blocked.clear()
+    _blocked[key] = now + retry_after
+    return RateLimitResult(False, 0, retry_after)
+
+
+async def reset(key: str) -> None:
+    _blocked.pop(key, None)
+    try:
+        r = await get_redis()
+        await r.delete(f"rate:{key}")
+    except Exception:
+        logger.warning("Failed to reset rate limit for %s", key, exc_info=True)
+
+
+def client_key(request: Request) -> str:
+    """Who is making the request: user id, guest session or IP address"""
+    auth = request.headers.get("authorization") or ""
+    if auth[:7].lower() == "bearer ":
+        claims = decode_access_token(auth[7:])
+        if claims is not None:
+            return f"user:{claims.subject}"
+    guest = request.headers.get("X-Guest-Session-Token") or request.cookies.get("guest_session_token")
+    if guest:
+        return f"guest:{guest}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def rate_limit(
+    name: str,
+    limit: int,
+    window: float,
+    algorithm: str = "sliding",
+    burst: Optional[int] = None,
+):
+    """Route dependency: `dependencies=[Depends(rate_limit("search", 30, 60))]`"""
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+
+    async def dependency(request: Request, response: Response) -> None:
+        result = await hit(f"{name}:{client_key(request)}", limit, window, algorithm, burst=burst)
+        if not result.allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Слишком много запросов. Попробуйте позже.",
+                headers={"Retry-After": str(max(1, math.ceil(result.retry_after)))},
+            )
+        response.headers["X-RateLimit-Limit"] = str(limit)
+        response.headers["X-RateLimit-Remaining"] = str(result.remaining)
+
+    return dependency
+
 
 async def check_login_rate(identifier: str) -> bool:
-    r = await get_redis()
-    key = f"rate:login:{identifier}"
-    count = await r.incr(key)
-    if count == 1:
-        await r.expire(key, LOGIN_WINDOW_SEC)
-    return count <= LOGIN_MAX_ATTEMPTS
+    result = await hit(f"login:{identifier}", LOGIN_MAX_ATTEMPTS, LOGIN_WINDOW_SEC)
+    return result.allowed
 
 
 async def reset_login_rate(identifier: str) -> None:
-    r = await get_redis()
-    await r.delete(f"rate:login:{identifier}")
+    await reset(f"login:{identifier}")
 
 
 async def check_register_rate(identifier: str) -> bool:
-    r = await get_redis()
-    key = f"rate:register:{identifier}"
-    count = await r.incr(key)
-    if count == 1:
-        await r.expire(key, REGISTER_WINDOW_SEC)
-    return count <= REGISTER_MAX_ATTEMPTS
+    result = await hit(f"register:{identifier}", REGISTER_MAX_ATTEMPTS, REGISTER_WINDOW_SEC)
+    return result.allowed
@@ -0,0 +1,15 @@
+"""
+Real-time delivery over WebSockets.
+
+ConnectionManager holds this worker's sockets. With WS_BACKPLANE=redis
+messages go through Redis pub/sub, so they reach sockets on any worker.
+"""
+
+from app.services.realtime.connection import Connection
+from app.services.realtime.manager import ConnectionManager, manager
+
+__all__ = [
+    "Connection",
+    "ConnectionManager",
+    "manager",
+]
@@ -0,0 +1,122 @@
+"""
+Redis pub/sub backplane
+
+Each client_id has its own Redis channel. A worker subscribes only to the
+channels it holds sockets for, so a message published by any worker reaches
+exactly the workers that can deliver it.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Set
+
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "ws:"
+
+
+class RedisBackplane:
+    """Pub/sub transport between workers; calls on_message(client_id, message)"""
+
+    def __init__(self, on_message: Callable[[str, str], Awaitable[None]]):
+        self._on_message = on_message
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._channels: Set[str] = set()
+
+    async def publish(self, client_id: str, message: str) -> None:
+        r = await get_redis()
+        await r.publish(CHANNEL_PREFIX + client_id, message)
+
+    async def publish_many(self, client_ids: List[str], message: str) -> None:
+        """Publish one message to several channels in a single round trip"""
+        if len(client_ids) == 1:
+            await self.publish(client_ids[0], message)
+            return
+        r = await get_redis()
+        async with r.pipeline(transaction=False) as pipe:
+            for client_id in client_ids:
+                pipe.publish(CHANNEL_PREFIX + client_id, message)
+            await pipe.execute()
+
+    async def subscribe(self, client_id: str) -> None:
+        self._channels.add(client_id)
+        try:
+            await self._get_pubsub()
+            await self._pubsub.subscribe(CHANNEL_PREFIX + client_id)
+        except Exception:
+            # The listener retries until Redis is back
+            logger.warning("WS backplane: subscribe to %s failed", client_id, exc_info=True)
+        self._ensure_listener()
+
+    async def unsubscribe(self, client_id: str) -> None:
+        self._channels.discard(client_id)
+        if self._pubsub is None:
+            return
+        try:
+            await self._pubsub.unsubscribe(CHANNEL_PREFIX + client_id)
+        except Exception:
+            logger.debug("WS backplane: unsubscribe from %s failed", client_id, exc_info=True)
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.aclose()
+            except Exception:
+                logger.debug("WS backplane: close failed", exc_info=True)
+            self._pubsub = None
+        self._channels.clear()
+
+    async def _get_pubsub(self):
+        if self._pubsub is None:
+            r = await get_redis()
+            self._pubsub = r.pubsub(ignore_subscribe_messages=True)
+        return self._pubsub
+
+    def _ensure_listener(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _resubscribe(self) -> None:
+        """Subscribe to channels whose SUBSCRIBE never made it to Redis"""
+        pubsub = await self._get_pubsub()
+        subscribed = {str(ch) for ch in pubsub.channels}
+        missing = [CHANNEL_PREFIX + c for c in self._channels if CHANNEL_PREFIX + c not in subscribed]
+        if missing:
+            await pubsub.subscribe(*missing)
+
+    async def _listen(self) -> None:
+        backoff = 0.5
+        while True:
+            try:
+                if self._pubsub is None or self._pubsub.connection is None:
+                    await self._resubscribe()
+                    if self._pubsub.connection is None:
+                        await asyncio.sleep(1.0)  # nothing to listen to yet
+                        continue
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                backoff = 0.5
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # redis-py reconnects and re-subscribes on the next read
+                logger.warning("WS backplane: Redis error, retrying in %.1fs", backoff, exc_info=True)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 10)
+                try:
+                    await self._resubscribe()
+                except Exception:
+                    pass
+                continue
+            if message is None or message.get("type") != "message":
+                continue
+            client_id = message["channel"][len(CHANNEL_PREFIX):]
+            try:
+                await self._on_message(client_id, message["data"])
+            except Exception:
+                logger.exception("WS backplane: delivery to %s failed", client_id)
@@ -0,0 +1,99 @@
+"""
+Event coalescing for busy channels
+
+Events for a channel are buffered for WS_COALESCE_WINDOW_MS and sent as one
+frame: the event itself if it is alone, otherwise
+`{"type": "batch", "events": [...]}`. Superseded events are dropped while
+buffered: a newer update or reservation change of the same item replaces the
+older one, and a deletion removes everything buffered about that item.
+"""
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Dict, List, Set
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_RESERVATION_ACTIONS = {"item_reserved", "item_unreserved"}
+
+
+def merge_event(buffer: List[dict], event: dict) -> None:
+    """Add an event to a channel buffer, dropping what it supersedes"""
+    item_id = event.get("item_id")
+    action = event.get("action")
+    if item_id is None:
+        buffer.append(event)
+        return
+
+    same_item = [e for e in buffer if e.get("item_id") == item_id]
+    if action == "item_deleted":
+        created_here = any(e.get("action") == "item_created" for e in same_item)
+        buffer[:] = [e for e in buffer if e.get("item_id") != item_id]
+        if not created_here:  # viewers never saw it otherwise
+            buffer.append(event)
+        return
+    if action == "item_updated":
+        for e in same_item:
+            if e.get("action") == "item_created":
+                e.update({k: v for k, v in event.items() if k != "action"})
+                return
+        buffer[:] = [e for e in buffer if not (e.get("item_id") == item_id and e.get("action") == action)]
+    elif action in _RESERVATION_ACTIONS:
+        buffer[:] = [
+            e for e in buffer
+            if not (e.get("item_id") == item_id and e.get("action") in _RESERVATION_ACTIONS)
+        ]
+    buffer.append(event)
+
+
+class EventCoalescer:
+    """Buffers events per channel; calls send(message, channel) once per window"""
+
+    def __init__(self, send: Callable[[str, str], Awaitable[None]]):
+        self._send = send
+        self._buffers: Dict[str, List[dict]] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+        self._flushing: Set[asyncio.Task] = set()
+
+    def add(self, channel: str, event: dict) -> None:
+        """Buffer an event (never waits)"""
+        buffer = self._buffers.setdefault(channel, [])
+        merge_event(buffer, event)
+        if settings.WS_COALESCE_WINDOW_MS <= 0 or len(buffer) >= settings.WS_COALESCE_MAX_EVENTS:
+            timer = self._timers.pop(channel, None)
+            if timer is not None:
+                timer.cancel()
+            task = asyncio.create_task(self.flush(channel))
+            self._flushing.add(task)
+            task.add_done_callback(self._flushing.discard)
+        elif channel not in self._timers:
+            self._timers[channel] = asyncio.create_task(self._flush_later(channel))
+
+    async def flush(self, channel: str) -> None:
+        events = self._buffers.pop(channel, None)
+        if not events:
+            return
+        frame = events[0] if len(events) == 1 else {"type": "batch", "events": events}
+        try:
+            await self._send(json.dumps(frame), channel)
+        except Exception:
+            logger.exception("WS: failed to send coalesced events to %s", channel)
+
+    async def close(self) -> None:
+        """Send everything still buffered"""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for channel in list(self._buffers):
+            await self.flush(channel)
+        await asyncio.gather(*self._flushing, return_exceptions=True)
+
+    async def _flush_later(self, channel: str) -> None:
+        try:
+            await asyncio.sleep(settings.WS_COALESCE_WINDOW_MS / 1000)
+        except asyncio.CancelledError:
+            return
+        self._timers.pop(channel, None)
+        await self.flush(channel)
@@ -0,0 +1,217 @@
+"""
+One WebSocket connection with its own outbound queue
+
+Messages are queued without waiting and written by a per-connection task, so
+a slow client never blocks whoever triggered the event. When the queue is
+full the WS_OVERFLOW_POLICY decides what happens:
+
+- "drop": discard the oldest queued message
+- "coalesce": replace a queued message about the same thing (same type,
+  action, wishlist and item), otherwise discard the oldest
+- "disconnect": close the connection (code 1013, client reconnects later)
+
+A connection listens on one or more channels. Multiplexed connections
+(`mux=True`) get every frame wrapped as `{"channel": ..., "data": ...}` so
+the client can tell the channels apart. Binary connections (msgpack
+subprotocol) get the same frames msgpack-encoded (see encoding.py).
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional, Set, Union
+
+from fastapi import WebSocket
+
+from app.core.config import settings
+from app.services.realtime import metrics
+from app.services.realtime.encoding import Frame
+from app.services.realtime.history import frame_seq
+
+logger = logging.getLogger(__name__)
+
+WS_TRY_AGAIN_LATER = 1013
+_COALESCE_FIELDS = ("type", "action", "wishlist_id", "item_id")
+
+
+
+def coalesce_key(message: str, channel: Optional[str] = None) -> Optional[tuple]:
+    """What a message is about; messages with equal keys supersede each other"""
+    try:
+        data = json.loads(message)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("type") in (None, "batch", "resync"):
+        return None
+    return (channel,) + tuple(data.get(field) for field in _COALESCE_FIELDS)
+
+
+class Connection:
+    """A socket, its bounded send queue and the writer task draining it"""
+
+    # Thousands of these per worker: no per-instance __dict__
+    __slots__ = (
+        "websocket", "client_id", "channels", "mux", "binary", "user_id",
+        "dropped", "closed", "close_reason", "last_seen", "heartbeat_slot",
+        "_close_code", "_on_close", "_queue", "_ready", "_slow", "_paused", "_writer",
+    )
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        client_id: str,
+        on_close: Callable[["Connection"], Awaitable[None]],
+        mux: bool = False,
+        user_id: Optional[str] = None,
+        binary: bool = False,
+    ):
+        self.websocket = websocket
+        # Label for logs: the channel of a single-channel socket, or "mux:<user>"
+        self.client_id = client_id
+        self.channels: Set[str] = set()
+        self.mux = mux
+        self.binary = binary
+        # Authenticated owner, for the per-user connection limit
+        self.user_id = user_id
+        self.dropped = 0
+        self.closed = False
+        # Why the server closed it ("idle", "limit", "overflow", "send_failed")
+        self.close_reason: Optional[str] = None
+        self.last_seen = time.monotonic()
+        self.heartbeat_slot: Optional[int] = None
+        self._close_code = WS_TRY_AGAIN_LATER
+        self._on_close = on_close
+        self._queue: Deque[Frame] = deque()
+        self._ready = asyncio.Event()
+        self._slow = False
+        # While paused, frames queue up but aren't written (replay in progress)
+        self._paused = False
+        self._writer = asyncio.create_task(self._write_loop())
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, message: Union[str, Frame], channel: Optional[str] = None) -> bool:
+        """Queue a message without waiting; False if it was not queued.
+
+        Pass the same Frame to every socket of a broadcast so it's encoded once.
+        """
+        if self.closed:
+            return False
+        entry = message if isinstance(message, Frame) else Frame(message, channel)
+        limit = settings.WS_SEND_QUEUE_SIZE
+        if len(self._queue) >= limit:
+            if not self._overflow(entry):
+                return False
+        else:
+            self._queue.append(entry)
+        if not self._slow and len(self._queue) >= limit * 3 // 4:
+            self._slow = True
+            logger.warning(
+                "WS: slow consumer on client_id=%s (%d queued)", self.client_id, len(self._queue)
+            )
+        self._ready.set()
+        return True
+
+    def touch(self) -> None:
+        """The client sent something: it's alive"""
+        self.last_seen = time.monotonic()
+
+    def close(self, code: int = WS_TRY_AGAIN_LATER, reason: str = "") -> None:
+        """Close from the server side once the writer gets to it"""
+        if self.closed:
+            return
+        self.closed = True
+        self.close_reason = reason or None
+        self._close_code = code
+        self._ready.set()
+
+    def pause(self) -> None:
+        """Hold queued frames back until resume() (replay in progress)"""
+        self._paused = True
+
+    def resume(self, channel: str, replayed: List[str], last_seq: Optional[int] = None) -> None:
+        """Start writing: replayed frames of a channel first, then live frames.
+
+        Live frames of that channel up to last_seq are already in the replay
+        and get dropped; frames of other channels are kept as they are.
+        """
+        live = list(self._queue)
+        if last_seq is not None:
+            live = [
+                f for f in live
+                if f.channel != channel or (frame_seq(f.text) or last_seq + 1) > last_seq
+            ]
+        self._queue = deque([Frame(m, channel) for m in replayed] + live)
+        self._paused = False
+        self._ready.set()
+
+    def _overflow(self, entry: Frame) -> bool:
+        policy = settings.WS_OVERFLOW_POLICY
+        if policy == "disconnect":
+            logger.warning("WS: disconnecting slow consumer on client_id=%s", self.client_id)
+            self.close(WS_TRY_AGAIN_LATER, reason="overflow")
+            return False
+        if policy == "coalesce":
+            key = coalesce_key(entry.text, entry.channel)
+            if key is not None:
+                for i, queued in enumerate(self._queue):
+                    if coalesce_key(queued.text, queued.channel) == key:
+                        del self._queue[i]
+                        self._queue.append(entry)
+                        self.dropped += 1
+                        metrics.DROPPED.inc()
+                        return True
+        self._queue.popleft()
+        self._queue.append(entry)
+        self.dropped += 1
+        metrics.DROPPED.inc()
+        return True
+
+    def stop(self) -> None:
+        """Stop the writer (the socket itself is closed by its endpoint)"""
+        self.closed = True
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    async def join(self) -> None:
+        """Wait until the writer task has finished"""
+        await asyncio.gather(self._writer, return_exceptions=True)
+
+    async def _write_loop(self) -> None:
+        try:
+            while True:
+                while (self._paused or not self._queue) and not self.closed:
+                    self._ready.clear()
+                    await self._ready.wait()
+                if self.closed:
+                    await self._close_socket(self._close_code)
+                    break
+                frame = self._queue.popleft()
+                if self._slow and len(self._queue) < settings.WS_SEND_QUEUE_SIZE // 2:
+                    self._slow = False
+                data = frame.encode(self.binary, self.mux)
+                send = self.websocket.send_bytes(data) if self.binary else self.websocket.send_text(data)
+                started = time.perf_counter()
+                try:
+                    await asyncio.wait_for(send, settings.WS_SEND_TIMEOUT)
+                except Exception:
+                    logger.info("WS: dropping dead connection for client_id=%s", self.client_id)
+                    self.closed = True
+                    self.close_reason = "send_failed"
+                    await self._close_socket(WS_TRY_AGAIN_LATER)
+                    break
+                metrics.SEND_SECONDS.observe(time.perf_counter() - started)
+                metrics.MESSAGES_SENT.inc()
+        except asyncio.CancelledError:
+            return
+        self._queue.clear()
+        await self._on_close(self)
+
+    async def _close_socket(self, code: int) -> None:
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
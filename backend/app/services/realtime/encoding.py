@@ -0,0 +1,79 @@
+"""
+Outgoing frames and their wire formats
+
+A Frame is one message for one channel, shared by every socket it goes to.
+Each wire form (JSON text or msgpack, bare or in the mux envelope) is built
+at most once per frame, so a broadcast costs one encoding per format, not
+one per recipient.
+
+msgpack is optional: clients ask for it with
+`Sec-WebSocket-Protocol: msgpack` and get binary frames; without the
+package installed the subprotocol is simply not offered.
+"""
+import json
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+from app.core.config import settings
+
+# Try msgpack — optional dependency
+try:
+    import msgpack
+except ImportError:
+    msgpack = None  # type: ignore[assignment]
+
+MSGPACK_SUBPROTOCOL = "msgpack"
+
+Wire = Union[str, bytes]
+
+
+def negotiate(offered: Sequence[str]) -> Optional[str]:
+    """Subprotocol to accept from the client's Sec-WebSocket-Protocol list"""
+    if msgpack is not None and settings.WS_MSGPACK_ENABLED and MSGPACK_SUBPROTOCOL in offered:
+        return MSGPACK_SUBPROTOCOL
+    return None
+
+
+def envelope(channel: str, frame: str) -> str:
+    """Wrap a channel frame for a multiplexed connection without re-encoding it"""
+    if not frame.startswith(("{", "[")):
+        frame = json.dumps(frame)
+    return '{"channel":' + json.dumps(channel) + ',"data":' + frame + '}'
+
+
+def _pack(text: str) -> bytes:
+    try:
+        value = json.loads(text)
+    except ValueError:
+        value = text
+    return msgpack.packb(value, use_bin_type=True)
+
+
+class Frame:
+    """One message for a channel (None for connection-level frames like pong)"""
+
+    __slots__ = ("text", "channel", "_wire")
+
+    def __init__(self, text: str, channel: Optional[str] = None):
+        self.text = text
+        self.channel = channel
+        self._wire: Dict[Tuple[bool, bool], Wire] = {}
+
+    def encode(self, binary: bool = False, wrapped: bool = False) -> Wire:
+        """Wire form of the frame; wrapped = mux envelope (channel frames only)"""
+        wrapped = wrapped and self.channel is not None
+        key = (binary, wrapped)
+        wire = self._wire.get(key)
+        if wire is not None:
+            return wire
+        if not binary:
+            wire = envelope(self.channel, self.text) if wrapped else self.text
+        elif wrapped:
+            # fixmap of 2 entries; the packed payload is reused as is
+            wire = (
+                b"\x82" + msgpack.packb("channel") + msgpack.packb(self.channel)
+                + msgpack.packb("data") + self.encode(binary=True)
+            )
+        else:
+            wire = _pack(self.text)
+        self._wire[key] = wire
+        return wire
@@ -0,0 +1,88 @@
+"""
+Server-driven heartbeat for WebSocket connections
+
+All connections of a worker sit in one hashed timer wheel: a single task
+visits one slot every WS_HEARTBEAT_INTERVAL / slots seconds, so each
+connection is checked about once per interval without a task of its own.
+A connection that has been silent for WS_HEARTBEAT_INTERVAL gets
+`{"type": "ping"}` (clients answer with any frame, e.g. pong); one silent for
+WS_IDLE_TIMEOUT is closed.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import List, Optional, Set
+
+from app.core.config import settings
+from app.services.realtime.connection import Connection
+
+logger = logging.getLogger(__name__)
+
+_SLOTS = 32
+WS_GOING_AWAY = 1001
+PING_FRAME = json.dumps({"type": "ping"})
+
+
+class Heartbeat:
+    """Timer wheel of connections; pings the quiet ones, closes the idle ones"""
+
+    def __init__(self, slots: int = _SLOTS):
+        self._wheel: List[Set[Connection]] = [set() for _ in range(slots)]
+        self._cursor = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return sum(len(slot) for slot in self._wheel)
+
+    def add(self, connection: Connection) -> None:
+        if settings.WS_HEARTBEAT_INTERVAL <= 0:
+            return
+        # The slot just behind the cursor: first visited a full turn from now
+        slot = (self._cursor - 1) % len(self._wheel)
+        self._wheel[slot].add(connection)
+        connection.heartbeat_slot = slot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def discard(self, connection: Connection) -> None:
+        if connection.heartbeat_slot is not None:
+            self._wheel[connection.heartbeat_slot].discard(connection)
+            connection.heartbeat_slot = None
+
+    def tick(self, now: Optional[float] = None) -> None:
+        """Check the connections of the current slot and move on"""
+        now = time.monotonic() if now is None else now
+        slot = self._wheel[self._cursor]
+        self._cursor = (self._cursor + 1) % len(self._wheel)
+        for connection in list(slot):
+            if connection.closed:
+                slot.discard(connection)
+                connection.heartbeat_slot = None
+                continue
+            silent = now - connection.last_seen
+            if settings.WS_IDLE_TIMEOUT > 0 and silent >= settings.WS_IDLE_TIMEOUT:
+                logger.info("WS: closing idle connection client_id=%s (%.0fs silent)", connection.client_id, silent)
+                slot.discard(connection)
+                connection.heartbeat_slot = None
+                connection.close(WS_GOING_AWAY, reason="idle")
+            elif silent >= settings.WS_HEARTBEAT_INTERVAL:
+                connection.enqueue(PING_FRAME)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for slot in self._wheel:
+            for connection in slot:
+                connection.heartbeat_slot = None
+            slot.clear()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.WS_HEARTBEAT_INTERVAL / len(self._wheel))
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("WS: heartbeat tick failed")
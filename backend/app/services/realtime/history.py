@@ -0,0 +1,117 @@
+"""
+Per-channel event history for resumable WebSocket sessions
+
+Every frame sent to a channel gets the next sequence number of that channel
+(`"seq": N`) and is kept in a capped Redis stream. A client that reconnects
+with `?since=N` is replayed what it missed; if that part of the history is
+gone it receives `{"type": "resync", "seq": <current>}` and should refetch.
+
+Numbering, storing and publishing (backplane mode) happen in one Lua call,
+so all workers see a channel's frames in sequence order.
+"""
+import json
+import logging
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# KEYS = seq counter, stream
+# ARGV = message, maxlen, ttl, publish channel ("" = none), counter ttl
+_RECORD_LUA = """
+local seq = redis.call('INCR', KEYS[1])
+local frame = string.sub(ARGV[1], 1, -2) .. ',"seq":' .. seq .. '}'
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[2], seq .. '-0', 'm', frame)
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+-- The counter outlives the history and any connection that saw it, so a
+-- restarted sequence only reaches clients that get a resync anyway
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+if ARGV[4] ~= '' then
+  redis.call('PUBLISH', ARGV[4], frame)
+end
+return frame
+"""
+
+# KEYS = seq counter, stream; ARGV = since
+# Returns {ok, current, frame...}; ok = 0 when the gap can't be filled
+_REPLAY_LUA = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local since = tonumber(ARGV[1])
+if since > current then
+  return {0, current}
+end
+local result = {1, current}
+if since == current then
+  return result
+end
+local entries = redis.call('XRANGE', KEYS[2], (since + 1) .. '-0', '+')
+if #entries == 0 or tonumber(string.match(entries[1][1], '^%d+')) ~= since + 1 then
+  return {0, current}
+end
+for _, entry in ipairs(entries) do
+  table.insert(result, entry[2][2])
+end
+return result
+"""
+
+_scripts = {}
+
+
+def enabled() -> bool:
+    return settings.WS_HISTORY_SIZE > 0
+
+
+def _keys(channel: str) -> List[str]:
+    return [f"ws:seq:{channel}", f"ws:history:{channel}"]
+
+
+def _script(r, name: str):
+    script = _scripts.get(name)
+    if script is None or script.registered_client is not r:
+        script = _scripts[name] = r.register_script(_RECORD_LUA if name == "record" else _REPLAY_LUA)
+    return script
+
+
+async def record(channels: List[str], message: str, publish_prefix: Optional[str] = None) -> List[str]:
+    """Number and store a message on each channel; returns the frames.
+
+    With `publish_prefix` every frame is also published to
+    `publish_prefix + channel` in the same step.
+    """
+    r = await get_redis()
+    script = _script(r, "record")
+    async with r.pipeline(transaction=False) as pipe:
+        for channel in channels:
+            publish_to = publish_prefix + channel if publish_prefix is not None else ""
+            await script(
+                keys=_keys(channel),
+                args=[
+                    message,
+                    settings.WS_HISTORY_SIZE,
+                    settings.WS_HISTORY_TTL_SECONDS,
+                    publish_to,
+                    settings.WS_SEQ_TTL_SECONDS + settings.WS_HISTORY_TTL_SECONDS,
+                ],
+                client=pipe,
+            )
+        return await pipe.execute()
+
+
+async def replay(channel: str, since: int) -> Tuple[Optional[List[str]], int]:
+    """Frames after `since` and the current seq; (None, seq) if a resync is needed"""
+    r = await get_redis()
+    ok, current, *frames = await _script(r, "replay")(keys=_keys(channel), args=[since])
+    return (frames if ok else None), int(current)
+
+
+def resync_frame(current: int) -> str:
+    return json.dumps({"type": "resync", "seq": current})
+
+
+def frame_seq(frame: str) -> Optional[int]:
+    try:
+        return json.loads(frame).get("seq")
+    except (TypeError, ValueError, AttributeError):
+        return None
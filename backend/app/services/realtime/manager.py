@@ -0,0 +1,223 @@
+"""
+WebSocket connection manager
+
+Channels are keyed by client_id: a user id for personal updates, or
+`share_<token>` for viewers of a shared wishlist. A socket is either bound to
+one channel (`/ws/{client_id}`) or multiplexed (`/ws/mux`) and subscribed to
+several; `active_connections` maps each channel to the sockets listening on
+it (see registry.py). Sending never waits for sockets: messages go into per-connection queues
+(see connection.py). Quiet sockets are pinged and idle ones closed by the
+heartbeat (see heartbeat.py).
+"""
+import logging
+import time
+from collections import Counter
+from typing import Dict, Iterable, Optional
+
+from fastapi import WebSocket
+
+from app.core.config import settings
+from app.services.realtime import history, metrics
+from app.services.realtime.backplane import CHANNEL_PREFIX, RedisBackplane
+from app.services.realtime.coalescer import EventCoalescer
+from app.services.realtime.connection import Connection
+from app.services.realtime.encoding import MSGPACK_SUBPROTOCOL, Frame
+from app.services.realtime.heartbeat import Heartbeat
+from app.services.realtime.registry import ChannelRegistry
+
+logger = logging.getLogger(__name__)
+
+WS_POLICY_VIOLATION = 1008
+
+
+class ConnectionManager:
+    """WebSocket connection manager with dead connection cleanup"""
+
+    def __init__(self, backplane: Optional[str] = None):
+        self.active_connections = ChannelRegistry()
+        mode = backplane or settings.WS_BACKPLANE
+        self.backplane = RedisBackplane(self._deliver_local) if mode == "redis" else None
+        self.events = EventCoalescer(self.send_personal_message)
+        self.heartbeat = Heartbeat()
+        # user_id -> that user's sockets, oldest first (dict as ordered set)
+        self.user_connections: Dict[str, Dict[Connection, None]] = {}
+        # Server-side closes by reason ("idle", "limit", "overflow", "send_failed")
+        self.evictions: Counter = Counter()
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        client_id: str,
+        since: Optional[int] = None,
+        user_id: Optional[str] = None,
+        subprotocol: Optional[str] = None,
+    ) -> Connection:
+        """Register a socket on one channel; with `since`, first replay the frames it missed"""
+        connection = await self.accept(websocket, client_id, user_id=user_id, subprotocol=subprotocol)
+        await self.subscribe(connection, client_id, since=since)
+        return connection
+
+    async def accept(
+        self,
+        websocket: WebSocket,
+        label: str,
+        mux: bool = False,
+        user_id: Optional[str] = None,
+        subprotocol: Optional[str] = None,
+    ) -> Connection:
+        """Accept a socket that isn't listening on any channel yet.
+
+        Over WS_MAX_CONNECTIONS_PER_USER the user's oldest socket is closed.
+        """
+        await websocket.accept(subprotocol=subprotocol)
+        connection = Connection(
+            websocket, label, on_close=self._remove, mux=mux, user_id=user_id,
+            binary=subprotocol == MSGPACK_SUBPROTOCOL,
+        )
+        self.heartbeat.add(connection)
+        if user_id is not None:
+            connections = self.user_connections.setdefault(user_id, {})
+            connections[connection] = None
+            limit = settings.WS_MAX_CONNECTIONS_PER_USER
+            if 0 < limit < len(connections):
+                for oldest in list(connections)[:-limit]:
+                    logger.info("WS: user %s over %d connections, closing the oldest", user_id, limit)
+                    oldest.close(WS_POLICY_VIOLATION, reason="limit")
+        return connection
+
+    async def subscribe(self, connection: Connection, channel: str, since: Optional[int] = None):
+        if channel in connection.channels:
+            return
+        resume = since is not None and history.enabled()
+        if resume:
+            connection.pause()
+        connection.channels.add(channel)
+        async with self.active_connections.lock(channel):
+            first = self.active_connections.add(channel, connection)
+            if first and self.backplane is not None:
+                await self.backplane.subscribe(channel)
+        if resume:
+            # Subscribed first: live frames wait in the paused queue meanwhile
+            try:
+                frames, current = await history.replay(channel, since)
+            except Exception:
+                logger.warning("WS: replay failed for channel=%s", channel, exc_info=True)
+                frames, current = None, 0
+            if frames is None:
+                connection.resume(channel, [history.resync_frame(current)])
+            else:
+                connection.resume(channel, frames, last_seq=current)
+
+    async def unsubscribe(self, connection: Connection, channel: str):
+        connection.channels.discard(channel)
+        async with self.active_connections.lock(channel):
+            if self.active_connections.discard(channel, connection):
+                await self._release(channel)
+
+    async def disconnect(self, websocket: WebSocket, client_id: str):
+        for connection in self.active_connections.get(client_id):
+            if connection.websocket is websocket:
+                await self.remove(connection)
+                return
+
+    async def remove(self, connection: Connection):
+        """Stop a connection and drop it from all of its channels"""
+        connection.stop()
+        await self._remove(connection)
+
+    async def send_personal_message(self, message: str, client_id: str):
+        """Send message to every socket of a client, on whichever worker holds it"""
+        await self.broadcast(message, [client_id])
+
+    async def broadcast(self, message: str, client_ids: Iterable[str]):
+        """Send one message to several clients without waiting for their sockets"""
+        client_ids = list(dict.fromkeys(client_ids))
+        if not client_ids:
+            return
+        started = time.perf_counter()
+        try:
+            await self._fan_out(message, client_ids)
+        finally:
+            metrics.BROADCASTS.inc()
+            metrics.FANOUT_SECONDS.observe(time.perf_counter() - started)
+
+    async def _fan_out(self, message: str, client_ids: list):
+        if history.enabled() and message.startswith("{"):
+            try:
+                prefix = CHANNEL_PREFIX if self.backplane is not None else None
+                frames = await history.record(client_ids, message, publish_prefix=prefix)
+            except Exception:
+                logger.warning("WS: history write failed, sending without seq", exc_info=True)
+            else:
+                if self.backplane is None:
+                    for client_id, frame in zip(client_ids, frames):
+                        await self._deliver_local(client_id, frame)
+                return
+        if self.backplane is not None:
+            try:
+                await self.backplane.publish_many(client_ids, message)
+                return
+            except Exception:
+                logger.warning("WS: backplane publish failed, delivering locally only", exc_info=True)
+        for client_id in client_ids:
+            await self._deliver_local(client_id, message)
+
+    def stats(self) -> dict:
+        """Local connection counts and evictions since start"""
+        return {
+            "connections": len(self.active_connections.connections()),
+            "channels": len(self.active_connections),
+            "users": len(self.user_connections),
+            "evictions": dict(self.evictions),
+        }
+
+    def publish_event(self, client_id: str, event: dict):
+        """Queue an event for a short coalescing window (see coalescer.py)"""
+        self.events.add(client_id, event)
+
+    async def close(self):
+        await self.events.close()
+        await self.heartbeat.stop()
+        connections = self.active_connections.connections()
+        self.active_connections.clear()
+        for connection in connections:
+            connection.stop()
+        for connection in connections:
+            await connection.join()
+        if self.backplane is not None:
+            await self.backplane.close()
+
+    async def _deliver_local(self, client_id: str, message: str):
+        """Queue a message on this worker's sockets of a client"""
+        connections = self.active_connections.get(client_id)
+        if not connections:
+            metrics.sampled_debug(logger, "WS: no local connection for client_id=%s", client_id)
+            return
+        frame = Frame(message, client_id)  # encoded once for all of them
+        for connection in connections:
+            connection.enqueue(frame)
+        metrics.sampled_debug(logger, "WS: queued for client_id=%s (%d sockets)", client_id, len(connections))
+
+    async def _remove(self, connection: Connection):
+        self.heartbeat.discard(connection)
+        if connection.close_reason:
+            self.evictions[connection.close_reason] += 1
+            metrics.EVICTIONS.inc(connection.close_reason)
+            connection.close_reason = None  # count once
+        user_id = connection.user_id
+        connections = self.user_connections.get(user_id) if user_id is not None else None
+        if connections and connection in connections:
+            del connections[connection]
+            if not connections:
+                del self.user_connections[user_id]
+        for channel in list(connection.channels):
+            await self.unsubscribe(connection, channel)
+
+    async def _release(self, client_id: str):
+        """Last local socket of a client is gone"""
+        if self.backplane is not None:
+            await self.backplane.unsubscribe(client_id)
+
+
+manager = ConnectionManager()
+metrics.watch(manager)
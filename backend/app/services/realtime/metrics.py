@@ -0,0 +1,69 @@
+"""
+Real-time delivery metrics (see app/services/metrics.py for the format)
+
+Hot-path logging goes through sampled_debug(): one line in
+WS_LOG_SAMPLE_EVERY, and nothing at all unless DEBUG is enabled.
+"""
+import logging
+
+from app.core.config import settings
+from app.services.metrics import Counter, Gauge, Histogram
+
+_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+BROADCASTS = Counter("ws_broadcasts_total", "Messages handed to the connection manager")
+FANOUT_SECONDS = Histogram(
+    "ws_fanout_seconds", "Time to record, publish and queue one broadcast", _LATENCY_BUCKETS
+)
+MESSAGES_SENT = Counter("ws_messages_sent_total", "Frames written to sockets")
+SEND_SECONDS = Histogram("ws_send_seconds", "Time to write one frame to a socket", _LATENCY_BUCKETS)
+DROPPED = Counter("ws_dropped_messages_total", "Queued frames dropped or replaced on overflow")
+EVICTIONS = Counter(
+    "ws_evictions_total", "Sockets closed by the server (send_failed = dead socket)", labels=("reason",)
+)
+
+_sample_counter = 0
+
+
+def channel_type(channel: str) -> str:
+    if channel.isdigit():
+        return "user"
+    if channel.startswith("share_"):
+        return "share"
+    return "other"
+
+
+def watch(manager) -> None:
+    """Export a connection manager's state as gauges (read at scrape time)"""
+
+    def subscriptions():
+        counts = {"user": 0, "share": 0, "other": 0}
+        for channel in manager.active_connections:
+            counts[channel_type(channel)] += len(manager.active_connections.get(channel))
+        return counts
+
+    def connections():
+        counts = {"single": 0, "mux": 0}
+        for connection in manager.active_connections.connections():
+            counts["mux" if connection.mux else "single"] += 1
+        return counts
+
+    def queued():
+        pending = [c.pending for c in manager.active_connections.connections()]
+        return {"total": sum(pending), "max": max(pending, default=0)}
+
+    Gauge("ws_connections", "Open sockets on this worker", connections, labels=("kind",))
+    Gauge("ws_subscriptions", "Socket subscriptions by channel type", subscriptions, labels=("channel_type",))
+    Gauge("ws_channels", "Channels with at least one local socket", lambda: len(manager.active_connections))
+    Gauge("ws_queue_depth", "Frames waiting in send queues", queued, labels=("stat",))
+
+
+def sampled_debug(logger: logging.Logger, message: str, *args) -> None:
+    """Debug-log about one call in WS_LOG_SAMPLE_EVERY"""
+    global _sample_counter
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    _sample_counter += 1
+    if _sample_counter >= settings.WS_LOG_SAMPLE_EVERY:
+        _sample_counter = 0
+        logger.debug(message, *args)
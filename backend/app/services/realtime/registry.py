@@ -0,0 +1,95 @@
+"""
+Channel -> connections index
+
+Channels are spread over WS_MANAGER_SHARDS shards by hash. A channel's
+connections are kept in an insertion-ordered dict used as a set, so adding
+and removing a socket is O(1) however many viewers a channel has. Readers
+get tuple snapshots and can await while iterating: sockets joining or
+leaving meanwhile don't affect the loop.
+
+Each shard has an asyncio lock. The manager holds it while it changes a
+channel and (un)subscribes it on the backplane, so a channel that loses its
+last socket and gains a new one at the same moment can't end up
+unsubscribed.
+"""
+import asyncio
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.realtime.connection import Connection
+
+
+class _Shard:
+    __slots__ = ("channels", "lock")
+
+    def __init__(self):
+        self.channels: Dict[str, Dict[Connection, None]] = {}
+        self.lock = asyncio.Lock()
+
+
+class ChannelRegistry:
+    """Sharded map of channel -> set of connections"""
+
+    def __init__(self, shards: Optional[int] = None):
+        self._shards: List[_Shard] = [_Shard() for _ in range(max(1, shards or settings.WS_MANAGER_SHARDS))]
+
+    def _shard(self, channel: str) -> _Shard:
+        return self._shards[hash(channel) % len(self._shards)]
+
+    def lock(self, channel: str) -> asyncio.Lock:
+        return self._shard(channel).lock
+
+    def add(self, channel: str, connection: Connection) -> bool:
+        """Add a connection; True if it's the channel's first one"""
+        channels = self._shard(channel).channels
+        connections = channels.get(channel)
+        if connections is None:
+            channels[channel] = {connection: None}
+            return True
+        connections[connection] = None
+        return False
+
+    def discard(self, channel: str, connection: Connection) -> bool:
+        """Remove a connection; True if that emptied the channel"""
+        channels = self._shard(channel).channels
+        connections = channels.get(channel)
+        if connections is None or connection not in connections:
+            return False
+        del connections[connection]
+        if connections:
+            return False
+        del channels[channel]
+        return True
+
+    def get(self, channel: str) -> Tuple[Connection, ...]:
+        """Snapshot of a channel's connections (empty if none)"""
+        connections = self._shard(channel).channels.get(channel)
+        return tuple(connections) if connections else ()
+
+    def __getitem__(self, channel: str) -> Tuple[Connection, ...]:
+        connections = self.get(channel)
+        if not connections:
+            raise KeyError(channel)
+        return connections
+
+    def __contains__(self, channel: str) -> bool:
+        return channel in self._shard(channel).channels
+
+    def __len__(self) -> int:
+        return sum(len(shard.channels) for shard in self._shards)
+
+    def __iter__(self) -> Iterator[str]:
+        """Channel names (snapshot)"""
+        return iter([channel for shard in self._shards for channel in shard.channels])
+
+    def connections(self) -> List[Connection]:
+        """Every connection once, even if it listens on several channels"""
+        unique: Dict[Connection, None] = {}
+        for shard in self._shards:
+            for connections in shard.channels.values():
+                unique.update(connections)
+        return list(unique)
+
+    def clear(self) -> None:
+        for shard in self._shards:
+            shard.channels.clear()
@@ -0,0 +1,66 @@
+"""
+Shared Redis client
+
+One connection pool per worker for everything that talks to Redis
+(verification codes, rate limits, caches, outbox journal, ...). Pool size,
+timeouts, keepalive and health checks come from settings.
+
+Batch several commands into one round trip with `pipeline()`, or run them
+atomically (MULTI/EXEC) with `transaction()`:
+
+    async with transaction() as tx:
+        tx.setex("a", 60, 1)
+        tx.incr("b")
+        await tx.execute()
+"""
+from contextlib import asynccontextmanager
+from typing import AsyncContextManager, AsyncIterator
+
+import redis.asyncio as aioredis
+from redis.asyncio.client import Pipeline
+
+from app.core.config import settings
+
+_redis = None
+
+
+def _create_client() -> aioredis.Redis:
+    pool = aioredis.ConnectionPool.from_url(
+        settings.REDIS_URL,
+        decode_responses=True,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+        socket_keepalive=settings.REDIS_SOCKET_KEEPALIVE,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+        retry_on_timeout=True,
+    )
+    return aioredis.Redis(connection_pool=pool)
+
+
+async def get_redis() -> aioredis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = _create_client()
+    return _redis
+
+
+@asynccontextmanager
+async def pipeline(transaction: bool = False) -> AsyncIterator[Pipeline]:
+    """Queue commands and send them in one round trip on `execute()`"""
+    r = await get_redis()
+    async with r.pipeline(transaction=transaction) as pipe:
+        yield pipe
+
+
+def transaction() -> AsyncContextManager[Pipeline]:
+    """Like pipeline(), but the commands run atomically (MULTI/EXEC)"""
+    return pipeline(transaction=True)
+
+
+async def close_redis():
+    global _redis
+    if _redis:
+        await _redis.aclose()
+        await _redis.connection_pool.disconnect()
+        _redis = None
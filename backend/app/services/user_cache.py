@@ -0,0 +1,139 @@
+"""Short-lived cache of authenticated users (in-process LRU + Redis)
+
+get_current_user runs on almost every request; this saves the
+`SELECT ... FROM users WHERE id = ?` round trip. Entries are compact
+snapshots of an allow-list of columns: never the password hash or
+provider ids. A hit is attached to the request's session with
+merge(load=False), so handlers can still modify and commit the user;
+handlers that return the full User schema call load_uncached() first.
+
+Endpoints that change a user must call invalidate_user() after commit.
+Other workers may keep a local copy for up to USER_CACHE_LOCAL_TTL_SECONDS.
+"""
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import DateTime, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.core.config import settings
+from app.models.user import User
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# What get_current_user callers read. Secrets and provider ids stay out of Redis
+_COLUMNS = [
+    "id", "email", "username", "full_name", "avatar_url", "email_verified",
+    "onboarding_completed", "telegram_notifications_enabled",
+    "is_active", "is_superuser", "created_at", "updated_at",
+]
+_UNCACHED = [c.key for c in User.__table__.columns if c.key not in _COLUMNS]
+_DATETIME_COLUMNS = {c.key for c in User.__table__.columns if isinstance(c.type, DateTime)} & set(_COLUMNS)
+
+# user_id -> (expires_at, snapshot)
+_local: "OrderedDict[int, tuple]" = OrderedDict()
+
+
+def _key(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def snapshot(user: User) -> dict:
+    """Column values of a user as a JSON-serializable dict"""
+    data = {}
+    for name in _COLUMNS:
+        value = getattr(user, name)
+        if name in _DATETIME_COLUMNS and value is not None:
+            value = value.isoformat()
+        data[name] = value
+    return data
+
+
+def _restore(data: dict) -> User:
+    # Entries written by older versions may still carry other columns
+    values = {name: data[name] for name in _COLUMNS if name in data}
+    for name in _DATETIME_COLUMNS:
+        if values.get(name):
+            values[name] = datetime.fromisoformat(values[name])
+    user = User(**values)
+    # Pretend it was loaded from the database (no pending changes)
+    make_transient_to_detached(user)
+    return user
+
+
+def _local_get(user_id: int) -> Optional[dict]:
+    entry = _local.get(user_id)
+    if entry is None:
+        return None
+    expires_at, data = entry
+    if expires_at < time.monotonic():
+        del _local[user_id]
+        return None
+    _local.move_to_end(user_id)
+    return data
+
+
+def _local_put(user_id: int, data: dict) -> None:
+    _local[user_id] = (time.monotonic() + settings.USER_CACHE_LOCAL_TTL_SECONDS, data)
+    _local.move_to_end(user_id)
+    while len(_local) > settings.USER_CACHE_SIZE:
+        _local.popitem(last=False)
+
+
+async def get_cached_user(db: AsyncSession, user_id: int) -> Optional[User]:
+    """Get user by id: local LRU -> Redis -> database"""
+    if settings.USER_CACHE_TTL_SECONDS <= 0:
+        result = await db.execute(select(User).where(User.id == user_id))
+        return result.scalar_one_or_none()
+
+    data = _local_get(user_id)
+    if data is None:
+        try:
+            r = await get_redis()
+            raw = await r.get(_key(user_id))
+            if raw:
+                data = json.loads(raw)
+                _local_put(user_id, data)
+        except Exception:
+            logger.debug("User cache: Redis read failed", exc_info=True)
+
+    if data is not None:
+        return await db.merge(_restore(data), load=False)
+
+    result = await db.execute(select(User).where(User.id == user_id))
+    user = result.scalar_one_or_none()
+    if user is None:
+        return None
+
+    data = snapshot(user)
+    _local_put(user_id, data)
+    try:
+        r = await get_redis()
+        await r.setex(_key(user_id), settings.USER_CACHE_TTL_SECONDS, json.dumps(data))
+    except Exception:
+        logger.debug("User cache: Redis write failed", exc_info=True)
+    return user
+
+
+async def load_uncached(db: AsyncSession, user: User) -> User:
+    """Load the columns a cached user doesn't carry (google_id, telegram ids, ...)"""
+    missing = [name for name in _UNCACHED if name in inspect(user).unloaded]
+    if missing:
+        await db.refresh(user, missing)
+    return user
+
+
+async def invalidate_user(user_id: int) -> None:
+    """Drop a user from both cache tiers (call after committing changes)"""
+    _local.pop(user_id, None)
+    try:
+        r = await get_redis()
+        await r.delete(_key(user_id))
+    except Exception:
+        logger.warning("User cache: failed to invalidate user %s", user_id, exc_info=True)
@@ -1,45 +1,46 @@
 """Verification code service using Redis"""
 import random
 import logging
-import redis.asyncio as aioredis
-from app.core.config import settings
+from app.services.redis_client import get_redis, transaction
 
 logger = logging.getLogger(__name__)
-_redis = None
 
-
-async def get_redis():
-    global _redis
-    if _redis is None:
-        _redis = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
-    return _redis
+# Compare and delete in one step, so a code can't be used twice
+_CHECK_AND_DELETE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  redis.call('DEL', KEYS[1])
+  return 1
+end
+return 0
+"""
+_check_and_delete = None
 
 
 async def generate_verification_code(email: str) -> str:
     """Generate 6-digit code and store in Redis with 10min TTL"""
     code = "".join(random.choices("0123456789", k=6))
-    r = await get_redis()
-    # Store code with 10 minute expiration
-    await r.setex(f"verify:{email}", 600, code)
-    # Track attempts (max 5 resends per hour)
-    attempts_key = f"verify_attempts:{email}"
-    await r.incr(attempts_key)
-    await r.expire(attempts_key, 3600)
-    
+    async with transaction() as tx:
+        # Store code with 10 minute expiration
+        tx.setex(f"verify:{email}", 600, code)
+        # Track attempts (max 5 resends per hour)
+        attempts_key = f"verify_attempts:{email}"
+        tx.incr(attempts_key)
+        tx.expire(attempts_key, 3600)
+        await tx.execute()
+
     logger.warning(f"🔑 VERIFICATION CODE for {email}: {code}")
     print(f"VERIFICATION_CODE {email}: {code}", flush=True)
-    
+
     return code
 
 
 async def verify_code(email: str, code: str) -> bool:
     """Verify the code and delete it if correct"""
+    global _check_and_delete
     r = await get_redis()
-    stored = await r.get(f"verify:{email}")
-    if stored and stored == code:
-        await r.delete(f"verify:{email}")
-        return True
-    return False
+    if _check_and_delete is None or _check_and_delete.registered_client is not r:
+        _check_and_delete = r.register_script(_CHECK_AND_DELETE_LUA)
+    return bool(await _check_and_delete(keys=[f"verify:{email}"], args=[code]))
 
 
 async def get_resend_attempts(email: str) -> int:
@@ -47,10 +48,3 @@ async def get_resend_attempts(email: str) -> int:
     r = await get_redis()
     attempts = await r.get(f"verify_attempts:{email}")
     return int(attempts) if attempts else 0
-
-
-async def close_redis():
-    global _redis
-    if _redis:
-        await _redis.close()
-        _redis = None
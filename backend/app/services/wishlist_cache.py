@@ -0,0 +1,163 @@
+"""Rendered-response cache for public wishlist views (Redis)
+
+The share page (guest view) and a user's wishlist lists (friend / guest
+view) are stored as the final JSON, so a popular link is served from one
+Redis round trip without touching the database or re-serializing. Owners
+always get a fresh response.
+
+Invalidation is by generation: each share token and each owner has a
+generation key, and an entry is valid only while it was rendered under the
+current generation. Endpoints that change a wishlist, its items or
+reservations call invalidate_wishlist_cache() after commit; a render that
+raced with the change is stored under the old generation and never served.
+That only holds if renders read from the primary: a replica can still show
+the old state after the generation was bumped, so endpoints fill the cache
+through app.db.routing.primary_session().
+
+On a miss only one request per worker renders; concurrent ones wait for it.
+"""
+import asyncio
+import logging
+import uuid
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from fastapi import Response, status
+
+from app.core.config import settings
+from app.services.redis_client import get_redis, pipeline
+from app.services.wishlist_version import etag_matches, set_etag
+
+logger = logging.getLogger(__name__)
+
+_NO_GENERATION = "0"
+
+# (key, generation) -> render in progress in this worker
+_inflight: Dict[str, "asyncio.Future[Rendered]"] = {}
+
+
+class Rendered(NamedTuple):
+    """A serialized response and what is needed to serve it"""
+
+    owner_id: int
+    body: str
+    etag: str = ""
+
+    def response(self, if_none_match: Optional[str] = None) -> Response:
+        if self.etag and etag_matches(if_none_match, self.etag):
+            response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(content=self.body, media_type="application/json")
+        if self.etag:
+            set_etag(response, self.etag)
+        return response
+
+
+def _share_generation(share_token: str) -> str:
+    return f"wlcache:gen:share:{share_token}"
+
+
+def _lists_generation(owner_id: int) -> str:
+    return f"wlcache:gen:lists:{owner_id}"
+
+
+def share_keys(share_token: str) -> Tuple[str, str]:
+    """(entry, generation) keys of a share page"""
+    return f"wlcache:share:{share_token}", _share_generation(share_token)
+
+
+def lists_keys(owner_id: int, view: str) -> Tuple[str, str]:
+    """(entry, generation) keys of an owner's wishlists as seen by `view`"""
+    return f"wlcache:lists:{owner_id}:{view}", _lists_generation(owner_id)
+
+
+def wishlist_cache_enabled() -> bool:
+    return settings.WISHLIST_CACHE_TTL_SECONDS > 0
+
+
+def _pack(generation: str, rendered: Rendered) -> str:
+    return f"{generation}\n{rendered.owner_id}\n{rendered.etag}\n{rendered.body}"
+
+
+def _unpack(raw: str, generation: str) -> Optional[Rendered]:
+    entry_generation, owner_id, etag, body = raw.split("\n", 3)
+    if entry_generation != generation:
+        return None
+    return Rendered(int(owner_id), body, etag)
+
+
+async def _render_once(key: str, render: Callable[[], Awaitable[Rendered]]) -> Rendered:
+    flight = _inflight.get(key)
+    if flight is not None:
+        try:
+            return await asyncio.shield(flight)
+        except asyncio.CancelledError:
+            if not flight.cancelled():
+                raise  # this request was cancelled, not the render
+            return await render()
+
+    flight = asyncio.get_running_loop().create_future()
+    # Nobody may be waiting: don't log "exception was never retrieved"
+    flight.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _inflight[key] = flight
+    try:
+        rendered = await render()
+    except asyncio.CancelledError:
+        flight.cancel()
+        raise
+    except Exception as exc:
+        flight.set_exception(exc)  # e.g. 404 / 410 for everyone waiting
+        raise
+    else:
+        flight.set_result(rendered)
+        return rendered
+    finally:
+        _inflight.pop(key, None)
+
+
+async def get_or_render(keys: Tuple[str, str], render: Callable[[], Awaitable[Rendered]]) -> Rendered:
+    """Cached response for `keys`, or render() it (once per worker) and store it"""
+    key, generation_key = keys
+    generation = None
+    try:
+        r = await get_redis()
+        generation, raw = await r.mget(generation_key, key)
+        generation = generation or _NO_GENERATION
+        if raw:
+            cached = _unpack(raw, generation)
+            if cached is not None:
+                return cached
+    except Exception:
+        logger.debug("Wishlist cache: Redis read failed", exc_info=True)
+
+    async def render_and_store() -> Rendered:
+        # Stored under the generation read *before* rendering
+        rendered = await render()
+        if generation is not None:
+            try:
+                r = await get_redis()
+                await r.set(key, _pack(generation, rendered), ex=settings.WISHLIST_CACHE_TTL_SECONDS)
+            except Exception:
+                logger.debug("Wishlist cache: Redis write failed", exc_info=True)
+        return rendered
+
+    # A render started before an invalidation can't answer requests after it
+    return await _render_once(f"{key}:{generation}", render_and_store)
+
+
+async def invalidate_wishlist_cache(owner_id: int, *share_tokens: str) -> None:
+    """Drop an owner's cached lists and the given share pages (call after commit)"""
+    if not wishlist_cache_enabled():
+        return
+    # A fresh unique generation: entries rendered before it never match again
+    generation = uuid.uuid4().hex
+    # Outlive every entry rendered under the previous generation
+    ttl = settings.WISHLIST_CACHE_TTL_SECONDS * 2 + 60
+    try:
+        async with pipeline() as pipe:
+            pipe.set(_lists_generation(owner_id), generation, ex=ttl)
+            for share_token in share_tokens:
+                if share_token:
+                    pipe.set(_share_generation(share_token), generation, ex=ttl)
+            await pipe.execute()
+    except Exception:
+        logger.warning("Wishlist cache: failed to invalidate owner %s", owner_id, exc_info=True)
@@ -0,0 +1,83 @@
+"""Wishlist summaries for list views, computed in SQL
+
+Profile and "my wishlists" pages only need per-list counters, so instead of
+loading every Item (JSON columns included) we select the wishlist columns
+plus one grouped aggregate over its items. The aggregate is restricted to
+the same wishlists as the outer query, so it never scans other users' items.
+
+The owner doesn't see reservations (they are a surprise), so owner views get
+reserved_count = None. Lists are newest first and page by (created_at, id).
+"""
+from typing import List, Optional
+
+from sqlalchemy import Select, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.item import Item
+from app.models.wishlist import Wishlist
+from app.schemas.wishlist import WishlistSummary
+from app.utils.pagination import Keyset
+
+_COLUMNS = list(Wishlist.__table__.columns)
+
+# Served by ix_wishlists_owner_created (owner_id, created_at, id)
+WISHLIST_KEYSET = Keyset(Wishlist.created_at.desc(), Wishlist.id.desc())
+
+
+def summary_query(*where, offset: Optional[int] = None, limit: Optional[int] = None) -> Select:
+    """Wishlist columns + items_count, reserved_count, total_price"""
+    page = select(Wishlist.id).where(*where).order_by(*WISHLIST_KEYSET.order_by())
+    if offset:
+        page = page.offset(offset)
+    if limit is not None:
+        page = page.limit(limit)
+    stats = (
+        select(
+            Item.wishlist_id,
+            func.count(Item.id).label("items_count"),
+            func.count(Item.id).filter(Item.is_reserved.is_(True)).label("reserved_count"),
+            func.sum(Item.price).label("total_price"),
+        )
+        .where(Item.wishlist_id.in_(page.scalar_subquery()))
+        .group_by(Item.wishlist_id)
+        .subquery()
+    )
+    query = (
+        select(
+            *_COLUMNS,
+            func.coalesce(stats.c.items_count, 0).label("items_count"),
+            func.coalesce(stats.c.reserved_count, 0).label("reserved_count"),
+            stats.c.total_price,
+        )
+        .outerjoin(stats, stats.c.wishlist_id == Wishlist.id)
+        .where(*where)
+        .order_by(*WISHLIST_KEYSET.order_by())
+    )
+    if offset:
+        query = query.offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+async def get_wishlist_summaries(
+    db: AsyncSession,
+    *where,
+    owner_view: bool,
+    offset: Optional[int] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> List[WishlistSummary]:
+    """Summaries of the wishlists matching `where`, newest first, in one query.
+
+    With `cursor` the list starts after it (see app/utils/pagination.py).
+    """
+    where = (*where, *WISHLIST_KEYSET.after(cursor))
+    result = await db.execute(summary_query(*where, offset=offset, limit=limit))
+    summaries = []
+    for row in result.mappings():
+        summary = WishlistSummary.model_validate(dict(row))
+        if owner_view:
+            summary.reserved_count = None
+        summaries.append(summary)
+    return summaries
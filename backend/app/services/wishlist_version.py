@@ -0,0 +1,56 @@
+"""Wishlist versions and ETags for the share page
+
+Every wishlist has a `version` that is bumped in the same transaction as
+any change visible on it: items (create, update, delete, copy),
+reservations and the wishlist itself. Mutation endpoints call
+bump_version() before commit.
+
+The share page ETag is built from (id, version, view), so a conditional GET
+costs one indexed row lookup and never touches the items table.
+"""
+from typing import Optional
+
+from fastapi import Response
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.wishlist import Wishlist
+
+# Поднять, если меняется формат ответа: старые ETag перестанут совпадать
+_FORMAT = 1
+
+
+async def bump_version(db: AsyncSession, *wishlist_ids: int) -> None:
+    """Increment the version of the given wishlists (commit is up to the caller)"""
+    ids = {wishlist_id for wishlist_id in wishlist_ids if wishlist_id is not None}
+    if not ids:
+        return
+    await db.execute(
+        update(Wishlist)
+        .where(Wishlist.id.in_(ids))
+        # updated_at is about the wishlist itself, not its items
+        .values(version=Wishlist.version + 1, updated_at=Wishlist.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def make_etag(wishlist_id: int, version: int, owner_view: bool) -> str:
+    """Strong ETag; the owner's view hides reservations, so it is tagged apart"""
+    view = "owner" if owner_view else "guest"
+    return f'"{_FORMAT}-{wishlist_id}-{version}-{view}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for it)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def set_etag(response: Response, etag: str) -> None:
+    """ETag + revalidate on every use; the body depends on who is asking"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.headers["Vary"] = "Authorization"
@@ -0,0 +1,108 @@
+"""Owner and guest JSON views of wishlists and items
+
+Responses are built straight from ORM rows in one pass: no Pydantic
+validation of data that came from our own database, and no "validate, then
+blank out reservation fields" step for the owner. The output matches the
+Item / Wishlist schemas field for field, so response_model stays the API
+contract (and the OpenAPI docs) while handlers return view_response().
+
+Owner view ("surprise-safe"): the owner never learns who reserved or chipped
+in, so is_reserved, reserved_by_name, collected_amount and contributors are
+blanked. Guest view: everything, except the internal ids stored with each
+contributor.
+
+The rendered-response cache stores guest views built here.
+"""
+from decimal import Decimal
+from typing import Any, Iterable, List, Optional
+
+from fastapi import Response
+from pydantic_core import to_json
+
+from app.models.item import Item
+from app.models.wishlist import Wishlist
+
+
+def _num(value: Optional[Decimal]) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+def _progress(price, target_amount, collected) -> Optional[float]:
+    # Same as Item.contribution_progress
+    if target_amount and target_amount > 0:
+        return float(collected / target_amount * 100)
+    if price and price > 0 and collected > 0:
+        return float(collected / price * 100)
+    return None
+
+
+def item_view(item: Item, owner_view: bool) -> dict:
+    """An item as the Item schema serializes it, in the owner or guest view"""
+    if owner_view:
+        collected = Decimal(0)
+        is_reserved, reserved_by_name, contributors = False, None, []
+    else:
+        collected = item.collected_amount if item.collected_amount is not None else Decimal(0)
+        is_reserved, reserved_by_name = item.is_reserved, item.reserved_by_name
+        contributors = (
+            None if item.contributors is None
+            # Only the public part: user / guest session ids stay internal
+            else [{"name": c["name"], "amount": float(c["amount"])} for c in item.contributors]
+        )
+    return {
+        "title": item.title,
+        "description": item.description,
+        "url": item.url,
+        "image_url": item.image_url,
+        "images": item.images,
+        "price": _num(item.price),
+        "currency": item.currency,
+        "target_amount": _num(item.target_amount),
+        "priority": item.priority.value,
+        "id": item.id,
+        "wishlist_id": item.wishlist_id,
+        "collected_amount": float(collected),
+        "is_reserved": is_reserved,
+        "is_purchased": item.is_purchased,
+        "reserved_by_name": reserved_by_name,
+        "contributors": contributors,
+        "position_order": item.position_order,
+        "created_at": item.created_at,
+        "updated_at": item.updated_at,
+        "contribution_progress": _progress(item.price, item.target_amount, collected),
+    }
+
+
+def wishlist_view(wishlist: Wishlist, owner_view: bool) -> dict:
+    """A wishlist with its (loaded) items, as the Wishlist schema serializes it"""
+    return {
+        "title": wishlist.title,
+        "description": wishlist.description,
+        "cover_image_url": wishlist.cover_image_url,
+        "cover_emoji": wishlist.cover_emoji,
+        "wishlist_type": wishlist.wishlist_type.value,
+        "event_name": wishlist.event_name,
+        "event_date": wishlist.event_date,
+        "visibility": wishlist.visibility.value,
+        "id": wishlist.id,
+        "owner_id": wishlist.owner_id,
+        "share_token": wishlist.share_token,
+        "is_archived": wishlist.is_archived,
+        "created_at": wishlist.created_at,
+        "updated_at": wishlist.updated_at,
+        "items": items_view(wishlist.items, owner_view),
+    }
+
+
+def items_view(items: Iterable[Item], owner_view: bool) -> List[dict]:
+    return [item_view(item, owner_view) for item in items]
+
+
+def render(view: Any) -> str:
+    """JSON text of a view (dates and times encoded like Pydantic does)"""
+    return to_json(view).decode()
+
+
+def view_response(view: Any) -> Response:
+    """Return a view from a handler as is (response_model validation is skipped)"""
+    return Response(content=to_json(view), media_type="application/json")
@@ -0,0 +1,98 @@
+"""
+Keyset (cursor) pagination.
+
+Списки отдаются страницами по `limit`; если есть продолжение, ответ
+содержит заголовок `X-Next-Cursor`, который клиент передаёт как `?cursor=`.
+Курсор непрозрачный: это последние значения ключа сортировки, поэтому
+страница стоит одинаково на любой глубине (никакого OFFSET).
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, TypeVar
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import DateTime, and_, or_, tuple_
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 100
+
+T = TypeVar("T")
+
+
+class Keyset:
+    """A unique ordering usable for cursors, e.g.
+    Keyset(Item.position_order, Item.id.desc()); it should match a
+    composite index so every page is an index range scan."""
+
+    def __init__(self, *columns):
+        self.columns = []
+        self.descending = []
+        for column in columns:
+            desc = isinstance(column, UnaryExpression) and column.modifier is operators.desc_op
+            self.columns.append(column.element if desc else column)
+            self.descending.append(desc)
+
+    def order_by(self) -> list:
+        return [c.desc() if d else c.asc() for c, d in zip(self.columns, self.descending)]
+
+    def after(self, cursor: Optional[str]) -> list:
+        """WHERE clauses for rows after the cursor ([] for the first page)"""
+        if not cursor:
+            return []
+        values = self.decode(cursor)
+        if len(set(self.descending)) == 1:
+            # One direction: a row comparison, which Postgres serves as an index range
+            row, bound = tuple_(*self.columns), tuple_(*values)
+            return [row < bound if self.descending[0] else row > bound]
+        # Mixed directions: (a > x) OR (a = x AND b < y) ...
+        alternatives = []
+        for i, (column, value) in enumerate(zip(self.columns, values)):
+            ties = [c == v for c, v in zip(self.columns[:i], values[:i])]
+            alternatives.append(and_(*ties, column < value if self.descending[i] else column > value))
+        return [or_(*alternatives)]
+
+    def encode(self, values: Sequence[Any]) -> str:
+        raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    def decode(self, cursor: str) -> list:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            values = json.loads(raw)
+            if not isinstance(values, list) or len(values) != len(self.columns):
+                raise ValueError(cursor)
+            return [self._parse(c, v) for c, v in zip(self.columns, values)]
+        except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    @staticmethod
+    def _parse(column, value):
+        if isinstance(column.type, DateTime):
+            return datetime.fromisoformat(value)
+        if isinstance(value, bool) or not isinstance(value, column.type.python_type):
+            raise ValueError(value)
+        return value
+
+
+def paginate(
+    rows: List[T],
+    limit: Optional[int],
+    keyset: Keyset,
+    key: Callable[[T], Sequence[Any]],
+    response: Response,
+) -> List[T]:
+    """Trim a `limit + 1` fetch to one page and set X-Next-Cursor if there is more"""
+    if limit is None or len(rows) <= limit:
+        return rows
+    rows = rows[:limit]
+    response.headers[NEXT_CURSOR_HEADER] = keyset.encode(key(rows[-1]))
+    return rows
+
+
+def fetch_limit(limit: Optional[int]) -> Optional[int]:
+    """Rows to fetch for a page: one extra tells whether there is a next page"""
+    return None if limit is None else limit + 1
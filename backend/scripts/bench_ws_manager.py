@@ -0,0 +1,97 @@
+"""
+Micro-benchmark of the WebSocket ConnectionManager
+
+Measures connect, broadcast and disconnect with N in-memory sockets (no
+network, no Redis): N user channels with one socket each, and one share
+channel with N viewers.
+
+    cd backend && python scripts/bench_ws_manager.py [-n 10000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "bench-secret-key-minimum-32-characters-long")
+os.environ["WS_BACKPLANE"] = "local"
+os.environ["WS_HISTORY_SIZE"] = "0"
+os.environ["WS_HEARTBEAT_INTERVAL"] = "0"
+
+from app.services.realtime import ConnectionManager  # noqa: E402
+
+
+class NullWebSocket:
+    sent = 0  # frames written by all sockets
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, message: str):
+        NullWebSocket.sent += 1
+
+    async def send_bytes(self, message: bytes):
+        NullWebSocket.sent += 1
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def _report(name: str, seconds: float, ops: int) -> None:
+    print(f"{name:<40} {seconds * 1000:9.1f} ms  {seconds / ops * 1e6:8.2f} us/op")
+
+
+async def _drained(expected: int) -> None:
+    while NullWebSocket.sent < expected:
+        await asyncio.sleep(0)
+
+
+async def main(n: int) -> None:
+    manager = ConnectionManager(backplane="local")
+    users = [NullWebSocket() for _ in range(n)]
+    viewers = [NullWebSocket() for _ in range(n)]
+
+    start = time.perf_counter()
+    user_conns = [await manager.connect(ws, str(i), user_id=str(i)) for i, ws in enumerate(users)]
+    _report(f"connect {n} user channels", time.perf_counter() - start, n)
+
+    start = time.perf_counter()
+    viewer_conns = [await manager.connect(ws, "share_hot") for ws in viewers]
+    _report(f"connect {n} viewers of one channel", time.perf_counter() - start, n)
+
+    message = '{"type": "wishlist_item", "action": "item_reserved", "wishlist_id": 1, "item_id": 1}'
+    start = time.perf_counter()
+    await manager.broadcast(message, ["share_hot"])
+    queued = time.perf_counter() - start
+    await _drained(n)
+    _report(f"broadcast to {n} viewers (queue)", queued, n)
+    _report(f"broadcast to {n} viewers (delivered)", time.perf_counter() - start, n)
+
+    channels = [str(i) for i in range(n)]
+    start = time.perf_counter()
+    await manager.broadcast(message, channels)
+    queued = time.perf_counter() - start
+    await _drained(2 * n)
+    _report(f"broadcast to {n} channels (queue)", queued, n)
+    _report(f"broadcast to {n} channels (delivered)", time.perf_counter() - start, n)
+
+    random.Random(0).shuffle(viewer_conns)  # viewers leave in any order
+    start = time.perf_counter()
+    for connection in viewer_conns:
+        await manager.remove(connection)
+    _report(f"disconnect {n} viewers of one channel", time.perf_counter() - start, n)
+
+    start = time.perf_counter()
+    for connection in user_conns:
+        await manager.remove(connection)
+    _report(f"disconnect {n} user channels", time.perf_counter() - start, n)
+
+    await manager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", type=int, default=10_000, help="connections per scenario")
+    asyncio.run(main(parser.parse_args().n))
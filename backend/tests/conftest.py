@@ -6,6 +6,10 @@ if not os.environ.get("SECRET_KEY") or "your-secret-key" in os.environ.get("SECR
     os.environ["SECRET_KEY"] = "test-secret-key-for-pytest-minimum-32-characters"
 if os.environ.get("REDIS_HOST") != "localhost":
     os.environ["REDIS_HOST"] = "localhost"
+# Each test runs in its own event loop; pooled asyncpg connections can't cross loops
+os.environ.setdefault("DB_POOL_MODE", "null")
+# Fail tests on query budget / N+1 violations instead of just logging
+os.environ.setdefault("DB_QUERY_BUDGET_STRICT", "true")
 
 import pytest
 from httpx import ASGITransport, AsyncClient
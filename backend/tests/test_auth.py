@@ -1,7 +1,12 @@
 """Auth endpoint tests: register, login, /auth/me, onboarding"""
+from types import SimpleNamespace
+
 import pytest
+from fastapi import HTTPException
 from httpx import ASGITransport, AsyncClient
 from app.main import app
+from app.api.v1.endpoints import auth
+from app.core import security
 from app.models.user import User
 from app.core.security import get_password_hash
 
@@ -210,3 +215,32 @@ async def test_onboarding_idempotent_when_already_completed(verified_user):
     assert r.status_code == 200
     data = r.json()
     assert data["onboarding_completed"] is True
+
+
+@pytest.mark.asyncio
+async def test_login_does_not_rehash_for_inactive_account(monkeypatch):
+    monkeypatch.setattr(security.settings, "BCRYPT_ROUNDS", 4)
+    user = User(email="old@example.com", username="olduser", hashed_password=get_password_hash("testpass123"),
+                is_active=False, email_verified=True)
+    monkeypatch.setattr(security.settings, "BCRYPT_ROUNDS", 5)
+    old_hash = user.hashed_password
+
+    async def allowed(identifier):
+        return True
+
+    class Session:
+        commits = 0
+
+        async def execute(self, query):
+            return SimpleNamespace(scalar_one_or_none=lambda: user)
+
+        async def commit(self):
+            self.commits += 1
+
+    monkeypatch.setattr(auth, "check_login_rate", allowed)
+    db = Session()
+    form = SimpleNamespace(username="olduser", password="testpass123")
+    with pytest.raises(HTTPException) as exc:
+        await auth.login(SimpleNamespace(client=None), db, form)
+    assert exc.value.status_code == 400
+    assert user.hashed_password == old_hash and db.commits == 0
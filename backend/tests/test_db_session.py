@@ -0,0 +1,69 @@
+"""Database engine configuration tests"""
+import itertools
+
+import pytest
+from sqlalchemy.pool import NullPool
+from starlette.requests import Request
+
+from app.db import routing
+from app.db.session import engine_options
+
+
+def test_null_mode_disables_pooling():
+    options = engine_options("null")
+    assert options["poolclass"] is NullPool
+    assert "pool_size" not in options
+
+
+def test_queue_mode_uses_pool_settings():
+    options = engine_options("queue")
+    assert "poolclass" not in options
+    assert options["pool_size"] > 0
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"]["prepared_statement_cache_size"] > 0
+
+
+def test_pgbouncer_mode_disables_prepared_statement_cache():
+    options = engine_options("pgbouncer")
+    connect_args = options["connect_args"]
+    assert connect_args["statement_cache_size"] == 0
+    assert connect_args["prepared_statement_cache_size"] == 0
+    name_func = connect_args["prepared_statement_name_func"]
+    assert name_func() != name_func()
+
+
+@pytest.mark.asyncio
+async def test_conditional_reads_go_to_the_primary(monkeypatch):
+    class Session:
+        async def close(self):
+            pass
+
+    primary, replica = Session(), Session()
+
+    async def get_db():
+        yield primary
+
+    class ReplicaSession:
+        async def __aenter__(self):
+            return replica
+
+        async def __aexit__(self, *exc):
+            return False
+
+    async def not_sticky(request):
+        return False
+
+    monkeypatch.setattr(routing, "get_db", get_db)
+    monkeypatch.setattr(routing, "ReplicaSessionLocals", [ReplicaSession])
+    monkeypatch.setattr(routing, "_replica_cycle", itertools.cycle([0]))
+    monkeypatch.setattr(routing, "_is_primary_sticky", not_sticky)
+
+    async def session_for(headers):
+        request = Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+        sessions = routing.get_read_db(request)
+        session = await sessions.__anext__()
+        await sessions.aclose()
+        return session
+
+    assert await session_for([]) is replica
+    assert await session_for([(b"if-none-match", b'"1-1-4-guest"')]) is primary
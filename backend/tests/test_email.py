@@ -0,0 +1,135 @@
+"""Email outbox tests against a local SMTP server"""
+import asyncio
+import socket
+
+import pytest
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.services import email as email_service, redis_client
+from app.services.email import LEASES_KEY, OUTBOX_KEY, EmailOutbox, build_verification_message
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessions.add(id(session))
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    handler = RecordingHandler()
+    port = _free_port()
+    controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    monkeypatch.setattr(email_service.settings, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(email_service.settings, "SMTP_PORT", port)
+    monkeypatch.setattr(email_service.settings, "SMTP_USER", "")
+    monkeypatch.setattr(email_service.settings, "EMAIL_SMTP_POOL_SIZE", 1)
+    yield handler
+    controller.stop()
+
+
+@pytest.fixture
+def journal(monkeypatch):
+    r = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+
+    async def get_redis():
+        return r
+
+    monkeypatch.setattr(email_service, "get_redis", get_redis)
+    monkeypatch.setattr(redis_client, "get_redis", get_redis)  # transaction()
+    monkeypatch.setattr(email_service.settings, "EMAIL_LEASE_SECONDS", 0.2)
+    return r
+
+
+async def _wait_for(predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+@pytest.mark.asyncio
+async def test_outbox_sends_batch_over_one_connection(smtp_server):
+    outbox = EmailOutbox()
+    for i in range(3):
+        await outbox.enqueue(f"user{i}@example.com", build_verification_message(f"user{i}@example.com", "123456"))
+    await _wait_for(lambda: len(smtp_server.messages) == 3)
+    await outbox.stop()
+
+    assert sorted(m.rcpt_tos[0] for m in smtp_server.messages) == [
+        "user0@example.com", "user1@example.com", "user2@example.com",
+    ]
+    assert len(smtp_server.sessions) == 1
+
+
+@pytest.mark.asyncio
+async def test_outbox_retries_until_server_is_up(smtp_server, monkeypatch):
+    real_port = email_service.settings.SMTP_PORT
+    monkeypatch.setattr(email_service.settings, "SMTP_PORT", _free_port())
+    monkeypatch.setattr(email_service.settings, "EMAIL_RETRY_BASE_SECONDS", 0.05)
+    outbox = EmailOutbox()
+    await outbox.enqueue("late@example.com", build_verification_message("late@example.com", "654321"))
+    await asyncio.sleep(0.1)
+    monkeypatch.setattr(email_service.settings, "SMTP_PORT", real_port)
+    await _wait_for(lambda: len(smtp_server.messages) == 1)
+    await outbox.stop()
+    assert smtp_server.messages[0].rcpt_tos == ["late@example.com"]
+
+
+@pytest.mark.asyncio
+async def test_recover_leaves_a_message_waiting_for_its_retry(smtp_server, journal, monkeypatch):
+    real_port = email_service.settings.SMTP_PORT
+    monkeypatch.setattr(email_service.settings, "SMTP_PORT", _free_port())
+    monkeypatch.setattr(email_service.settings, "EMAIL_RETRY_BASE_SECONDS", 1.0)
+    first = EmailOutbox()
+    await first.enqueue("slow@example.com", build_verification_message("slow@example.com", "111111"))
+    await _wait_for(lambda: first._retries)
+    # The backoff outlasts a plain lease; a worker starting now must not take it
+    await asyncio.sleep(0.4)
+    monkeypatch.setattr(email_service.settings, "SMTP_PORT", real_port)
+    second = EmailOutbox()
+    assert await second.recover() == 0
+
+    await _wait_for(lambda: len(smtp_server.messages) == 1)
+    await first.stop()
+    await second.stop()
+    assert await journal.hlen(OUTBOX_KEY) == 0
+    assert await journal.hlen(LEASES_KEY) == 0
+
+
+@pytest.mark.asyncio
+async def test_message_recovered_elsewhere_is_sent_once(smtp_server, journal):
+    stalled = EmailOutbox()
+    entry = {
+        "id": "m1", "from": "noreply@example.com", "to": "once@example.com",
+        "body": build_verification_message("once@example.com", "222222").as_string(),
+        "attempts": 0, "queued_at": 0,
+    }
+    assert await stalled._lease(entry, new=True)
+    # The lease runs out while the message sits in a busy worker's queue
+    await asyncio.sleep(0.3)
+    rescuer = EmailOutbox()
+    assert await rescuer.recover() == 1
+    assert await EmailOutbox().recover() == 0
+    await _wait_for(lambda: len(smtp_server.messages) == 1)
+
+    stalled._ensure_started()
+    stalled._queue.put_nowait(dict(entry))
+    await asyncio.wait_for(stalled._queue.join(), 5)
+    await stalled.stop()
+    await rescuer.stop()
+    assert len(smtp_server.messages) == 1
@@ -0,0 +1,77 @@
+"""Friend adjacency cache tests"""
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.services import friend_graph
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    r = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    friends = {1: {2, 3}, 4: set()}
+    loads = []
+
+    async def get_redis():
+        return r
+
+    async def load(db, user_id):
+        loads.append(user_id)
+        return frozenset(friends.get(user_id, ()))
+
+    monkeypatch.setattr(friend_graph, "get_redis", get_redis)
+    monkeypatch.setattr(friend_graph, "_load", load)
+    friend_graph._local.clear()
+    yield friends, loads
+    friend_graph._local.clear()
+
+
+@pytest.mark.asyncio
+async def test_loaded_once_then_served_from_cache(graph):
+    friends, loads = graph
+    assert await friend_graph.get_friend_ids(None, 1) == {2, 3}
+    assert await friend_graph.get_friend_ids(None, 1) == {2, 3}
+    # Another worker: empty local tier, shared Redis
+    friend_graph._local.clear()
+    assert await friend_graph.get_friend_ids(None, 1) == {2, 3}
+    assert loads == [1]
+
+
+@pytest.mark.asyncio
+async def test_empty_friend_list_is_cached(graph):
+    _, loads = graph
+    assert await friend_graph.get_friend_ids(None, 4) == frozenset()
+    friend_graph._local.clear()
+    assert await friend_graph.get_friend_ids(None, 4) == frozenset()
+    assert loads == [4]
+
+
+@pytest.mark.asyncio
+async def test_invalidation_and_recipients(graph):
+    friends, loads = graph
+    assert await friend_graph.fan_out_recipients(None, 1, 3, 9) == ["1", "2", "3", "9"]
+    friends[1].add(5)
+    await friend_graph.invalidate_friends([1, 5])
+    assert await friend_graph.get_friend_ids(None, 1) == {2, 3, 5}
+    assert loads == [1, 1]
+
+
+@pytest.mark.asyncio
+async def test_load_racing_an_invalidation_is_not_cached(graph, monkeypatch):
+    friends, loads = graph
+    real_load = friend_graph._load
+
+    async def load_then_unfriend(db, user_id):
+        # Reads the old set, then the friendship is removed and committed
+        old = await real_load(db, user_id)
+        friends[1].discard(3)
+        await friend_graph.invalidate_friends([1, 3])
+        return old
+
+    monkeypatch.setattr(friend_graph, "_load", load_then_unfriend)
+    assert await friend_graph.get_friend_ids(None, 1) == {2, 3}  # served once, not cached
+
+    monkeypatch.setattr(friend_graph, "_load", real_load)
+    friend_graph._local.clear()
+    assert await friend_graph.get_friend_ids(None, 1) == {2}
+    assert loads == [1, 1]
@@ -16,3 +16,16 @@ async def test_health_returns_200():
     data = r.json()
     assert data["status"] == "healthy"
     assert "version" in data
+
+
+@pytest.mark.asyncio
+async def test_metrics_exposes_websocket_counters():
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as client:
+        r = await client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert "# TYPE ws_fanout_seconds histogram" in r.text
+    assert 'ws_connections{kind="single"} 0' in r.text
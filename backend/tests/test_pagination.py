@@ -0,0 +1,63 @@
+"""Keyset pagination tests"""
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from app.models.item import Item
+from app.models.wishlist import Wishlist
+from app.utils.pagination import NEXT_CURSOR_HEADER, Keyset, paginate
+
+WISHLISTS = Keyset(Wishlist.created_at.desc(), Wishlist.id.desc())
+ITEMS = Keyset(Item.position_order, Item.id.desc())
+
+
+def _sql(query) -> str:
+    return str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def test_cursor_round_trip():
+    created = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    cursor = WISHLISTS.encode((created, 42))
+    assert WISHLISTS.decode(cursor) == [created, 42]
+    assert "=" not in cursor  # goes into a query string as is
+
+
+@pytest.mark.parametrize("keyset, cursor", [
+    (WISHLISTS, "garbage!"),
+    (WISHLISTS, WISHLISTS.encode(())),  # wrong length
+    (WISHLISTS, WISHLISTS.encode(("x", 1))),  # not a datetime
+    (ITEMS, ITEMS.encode((1, "2"))),  # wrong type
+    (ITEMS, ITEMS.encode((True, 2))),
+])
+def test_invalid_cursor_is_400(keyset, cursor):
+    with pytest.raises(HTTPException) as exc:
+        keyset.after(cursor)
+    assert exc.value.status_code == 400
+
+
+def test_same_direction_uses_row_comparison():
+    cursor = WISHLISTS.encode((datetime(2024, 5, 1, tzinfo=timezone.utc), 42))
+    sql = _sql(select(Wishlist.id).where(*WISHLISTS.after(cursor)).order_by(*WISHLISTS.order_by()))
+    assert "(wishlists.created_at, wishlists.id) < (" in sql
+    assert "ORDER BY wishlists.created_at DESC, wishlists.id DESC" in sql
+    assert "OFFSET" not in sql
+
+
+def test_mixed_directions_expand_to_or():
+    sql = _sql(select(Item.id).where(*ITEMS.after(ITEMS.encode((3, 10)))))
+    assert "items.position_order > 3 OR items.position_order = 3 AND items.id < 10" in sql
+
+
+def test_paginate_sets_next_cursor_only_when_more_rows():
+    response = Response()
+    rows = [(3, 10), (3, 9), (4, 20)]
+    page = paginate(rows, 2, ITEMS, lambda r: r, response)
+    assert page == [(3, 10), (3, 9)]
+    assert ITEMS.decode(response.headers[NEXT_CURSOR_HEADER]) == [3, 9]
+
+    last = Response()
+    assert paginate(rows[:2], 2, ITEMS, lambda r: r, last) == rows[:2]
+    assert NEXT_CURSOR_HEADER not in last.headers
@@ -0,0 +1,73 @@
+"""Per-request SQL instrumentation tests"""
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app.core.config import settings
+from app.db.instrumentation import (
+    QueryBudgetExceeded,
+    QueryStats,
+    check_query_budget,
+    instrument_engine,
+    query_stats,
+)
+from app.main import app
+
+
+def _run_queries(n: int) -> QueryStats:
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    stats = QueryStats()
+    token = query_stats.set(stats)
+    try:
+        with engine.connect() as conn:
+            for _ in range(n):
+                conn.execute(text("SELECT 1"))
+    finally:
+        query_stats.reset(token)
+    return stats
+
+
+def test_counts_statements_and_time():
+    stats = _run_queries(3)
+    assert stats.count == 3
+    assert stats.duration > 0
+    assert stats.repeated(3) == [("SELECT 1", 3)]
+
+
+def test_failed_statements_leave_no_timing_state():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM missing"))
+        assert isinstance(conn.info["query_start"], float)
+        conn.execute(text("SELECT 1"))
+        assert "query_start" not in conn.info
+
+
+def test_repeated_statement_fails_in_strict_mode(monkeypatch):
+    monkeypatch.setattr(settings, "DB_N_PLUS_ONE_THRESHOLD", 3)
+    monkeypatch.setattr(settings, "DB_QUERY_BUDGET_STRICT", True)
+    with pytest.raises(QueryBudgetExceeded, match="N\\+1"):
+        check_query_budget("GET /friendships/", _run_queries(3))
+
+
+def test_query_budget_only_warns_when_not_strict(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "DB_QUERY_BUDGET", 2)
+    monkeypatch.setattr(settings, "DB_QUERY_BUDGET_STRICT", False)
+    check_query_budget("GET /wishlists/", _run_queries(3))
+    assert "budget 2" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_response_exposes_query_headers():
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as client:
+        r = await client.get("/health")
+    assert r.headers["X-DB-Queries"] == "0"
+    assert r.headers["Server-Timing"].startswith("db;dur=")
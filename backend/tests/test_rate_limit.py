@@ -0,0 +1,86 @@
+"""Rate limiter tests (Lua scripts run on fakeredis)"""
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from fastapi import Depends, FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from app.services import rate_limit
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    r = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+
+    async def get_redis():
+        return r
+
+    monkeypatch.setattr(rate_limit, "get_redis", get_redis)
+    monkeypatch.setattr(rate_limit.settings, "RATE_LIMIT_ENABLED", True)
+    rate_limit._blocked.clear()
+    yield r
+    rate_limit._blocked.clear()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("algorithm", ["sliding", "bucket"])
+async def test_limit_is_enforced(fake_redis, algorithm):
+    results = [await rate_limit.hit("t:a", 3, 60, algorithm) for _ in range(4)]
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert [r.remaining for r in results[:3]] == [2, 1, 0]
+    assert 0 < results[3].retry_after <= 120
+    # Other keys are independent
+    assert (await rate_limit.hit("t:b", 3, 60, algorithm)).allowed
+    # State always has a TTL
+    assert 0 < await fake_redis.pttl("rate:t:a") <= 120_000
+
+
+@pytest.mark.asyncio
+async def test_blocked_client_skips_redis(fake_redis, monkeypatch):
+    for _ in range(2):
+        await rate_limit.hit("t:c", 1, 60)
+
+    async def no_redis():
+        raise AssertionError("Redis should not be called")
+
+    monkeypatch.setattr(rate_limit, "get_redis", no_redis)
+    assert not (await rate_limit.hit("t:c", 1, 60)).allowed
+
+
+@pytest.mark.asyncio
+async def test_reset_login_rate(fake_redis):
+    for _ in range(rate_limit.LOGIN_MAX_ATTEMPTS):
+        assert await rate_limit.check_login_rate("1.2.3.4:bob")
+    assert not await rate_limit.check_login_rate("1.2.3.4:bob")
+    await rate_limit.reset_login_rate("1.2.3.4:bob")
+    assert await rate_limit.check_login_rate("1.2.3.4:bob")
+
+
+@pytest.mark.asyncio
+async def test_fails_open_without_redis(monkeypatch):
+    async def broken():
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(rate_limit, "get_redis", broken)
+    assert (await rate_limit.hit("t:d", 1, 60)).allowed
+
+
+@pytest.mark.asyncio
+async def test_dependency_returns_429(fake_redis):
+    app = FastAPI()
+
+    @app.get("/limited", dependencies=[Depends(rate_limit.rate_limit("limited", 2, 60))])
+    async def limited():
+        return {"ok": True}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        first = await ac.get("/limited")
+        await ac.get("/limited")
+        blocked = await ac.get("/limited")
+
+    assert first.status_code == 200
+    assert first.headers["X-RateLimit-Remaining"] == "1"
+    assert blocked.status_code == 429
+    assert int(blocked.headers["Retry-After"]) >= 1
@@ -0,0 +1,464 @@
+"""WebSocket connection manager tests"""
+import asyncio
+import json
+
+import pytest
+
+from app.core.config import settings
+from app.services.realtime import ConnectionManager
+from app.services.realtime.coalescer import EventCoalescer, merge_event
+from app.services.realtime import backplane as backplane_module
+from app.services.realtime import history
+from app.api.v1.endpoints.websocket import _can_subscribe
+
+
+class FakeWebSocket:
+    def __init__(self, fail: bool = False):
+        self.sent = []
+        self.fail = fail
+        self.closed_with = None
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def accept(self, subprotocol=None):
+        self.subprotocol = subprotocol
+
+    async def send_text(self, message: str):
+        await self.gate.wait()
+        if self.fail:
+            raise RuntimeError("closed")
+        self.sent.append(message)
+
+    async def send_bytes(self, message: bytes):
+        await self.send_text(message)
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+
+@pytest.fixture(autouse=True)
+def no_history(monkeypatch):
+    # History needs Redis; tests that use it enable it explicitly
+    monkeypatch.setattr(settings, "WS_HISTORY_SIZE", 0)
+
+
+async def _wait_for(predicate, timeout=3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_local_delivery_and_dead_cleanup():
+    manager = ConnectionManager(backplane="local")
+    alive, dead = FakeWebSocket(), FakeWebSocket(fail=True)
+    await manager.connect(alive, "1")
+    await manager.connect(dead, "1")
+
+    await manager.send_personal_message("hello", "1")
+    await _wait_for(lambda: len(manager.active_connections["1"]) == 1)
+
+    assert alive.sent == ["hello"]
+    assert manager.active_connections["1"][0].websocket is alive
+    await manager.disconnect(alive, "1")
+    assert "1" not in manager.active_connections
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_block_sender():
+    manager = ConnectionManager(backplane="local")
+    slow, fast = FakeWebSocket(), FakeWebSocket()
+    slow.gate.clear()  # never finishes sending until released
+    await manager.connect(slow, "1")
+    await manager.connect(fast, "2")
+
+    await asyncio.wait_for(manager.broadcast("hi", ["1", "2", "2"]), timeout=0.5)
+    await _wait_for(lambda: fast.sent)
+    assert fast.sent == ["hi"]
+    assert slow.sent == []
+
+    slow.gate.set()
+    await _wait_for(lambda: slow.sent)
+    assert slow.sent == ["hi"]
+    await manager.close()
+
+
+def _event(action, item_id, n):
+    return json.dumps({"type": "wishlist_item", "action": action, "wishlist_id": 1, "item_id": item_id, "n": n})
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("policy", ["drop", "coalesce", "disconnect"])
+async def test_overflow_policy(monkeypatch, policy):
+    monkeypatch.setattr(settings, "WS_SEND_QUEUE_SIZE", 3)
+    monkeypatch.setattr(settings, "WS_OVERFLOW_POLICY", policy)
+    manager = ConnectionManager(backplane="local")
+    ws = FakeWebSocket()
+    ws.gate.clear()
+    connection = await manager.connect(ws, "1")
+    await asyncio.sleep(0)
+
+    for message in [_event("updated", 1, 1), _event("updated", 2, 2), _event("reserved", 3, 3), _event("updated", 2, 4)]:
+        await manager.send_personal_message(message, "1")
+    ws.gate.set()
+
+    if policy == "disconnect":
+        await _wait_for(lambda: "1" not in manager.active_connections)
+        assert ws.closed_with == 1013
+    else:
+        await _wait_for(lambda: connection.pending == 0)
+        ns = [json.loads(m)["n"] for m in ws.sent]
+        # coalesce replaces the stale update of item 2, drop loses the oldest
+        assert ns == ([2, 3, 4] if policy == "drop" else [1, 3, 4])
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_redis_backplane_reaches_other_worker(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+
+    async def get_redis():
+        return fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+
+    monkeypatch.setattr(backplane_module, "get_redis", get_redis)
+    worker_a = ConnectionManager(backplane="redis")
+    worker_b = ConnectionManager(backplane="redis")
+    try:
+        ws = FakeWebSocket()
+        await worker_a.connect(ws, "share_abc")
+        # Published on B, delivered by A, which holds the socket
+        await worker_b.send_personal_message('{"type": "item_created"}', "share_abc")
+        await _wait_for(lambda: ws.sent)
+        assert ws.sent == ['{"type": "item_created"}']
+
+        await worker_a.disconnect(ws, "share_abc")
+        assert "share_abc" not in worker_a.backplane._channels
+    finally:
+        await worker_a.close()
+        await worker_b.close()
+
+
+def _item(action, item_id, **extra):
+    return {"type": "wishlist_item", "action": action, "wishlist_id": 1, "item_id": item_id, **extra}
+
+
+def test_merge_drops_superseded_events():
+    buffer = []
+    for event in [
+        _item("item_updated", 1, title="a"),
+        _item("item_reserved", 2),
+        _item("item_updated", 1, title="b"),
+        _item("item_unreserved", 2),
+        _item("item_created", 3, title="new"),
+        _item("item_updated", 3, title="newer"),
+        _item("item_updated", 4),
+        _item("item_deleted", 4),
+        _item("item_created", 5),
+        _item("item_deleted", 5),
+    ]:
+        merge_event(buffer, event)
+
+    assert [(e["action"], e["item_id"], e.get("title")) for e in buffer] == [
+        ("item_updated", 1, "b"),
+        ("item_unreserved", 2, None),
+        ("item_created", 3, "newer"),
+        ("item_deleted", 4, None),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_coalescer_sends_one_batch_per_window(monkeypatch):
+    monkeypatch.setattr(settings, "WS_COALESCE_WINDOW_MS", 20)
+    sent = []
+
+    async def send(message, channel):
+        sent.append((channel, json.loads(message)))
+
+    coalescer = EventCoalescer(send)
+    for item_id in range(3):
+        coalescer.add("share_x", _item("item_deleted", item_id))
+    coalescer.add("share_y", _item("item_updated", 9))
+    await _wait_for(lambda: len(sent) == 2)
+
+    frames = dict(sent)
+    assert frames["share_x"]["type"] == "batch"
+    assert [e["item_id"] for e in frames["share_x"]["events"]] == [0, 1, 2]
+    assert frames["share_y"] == _item("item_updated", 9)
+
+
+@pytest.fixture
+def history_redis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    r = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+
+    async def get_redis():
+        return r
+
+    monkeypatch.setattr(history, "get_redis", get_redis)
+    monkeypatch.setattr(settings, "WS_HISTORY_SIZE", 200)
+    return r
+
+
+@pytest.mark.asyncio
+async def test_reconnect_replays_missed_frames(history_redis):
+    manager = ConnectionManager(backplane="local")
+    first = FakeWebSocket()
+    await manager.connect(first, "7")
+    for n in range(3):
+        await manager.send_personal_message(json.dumps({"type": "wishlist", "n": n}), "7")
+    await _wait_for(lambda: len(first.sent) == 3)
+    assert [json.loads(m)["seq"] for m in first.sent] == [1, 2, 3]
+    await manager.disconnect(first, "7")
+
+    # Missed while offline
+    await manager.send_personal_message(json.dumps({"type": "wishlist", "n": 3}), "7")
+    await manager.send_personal_message(json.dumps({"type": "wishlist", "n": 4}), "7")
+
+    second = FakeWebSocket()
+    await manager.connect(second, "7", since=3)
+    await manager.send_personal_message(json.dumps({"type": "wishlist", "n": 5}), "7")
+    await _wait_for(lambda: len(second.sent) == 3)
+    assert [(json.loads(m)["seq"], json.loads(m)["n"]) for m in second.sent] == [(4, 3), (5, 4), (6, 5)]
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_seq_counter_expires_when_channel_goes_quiet(history_redis, monkeypatch):
+    monkeypatch.setattr(settings, "WS_SEQ_TTL_SECONDS", 100)
+    monkeypatch.setattr(settings, "WS_HISTORY_TTL_SECONDS", 20)
+    await history.record(["share_gone"], json.dumps({"type": "wishlist"}))
+    assert 100 < await history_redis.ttl("ws:seq:share_gone") <= 120
+    assert await history_redis.ttl("ws:history:share_gone") <= 20
+
+
+@pytest.mark.asyncio
+async def test_reconnect_after_history_is_gone_gets_resync(history_redis, monkeypatch):
+    monkeypatch.setattr(settings, "WS_HISTORY_SIZE", 2)
+    manager = ConnectionManager(backplane="local")
+    for n in range(10):
+        await manager.send_personal_message(json.dumps({"type": "wishlist", "n": n}), "8")
+    await history_redis.xtrim("ws:history:8", maxlen=2)  # MAXLEN ~ trims lazily
+
+    ws = FakeWebSocket()
+    await manager.connect(ws, "8", since=1)
+    await _wait_for(lambda: ws.sent)
+    assert json.loads(ws.sent[0]) == {"type": "resync", "seq": 10}
+
+    # Up to date: nothing to replay
+    ws2 = FakeWebSocket()
+    connection = await manager.connect(ws2, "8", since=10)
+    await asyncio.sleep(0.05)
+    assert ws2.sent == [] and connection.pending == 0
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_mux_connection_gets_wrapped_frames_per_channel():
+    manager = ConnectionManager(backplane="local")
+    ws = FakeWebSocket()
+    connection = await manager.accept(ws, "mux:5", mux=True)
+    await manager.subscribe(connection, "5")
+    await manager.subscribe(connection, "share_abc")
+    plain = FakeWebSocket()
+    await manager.connect(plain, "share_abc")
+
+    await manager.broadcast(json.dumps({"type": "wishlist", "n": 1}), ["5", "share_abc"])
+    await _wait_for(lambda: len(ws.sent) == 2 and len(plain.sent) == 1)
+    assert [json.loads(m) for m in ws.sent] == [
+        {"channel": "5", "data": {"type": "wishlist", "n": 1}},
+        {"channel": "share_abc", "data": {"type": "wishlist", "n": 1}},
+    ]
+    assert json.loads(plain.sent[0]) == {"type": "wishlist", "n": 1}
+
+    await manager.unsubscribe(connection, "5")
+    assert "5" not in manager.active_connections
+    await manager.remove(connection)
+    assert list(manager.active_connections) == ["share_abc"]
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_mux_replay_keeps_other_channels(history_redis):
+    manager = ConnectionManager(backplane="local")
+    for n in range(3):
+        await manager.send_personal_message(json.dumps({"type": "wishlist", "n": n}), "share_x")
+
+    ws = FakeWebSocket()
+    connection = await manager.accept(ws, "mux:5", mux=True)
+    await manager.subscribe(connection, "share_y")
+    await manager.subscribe(connection, "share_x", since=1)
+    await manager.send_personal_message(json.dumps({"type": "wishlist", "n": 9}), "share_y")
+    await _wait_for(lambda: len(ws.sent) == 3)
+    frames = [json.loads(m) for m in ws.sent]
+    assert [(f["channel"], f["data"]["seq"]) for f in frames] == [("share_x", 2), ("share_x", 3), ("share_y", 1)]
+    await manager.close()
+
+
+def test_mux_channel_access():
+    assert _can_subscribe("share_abc", None)
+    assert _can_subscribe("5", "5")
+    assert not _can_subscribe("6", "5")
+    assert not _can_subscribe("5", None)
+    assert not _can_subscribe("share_", "5")
+    assert not _can_subscribe("anything", "5")
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_pings_quiet_and_closes_idle(monkeypatch):
+    monkeypatch.setattr(settings, "WS_HEARTBEAT_INTERVAL", 10)
+    monkeypatch.setattr(settings, "WS_IDLE_TIMEOUT", 30)
+    manager = ConnectionManager(backplane="local")
+    quiet, chatty = FakeWebSocket(), FakeWebSocket()
+    c1 = await manager.connect(quiet, "1")
+    c2 = await manager.connect(chatty, "2")
+    wheel = manager.heartbeat
+    start = c1.last_seen
+
+    def turn(now):
+        for _ in range(len(wheel._wheel)):
+            wheel.tick(now)
+
+    turn(start + 15)
+    await _wait_for(lambda: quiet.sent and chatty.sent)
+    assert json.loads(quiet.sent[0]) == {"type": "ping"}
+
+    c2.last_seen = start + 20  # answered the ping
+    turn(start + 35)
+    await _wait_for(lambda: "1" not in manager.active_connections)
+    assert quiet.closed_with == 1001
+    assert "2" in manager.active_connections and len(wheel) == 1
+    assert manager.stats()["evictions"] == {"idle": 1}
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_connection_limit_closes_oldest(monkeypatch):
+    monkeypatch.setattr(settings, "WS_MAX_CONNECTIONS_PER_USER", 2)
+    manager = ConnectionManager(backplane="local")
+    sockets = [FakeWebSocket() for _ in range(3)]
+    for ws in sockets:
+        await manager.connect(ws, "3", user_id="3")
+    await _wait_for(lambda: len(manager.active_connections["3"]) == 2)
+    assert sockets[0].closed_with == 1008
+    assert [c.websocket for c in manager.user_connections["3"]] == sockets[1:]
+    assert manager.evictions["limit"] == 1
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_msgpack_subprotocol_and_encode_once(monkeypatch):
+    msgpack = pytest.importorskip("msgpack")
+    from app.services.realtime import encoding
+
+    assert encoding.negotiate(["msgpack"]) == "msgpack"
+    assert encoding.negotiate(["json"]) is None
+
+    packs = []
+    real_pack = encoding._pack
+    monkeypatch.setattr(encoding, "_pack", lambda text: packs.append(text) or real_pack(text))
+
+    manager = ConnectionManager(backplane="local")
+    binary = [FakeWebSocket() for _ in range(3)]
+    for ws in binary:
+        await manager.connect(ws, "share_m", subprotocol="msgpack")
+    text = FakeWebSocket()
+    await manager.connect(text, "share_m")
+    mux = FakeWebSocket()
+    connection = await manager.accept(mux, "mux:4", mux=True, subprotocol="msgpack")
+    await manager.subscribe(connection, "share_m")
+
+    await manager.broadcast(json.dumps({"type": "wishlist", "n": 1}), ["share_m"])
+    await _wait_for(lambda: all(ws.sent for ws in binary + [text, mux]))
+    assert binary[0].subprotocol == "msgpack"
+    assert [msgpack.unpackb(ws.sent[0]) for ws in binary] == [{"type": "wishlist", "n": 1}] * 3
+    assert json.loads(text.sent[0]) == {"type": "wishlist", "n": 1}
+    assert msgpack.unpackb(mux.sent[0]) == {"channel": "share_m", "data": {"type": "wishlist", "n": 1}}
+    assert len(packs) == 1
+    await manager.close()
+
+
+def test_registry_sets_and_snapshots():
+    from app.services.realtime.registry import ChannelRegistry
+
+    registry = ChannelRegistry(shards=4)
+    a, b = object(), object()
+    assert registry.add("share_x", a) is True
+    assert registry.add("share_x", b) is False
+    assert registry.add("1", a) is True
+    snapshot = registry.get("share_x")
+    assert registry.discard("share_x", a) is False
+    assert snapshot == (a, b) and registry["share_x"] == (b,)
+    assert registry.discard("share_x", a) is False  # already gone
+    assert registry.discard("share_x", b) is True
+    assert "share_x" not in registry and registry.get("share_x") == ()
+    assert list(registry) == ["1"] and registry.connections() == [a]
+
+
+@pytest.mark.asyncio
+async def test_channel_lock_keeps_backplane_subscription():
+    class SlowBackplane:
+        def __init__(self):
+            self.subscribed = set()
+
+        async def subscribe(self, channel):
+            await asyncio.sleep(0.01)
+            self.subscribed.add(channel)
+
+        async def unsubscribe(self, channel):
+            await asyncio.sleep(0.02)
+            self.subscribed.discard(channel)
+
+        async def close(self):
+            pass
+
+    manager = ConnectionManager(backplane="local")
+    manager.backplane = SlowBackplane()
+    first = await manager.connect(FakeWebSocket(), "9")
+    # Last socket leaves while a new one joins the same channel
+    second = await manager.accept(FakeWebSocket(), "9")
+    await asyncio.gather(manager.remove(first), manager.subscribe(second, "9"))
+    assert manager.active_connections["9"] == (second,)
+    assert manager.backplane.subscribed == {"9"}
+    await manager.close()
+
+
+def test_metrics_render_prometheus_text():
+    from app.services.metrics import Counter, Histogram, render
+
+    sent = Counter("test_sent_total", "Sent", labels=("reason",), register=False)
+    sent.inc("idle")
+    sent.inc("idle", amount=2)
+    latency = Histogram("test_latency_seconds", "Latency", buckets=(0.1, 1), register=False)
+    for value in (0.05, 0.5, 3):
+        latency.observe(value)
+    assert render([sent, latency]).splitlines() == [
+        "# HELP test_sent_total Sent",
+        "# TYPE test_sent_total counter",
+        'test_sent_total{reason="idle"} 3',
+        "# HELP test_latency_seconds Latency",
+        "# TYPE test_latency_seconds histogram",
+        'test_latency_seconds_bucket{le="0.1"} 1',
+        'test_latency_seconds_bucket{le="1"} 2',
+        'test_latency_seconds_bucket{le="+Inf"} 3',
+        "test_latency_seconds_sum 3.55",
+        "test_latency_seconds_count 3",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_send_and_fanout_are_measured():
+    from app.services.realtime import metrics
+
+    sent, broadcasts = metrics.MESSAGES_SENT.value(), metrics.FANOUT_SECONDS.count()
+    manager = ConnectionManager(backplane="local")
+    ws = FakeWebSocket()
+    await manager.connect(ws, "1")
+    await manager.broadcast("hi", ["1"])
+    await _wait_for(lambda: ws.sent)
+    assert metrics.FANOUT_SECONDS.count() == broadcasts + 1
+    assert metrics.MESSAGES_SENT.value() == sent + 1
+    await manager.close()
@@ -0,0 +1,44 @@
+"""Shared Redis client and verification code tests (fakeredis)"""
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from app.core.config import settings
+from app.services import redis_client
+from app.services.verification import generate_verification_code, get_resend_attempts, verify_code
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    r = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    monkeypatch.setattr(redis_client, "_redis", r)
+    return r
+
+
+def test_pool_uses_settings():
+    client = redis_client._create_client()
+    pool = client.connection_pool
+    assert pool.max_connections == settings.REDIS_MAX_CONNECTIONS
+    assert pool.connection_kwargs["health_check_interval"] == settings.REDIS_HEALTH_CHECK_INTERVAL
+    assert pool.connection_kwargs["socket_keepalive"] == settings.REDIS_SOCKET_KEEPALIVE
+
+
+@pytest.mark.asyncio
+async def test_transaction_runs_all_commands(fake_redis):
+    async with redis_client.transaction() as tx:
+        tx.set("a", 1)
+        tx.incr("a")
+        assert await tx.execute() == [True, 2]
+
+
+@pytest.mark.asyncio
+async def test_verification_code_is_single_use(fake_redis):
+    code = await generate_verification_code("a@example.com")
+    assert await fake_redis.ttl("verify:a@example.com") == 600
+    assert await get_resend_attempts("a@example.com") == 1
+    assert await fake_redis.ttl("verify_attempts:a@example.com") == 3600
+
+    assert not await verify_code("a@example.com", "wrong")
+    assert await verify_code("a@example.com", code)
+    assert not await verify_code("a@example.com", code)
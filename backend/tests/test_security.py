@@ -0,0 +1,71 @@
+"""Access token and password hashing tests"""
+from datetime import timedelta
+
+import pytest
+
+from app.core import security
+from app.core.security import (
+    PasswordHasherBusy,
+    create_access_token,
+    decode_access_token,
+    get_password_hash,
+    get_password_hash_async,
+    password_needs_rehash,
+    verify_password_async,
+)
+
+
+def _count_decodes(monkeypatch):
+    calls = []
+    real_decode = security.jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        calls.append(1)
+        return real_decode(*args, **kwargs)
+
+    monkeypatch.setattr(security.jwt, "decode", counting_decode)
+    return calls
+
+
+def test_verified_token_is_cached(monkeypatch):
+    calls = _count_decodes(monkeypatch)
+    token = create_access_token(subject=42)
+    assert decode_access_token(token).subject == "42"
+    assert decode_access_token(token).subject == "42"
+    assert len(calls) == 1
+
+
+def test_invalid_and_expired_tokens_rejected():
+    assert decode_access_token("invalid_token_xyz") is None
+    expired = create_access_token(subject=1, expires_delta=timedelta(seconds=-1))
+    assert decode_access_token(expired) is None
+
+
+def test_cached_token_expires(monkeypatch):
+    token = create_access_token(subject=7, expires_delta=timedelta(seconds=60))
+    claims = decode_access_token(token)
+    monkeypatch.setattr(security.time, "time", lambda: claims.expires_at + 1)
+    assert decode_access_token(token) is None
+
+
+@pytest.mark.asyncio
+async def test_async_hash_and_verify(monkeypatch):
+    monkeypatch.setattr(security.settings, "BCRYPT_ROUNDS", 4)
+    hashed = await get_password_hash_async("testpass123")
+    assert await verify_password_async("testpass123", hashed)
+    assert not await verify_password_async("wrongpass", hashed)
+
+
+@pytest.mark.asyncio
+async def test_hasher_rejects_when_queue_full(monkeypatch):
+    monkeypatch.setattr(security, "_hash_jobs", 100)
+    with pytest.raises(PasswordHasherBusy):
+        await verify_password_async("x", "y")
+
+
+def test_rehash_needed_when_work_factor_changes(monkeypatch):
+    monkeypatch.setattr(security.settings, "BCRYPT_ROUNDS", 4)
+    hashed = get_password_hash("testpass123")
+    assert not password_needs_rehash(hashed)
+    monkeypatch.setattr(security.settings, "BCRYPT_ROUNDS", 5)
+    assert password_needs_rehash(hashed)
@@ -0,0 +1,35 @@
+"""Slow query log tests"""
+from sqlalchemy import create_engine
+
+from app.db import slow_queries
+
+
+def setup_function():
+    slow_queries.reset()
+
+
+def test_parameter_shape_hides_values():
+    assert slow_queries.parameter_shape((1, "secret@example.com")) == ["int", "str"]
+    assert slow_queries.parameter_shape({"email": "secret@example.com"}) == {"email": "str"}
+    assert slow_queries.parameter_shape([(1,), (2,)], executemany=True) == {
+        "executemany": 2,
+        "row": ["int"],
+    }
+
+
+def test_keeps_worst_statements(monkeypatch):
+    monkeypatch.setattr(slow_queries.settings, "SLOW_QUERY_LOG_SIZE", 2)
+    conn = create_engine("sqlite://").connect()
+    try:
+        slow_queries.record(conn, "SELECT  a FROM t", (), False, 0.3, "GET /a")
+        slow_queries.record(conn, "SELECT b FROM t", (), False, 0.5, "GET /b")
+        slow_queries.record(conn, "SELECT a FROM t", (), False, 0.4, "GET /a2")
+        slow_queries.record(conn, "SELECT c FROM t", (), False, 0.1, "GET /c")
+    finally:
+        conn.close()
+
+    worst = slow_queries.worst_queries()
+    assert [e["statement"] for e in worst] == ["SELECT b FROM t", "SELECT a FROM t"]
+    assert worst[1]["count"] == 2
+    assert worst[1]["max_ms"] == 400.0
+    assert worst[1]["route"] == "GET /a2"
@@ -0,0 +1,55 @@
+"""User cache snapshot tests"""
+import json
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.db.base import Base
+from app.models.user import User
+from app.services import user_cache
+
+
+def test_snapshot_round_trip_attaches_clean_user():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        user = User(email="cache@example.com", username="cacheuser", is_active=True)
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+        data = json.loads(json.dumps(user_cache.snapshot(user)))
+
+    with Session(engine) as session:
+        cached = session.merge(user_cache._restore(data), load=False)
+        assert not session.dirty
+        assert cached.created_at is not None
+
+        cached.full_name = "Updated"
+        session.commit()
+        assert session.get(User, data["id"]).full_name == "Updated"
+
+
+def test_snapshot_leaves_out_secrets_and_provider_ids():
+    user = User(
+        id=1, email="s@example.com", username="secret", hashed_password="$2b$12$hash",
+        google_id="g-1", telegram_user_id=42, telegram_username="tg", is_active=True,
+    )
+    payload = json.dumps(user_cache.snapshot(user))
+    for value in ("hashed_password", "$2b$12$hash", "google_id", "g-1", "telegram_user_id", "telegram_username"):
+        assert value not in payload
+
+
+def test_uncached_columns_load_on_demand():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(email="g@example.com", username="guser", google_id="g-2", is_active=True))
+        session.commit()
+        data = user_cache.snapshot(session.query(User).one())
+
+    with Session(engine) as session:
+        cached = session.merge(user_cache._restore(data), load=False)
+        assert "google_id" not in cached.__dict__
+        # PATCH /users/me re-selects the user before returning the full schema
+        assert session.query(User).filter_by(id=data["id"]).one() is cached
+        assert cached.__dict__["google_id"] == "g-2"
@@ -0,0 +1,201 @@
+"""Rendered-response cache tests"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from starlette.requests import Request
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.api.v1.endpoints import users, wishlists
+from app.core.config import settings
+from app.models.wishlist import VisibilityEnum, Wishlist as WishlistModel, WishlistTypeEnum
+from app.schemas.wishlist import WishlistSummary
+from app.services import redis_client, wishlist_cache
+from app.services.wishlist_cache import Rendered, get_or_render, invalidate_wishlist_cache, share_keys
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    r = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+
+    async def get_redis():
+        return r
+
+    monkeypatch.setattr(wishlist_cache, "get_redis", get_redis)
+    monkeypatch.setattr(redis_client, "get_redis", get_redis)  # pipeline()
+    monkeypatch.setattr(settings, "WISHLIST_CACHE_TTL_SECONDS", 60)
+    return r
+
+
+def _renderer(body='{"id": 1}'):
+    calls = []
+
+    async def render():
+        calls.append(1)
+        await asyncio.sleep(0)
+        return Rendered(owner_id=7, body=body, etag='"1-1-4-guest"')
+
+    return render, calls
+
+
+@pytest.mark.asyncio
+async def test_rendered_once_then_served_from_redis(cache):
+    render, calls = _renderer()
+    first = await get_or_render(share_keys("tok"), render)
+    second = await get_or_render(share_keys("tok"), render)
+    assert first == second == Rendered(7, '{"id": 1}', '"1-1-4-guest"')
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_invalidation_forces_a_new_render(cache):
+    render, calls = _renderer()
+    await get_or_render(share_keys("tok"), render)
+    await invalidate_wishlist_cache(7, "tok")
+    await get_or_render(share_keys("tok"), render)
+    await get_or_render(share_keys("tok"), render)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_render_racing_an_invalidation_is_never_served(cache):
+    async def slow_render():
+        # The wishlist changes while the old state is being rendered
+        await invalidate_wishlist_cache(7, "tok")
+        return Rendered(7, "stale")
+
+    await get_or_render(share_keys("tok"), slow_render)
+    render, calls = _renderer("fresh")
+    assert (await get_or_render(share_keys("tok"), render)).body == "fresh"
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_render_once(cache):
+    render, calls = _renderer()
+    results = await asyncio.gather(*(get_or_render(share_keys("hot"), render) for _ in range(20)))
+    assert len(calls) == 1
+    assert len(set(results)) == 1
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter(cache):
+    calls = []
+
+    async def missing():
+        calls.append(1)
+        await asyncio.sleep(0)
+        raise LookupError("gone")
+
+    results = await asyncio.gather(
+        *(get_or_render(share_keys("gone"), missing) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(r, LookupError) for r in results)
+    assert len(calls) == 1
+    assert wishlist_cache._inflight == {}
+
+
+@pytest.mark.asyncio
+async def test_redis_down_still_renders(monkeypatch):
+    async def get_redis():
+        raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(wishlist_cache, "get_redis", get_redis)
+    render, calls = _renderer()
+    assert (await get_or_render(share_keys("tok"), render)).owner_id == 7
+    assert len(calls) == 1
+
+
+def test_cached_response_answers_if_none_match():
+    rendered = Rendered(7, '{"id": 1}', '"1-1-4-guest"')
+    assert rendered.response('"1-1-4-guest"').status_code == 304
+    full = rendered.response('"1-1-3-guest"')
+    assert full.status_code == 200
+    assert full.body == b'{"id": 1}'
+    assert full.headers["ETag"] == '"1-1-4-guest"'
+
+
+class _Session:
+    """Answers every query with the same row"""
+
+    def __init__(self, row):
+        self.row = row
+        self.queries = 0
+
+    async def execute(self, query):
+        self.queries += 1
+        return SimpleNamespace(scalar_one_or_none=lambda: self.row, one_or_none=lambda: self.row)
+
+
+def _use_primary(monkeypatch, module, session):
+    @asynccontextmanager
+    async def primary_session():
+        yield session
+
+    monkeypatch.setattr(module, "primary_session", primary_session)
+
+
+def _shared(title: str, version: int) -> WishlistModel:
+    now = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    return WishlistModel(
+        id=1, owner_id=7, title=title, wishlist_type=WishlistTypeEnum.EVENT, visibility=VisibilityEnum.BY_LINK,
+        share_token="tok", is_archived=False, version=version, created_at=now, updated_at=now, items=[],
+    )
+
+
+def _guest_request() -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+
+
+@pytest.mark.asyncio
+async def test_share_page_is_never_cached_from_a_lagging_replica(cache, monkeypatch):
+    # The change is committed and invalidated, but the replica hasn't caught up
+    await invalidate_wishlist_cache(7, "tok")
+    replica = _Session(_shared("old title", 4))
+    _use_primary(monkeypatch, wishlists, _Session(_shared("new title", 5)))
+
+    first = await wishlists.get_wishlist_by_token("tok", _guest_request(), None, replica, None)
+    second = await wishlists.get_wishlist_by_token("tok", _guest_request(), None, replica, None)
+    assert json.loads(first.body)["title"] == json.loads(second.body)["title"] == "new title"
+    assert second.headers["ETag"] == '"1-1-5-guest"'
+
+
+@pytest.mark.asyncio
+async def test_user_lists_are_never_cached_from_a_lagging_replica(cache, monkeypatch):
+    now = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+    def summary(title):
+        return WishlistSummary(
+            id=1, owner_id=7, title=title, wishlist_type="event", visibility="public",
+            share_token="tok", is_archived=False, created_at=now, updated_at=now,
+        )
+
+    async def get_wishlist_summaries(db, *where, owner_view, **paging):
+        return db.summaries
+
+    await invalidate_wishlist_cache(7)
+    replica = _Session(SimpleNamespace(id=7))
+    replica.summaries = [summary("old title")]
+    primary = _Session(None)
+    primary.summaries = [summary("new title")]
+    _use_primary(monkeypatch, users, primary)
+    monkeypatch.setattr(users, "get_wishlist_summaries", get_wishlist_summaries)
+
+    for _ in range(2):
+        response = await users.get_user_wishlists("owner", None, None, None, replica, None)
+        assert [w["title"] for w in json.loads(response.body)] == ["new title"]
+
+
+@pytest.mark.asyncio
+async def test_owner_bypasses_the_guest_cache(cache, monkeypatch):
+    db = _Session(_shared("title", 4))
+    _use_primary(monkeypatch, wishlists, None)  # a guest render would fail
+
+    response = await wishlists.get_wishlist_by_token("tok", _guest_request(), None, db, SimpleNamespace(id=7))
+    assert response.headers["ETag"] == '"1-1-4-owner"'
+    assert db.queries == 2  # head + full load
+    assert await cache.keys("wlcache:share:*") == []
@@ -0,0 +1,68 @@
+"""Wishlist summary query tests"""
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.models.wishlist import VisibilityEnum, Wishlist, WishlistTypeEnum
+from app.services.wishlist_summary import get_wishlist_summaries, summary_query
+
+
+def test_summary_query_aggregates_without_loading_items():
+    sql = str(summary_query(Wishlist.owner_id == 1).compile(dialect=postgresql.dialect()))
+    assert "GROUP BY items.wishlist_id" in sql
+    assert "count(items.id) FILTER (WHERE items.is_reserved IS true)" in sql
+    assert "sum(items.price)" in sql
+    # Only counters come from items, never their columns
+    assert "items.images" not in sql and "items.title" not in sql
+
+
+class _Result:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def mappings(self):
+        return self._rows
+
+
+class _Session:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    async def execute(self, query):
+        self.queries.append(query)
+        return _Result(self.rows)
+
+
+def _row(**overrides):
+    row = {
+        "id": 1, "owner_id": 1, "title": "Birthday", "description": None,
+        "cover_image_url": None, "cover_emoji": None,
+        "wishlist_type": WishlistTypeEnum.PERMANENT, "event_name": None, "event_date": None,
+        "visibility": VisibilityEnum.PUBLIC, "share_token": "t", "is_archived": False,
+        "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc), "updated_at": None,
+        "items_count": 3, "reserved_count": 2, "total_price": Decimal("1500.50"),
+    }
+    row.update(overrides)
+    return row
+
+
+@pytest.mark.asyncio
+async def test_summaries_built_from_rows_in_one_query():
+    db = _Session([_row(), _row(id=2, items_count=0, reserved_count=0, total_price=None)])
+    summaries = await get_wishlist_summaries(db, Wishlist.owner_id == 1, owner_view=False, limit=10)
+    assert len(db.queries) == 1
+    assert [(s.id, s.items_count, s.reserved_count, s.total_price) for s in summaries] == [
+        (1, 3, 2, Decimal("1500.50")),
+        (2, 0, 0, None),
+    ]
+    assert summaries[0].model_dump(mode="json")["total_price"] == 1500.5
+
+
+@pytest.mark.asyncio
+async def test_owner_view_hides_reserved_count():
+    db = _Session([_row()])
+    (summary,) = await get_wishlist_summaries(db, Wishlist.owner_id == 1, owner_view=True)
+    assert summary.items_count == 3 and summary.reserved_count is None
@@ -0,0 +1,95 @@
+"""Wishlist version / ETag tests"""
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy.dialects import postgresql
+from starlette.requests import Request
+
+from app.api.v1.endpoints.wishlists import get_wishlist_by_token
+from app.core.config import settings
+from app.services.wishlist_version import bump_version, etag_matches, make_etag
+
+
+@pytest.fixture(autouse=True)
+def no_response_cache(monkeypatch):
+    # The rendered-response cache is covered in test_wishlist_cache.py
+    monkeypatch.setattr(settings, "WISHLIST_CACHE_TTL_SECONDS", 0)
+
+
+class _Result:
+    def __init__(self, row):
+        self._row = row
+
+    def one_or_none(self):
+        return self._row
+
+    def scalar_one_or_none(self):
+        return None
+
+
+class _Session:
+    def __init__(self, row=None):
+        self.row = row
+        self.queries = []
+
+    async def execute(self, query):
+        self.queries.append(query)
+        return _Result(self.row)
+
+
+def _request(if_none_match=None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_etag_depends_on_version_and_view():
+    assert make_etag(1, 2, owner_view=False) != make_etag(1, 3, owner_view=False)
+    assert make_etag(1, 2, owner_view=False) != make_etag(1, 2, owner_view=True)
+
+
+def test_if_none_match_comparison():
+    etag = make_etag(1, 2, owner_view=False)
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches(make_etag(1, 1, owner_view=False), etag)
+
+
+@pytest.mark.asyncio
+async def test_bump_version_keeps_updated_at():
+    db = _Session()
+    await bump_version(db, 5, 5, None, 7)
+    sql = str(db.queries[0].compile(dialect=postgresql.dialect()))
+    assert "version=(wishlists.version + %(version_1)s)" in sql
+    assert "updated_at=wishlists.updated_at" in sql
+    assert set(db.queries[0].compile().params["id_1"]) == {5, 7}
+
+
+@pytest.mark.asyncio
+async def test_share_page_304_without_loading_items():
+    head = SimpleNamespace(id=1, owner_id=10, version=4, is_archived=False)
+    db = _Session(head)
+    etag = make_etag(1, 4, owner_view=False)
+
+    result = await get_wishlist_by_token("token", _request(etag), Response(), db, None)
+
+    assert result.status_code == 304
+    assert result.headers["ETag"] == etag
+    assert len(db.queries) == 1
+    assert "items" not in str(db.queries[0])
+
+
+@pytest.mark.asyncio
+async def test_owner_etag_does_not_match_guest_view():
+    head = SimpleNamespace(id=1, owner_id=10, version=4, is_archived=False)
+    owner = SimpleNamespace(id=10)
+    db = _Session(head)
+    guest_etag = make_etag(1, 4, owner_view=False)
+
+    # Falls through to the full load (which finds nothing in this fake session)
+    with pytest.raises(HTTPException) as exc:
+        await get_wishlist_by_token("token", _request(guest_etag), Response(), db, owner)
+    assert exc.value.status_code == 404
+    assert len(db.queries) == 2
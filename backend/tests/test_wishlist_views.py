@@ -0,0 +1,78 @@
+"""Owner / guest view serialization tests"""
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from app.models.item import Item as ItemModel, PriorityEnum
+from app.models.wishlist import VisibilityEnum, Wishlist as WishlistModel, WishlistTypeEnum
+from app.schemas.item import Item
+from app.schemas.wishlist import Wishlist
+from app.services.wishlist_views import item_view, render, wishlist_view
+
+_NOW = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+
+
+def _item(**overrides) -> ItemModel:
+    values = dict(
+        id=3, wishlist_id=1, title="Наушники", description=None, url="https://example.com",
+        image_url=None, images=["/uploads/a.jpg"], price=Decimal("12000.00"), currency="₽",
+        target_amount=None, priority=PriorityEnum.HIGH, collected_amount=Decimal("4500.50"),
+        is_reserved=False, is_purchased=False, reserved_by_name="Аня, Петя",
+        contributors=[
+            {"name": "Аня", "amount": 4000, "user_id": 5},
+            {"name": "Петя", "amount": 500.5, "guest_session_id": 9},
+        ],
+        position_order=0, created_at=_NOW, updated_at=None,
+    )
+    values.update(overrides)
+    return ItemModel(**values)
+
+
+def _wishlist(*items) -> WishlistModel:
+    return WishlistModel(
+        id=1, owner_id=2, title="День рождения", description=None, cover_image_url=None,
+        cover_emoji="🎂", wishlist_type=WishlistTypeEnum.EVENT, event_name="ДР",
+        event_date=date(2024, 6, 1), visibility=VisibilityEnum.BY_LINK, share_token="tok",
+        is_archived=False, created_at=_NOW, updated_at=_NOW, items=list(items),
+    )
+
+
+def _schema_json(model) -> dict:
+    return json.loads(model.model_dump_json())
+
+
+def _blanked(item: Item) -> Item:
+    # What handlers used to do for the owner
+    item.is_reserved = False
+    item.reserved_by_name = None
+    item.collected_amount = 0
+    item.contributors = []
+    return item
+
+
+def test_guest_view_matches_item_schema():
+    for item in (_item(), _item(target_amount=Decimal("20000"), contributors=None), _item(price=None)):
+        assert json.loads(render(item_view(item, owner_view=False))) == _schema_json(Item.model_validate(item))
+
+
+def test_owner_view_matches_blanked_item_schema():
+    for item in (_item(), _item(target_amount=Decimal("20000"), is_reserved=True)):
+        expected = _schema_json(_blanked(Item.model_validate(item)))
+        assert json.loads(render(item_view(item, owner_view=True))) == expected
+
+
+def test_wishlist_views_match_schema_byte_for_byte():
+    wishlist = _wishlist(_item(), _item(id=4, is_reserved=True, collected_amount=Decimal("0")))
+    assert render(wishlist_view(wishlist, owner_view=False)) == Wishlist.model_validate(wishlist).model_dump_json()
+
+    owner = Wishlist.model_validate(wishlist)
+    owner.items = [_blanked(item) for item in owner.items]
+    assert render(wishlist_view(wishlist, owner_view=True)) == owner.model_dump_json()
+
+
+def test_contributor_ids_never_leave_the_server():
+    guest = item_view(_item(), owner_view=False)
+    assert guest["contributors"] == [{"name": "Аня", "amount": 4000.0}, {"name": "Петя", "amount": 500.5}]
+    owner = item_view(_item(), owner_view=True)
+    assert owner["contributors"] == [] and owner["reserved_by_name"] is None
+    assert owner["collected_amount"] == 0 and owner["contribution_progress"] is None
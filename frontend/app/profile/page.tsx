@@ -101,7 +101,11 @@ export default function ProfilePage() {
       fetchFriendshipCounts()
       if (message.action === 'updated' && message.status === 'accepted') fetchWishlists()
     }
-    if (message.type === 'wishlist' || message.type === 'wishlist_item') fetchWishlists()
+    if (message.type === 'resync') {
+      fetchFriendRequests()
+      fetchFriendshipCounts()
+    }
+    if (message.type === 'wishlist' || message.type === 'wishlist_item' || message.type === 'resync') fetchWishlists()
   }, [])
 
   useWebSocket(handleWebSocketMessage)
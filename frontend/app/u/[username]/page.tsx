@@ -42,10 +42,10 @@ export default function UserProfilePage() {
   }, [])
 
   const handleWebSocketMessage = useCallback((message: any) => {
-    if (message.type === 'friend_request' && user) {
+    if ((message.type === 'friend_request' || message.type === 'resync') && user) {
       fetchFriendshipStatus(user.id)
     }
-    if (message.type === 'wishlist' && user && message.owner_id === user.id) {
+    if (user && (message.type === 'resync' || (message.type === 'wishlist' && message.owner_id === user.id))) {
       fetchWishlists(user.username)
     }
   }, [user, fetchFriendshipStatus, fetchWishlists])
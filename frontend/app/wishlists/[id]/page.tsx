@@ -40,7 +40,7 @@ export default function WishlistDetailPage() {
 
   // Listen for real-time updates
   const handleWsMessage = useCallback((msg: any) => {
-    if (msg.type === 'wishlist_item' && String(msg.wishlist_id) === wishlistId) {
+    if (msg.type === 'resync' || (msg.type === 'wishlist_item' && String(msg.wishlist_id) === wishlistId)) {
       fetchWishlist()
     }
   }, [wishlistId, fetchWishlist])
@@ -104,14 +104,26 @@ export default function PublicWishlistPage() {
       window.location.protocol === 'https:' ? 'wss:' : 'ws:'
     ) + '//' + window.location.host
     const channel = `share_${token}`
+    let lastSeq: number | null = null // resume from here after a reconnect
 
     function connect() {
       if (!active) return
       try {
-        const ws = new WebSocket(`${wsUrl}/api/v1/ws/${channel}`)
+        const since = lastSeq !== null ? `?since=${lastSeq}` : ''
+        const ws = new WebSocket(`${wsUrl}/api/v1/ws/${channel}${since}`)
         wsRef.current = ws
         ws.onopen = () => { retries = 0 }
-        ws.onmessage = () => { fetchWishlist() }
+        ws.onmessage = (event) => {
+          try {
+            const msg = JSON.parse(event.data)
+            if (msg.type === 'ping') {
+              ws.send(JSON.stringify({ type: 'pong' }))
+              return
+            }
+            if (typeof msg.seq === 'number') lastSeq = msg.seq
+          } catch {}
+          fetchWishlist()
+        }
         ws.onerror = () => {}
         ws.onclose = () => {
           wsRef.current = null
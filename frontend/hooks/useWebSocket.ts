@@ -9,6 +9,7 @@ interface WebSocketMessage {
   from_username?: string
   friendship_id?: number
   wishlist_id?: number
+  seq?: number
 }
 
 export function useWebSocket(onMessage?: (message: WebSocketMessage) => void) {
@@ -18,6 +19,9 @@ export function useWebSocket(onMessage?: (message: WebSocketMessage) => void) {
   const onMessageRef = useRef(onMessage)
   const activeRef = useRef(false) // controls whether reconnect is allowed
   const retriesRef = useRef(0)
+  // Last frame seen; on reconnect the server replays what came after it,
+  // or sends {type: 'resync'} when it no longer can
+  const lastSeqRef = useRef<number | null>(null)
 
   useEffect(() => {
     onMessageRef.current = onMessage
@@ -40,7 +44,8 @@ export function useWebSocket(onMessage?: (message: WebSocketMessage) => void) {
       : `${window.location.protocol === 'https:' ? 'wss:' : 'ws:'}//${window.location.host}/api/v1/ws/${user.id}`
     
     // Add JWT token as query parameter
-    const wsUrl = `${baseWsUrl}?token=${encodeURIComponent(token)}`
+    const since = lastSeqRef.current !== null ? `&since=${lastSeqRef.current}` : ''
+    const wsUrl = `${baseWsUrl}?token=${encodeURIComponent(token)}${since}`
 
     try {
       const ws = new WebSocket(wsUrl)
@@ -53,6 +58,15 @@ export function useWebSocket(onMessage?: (message: WebSocketMessage) => void) {
       ws.onmessage = (event) => {
         try {
           const message = JSON.parse(event.data) as WebSocketMessage
+          if (message.type === 'ping') {
+            // Server heartbeat: answer or the socket is closed as idle
+            ws.send(JSON.stringify({ type: 'pong' }))
+            return
+          }
+          if (typeof message.seq === 'number') {
+            if (message.type !== 'resync' && lastSeqRef.current !== null && message.seq <= lastSeqRef.current) return
+            lastSeqRef.current = message.seq
+          }
           onMessageRef.current?.(message)
         } catch {}
       }
@@ -78,6 +92,7 @@ export function useWebSocket(onMessage?: (message: WebSocketMessage) => void) {
   useEffect(() => {
     activeRef.current = true
     retriesRef.current = 0
+    lastSeqRef.current = null
 
     if (user) {
       connect()
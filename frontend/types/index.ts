@@ -74,6 +74,8 @@ export interface Wishlist {
   owner_id: number;
   items?: Item[];
   items_count?: number;
+  reserved_count?: number | null; // null for the owner
+  total_price?: number | null;
   created_at: string;
   updated_at?: string;
   is_archived?: boolean;